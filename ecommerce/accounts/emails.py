@@ -0,0 +1,186 @@
+import random
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+
+from accounts.models import EmailJob
+
+EMAIL_QUEUE_BATCH_SIZE = getattr(settings, 'EMAIL_QUEUE_BATCH_SIZE', 50)
+EMAIL_QUEUE_MAX_ATTEMPTS = getattr(settings, 'EMAIL_QUEUE_MAX_ATTEMPTS', 5)
+EMAIL_QUEUE_RETRY_DELAY = getattr(settings, 'EMAIL_QUEUE_RETRY_DELAY', 30)
+EMAIL_QUEUE_MAX_RETRY_DELAY = getattr(settings, 'EMAIL_QUEUE_MAX_RETRY_DELAY', 60 * 60)
+# How long a claimed job stays invisible to other workers while it is sent.
+EMAIL_QUEUE_LEASE = getattr(settings, 'EMAIL_QUEUE_LEASE', 10 * 60)
+EMAIL_RENDER_CACHE_SIZE = getattr(settings, 'EMAIL_RENDER_CACHE_SIZE', 256)
+
+# name: (subject format string, plain text template, HTML template)
+EMAIL_TEMPLATES = {
+    'verification': (
+        'Email Verification Code',
+        'emails/verification.txt',
+        'verification_email.html',
+    ),
+    'order_confirmation': (
+        'Your order {order_id}',
+        'emails/order_confirmation.txt',
+        'emails/order_confirmation.html',
+    ),
+}
+
+
+def warm_email_templates():
+    # Compiles every email template into the cached loader up front.
+    for _, text_template, html_template in EMAIL_TEMPLATES.values():
+        get_template(text_template)
+        get_template(html_template)
+
+
+def _render(name, context):
+    subject, text_template, html_template = EMAIL_TEMPLATES[name]
+    return (
+        subject.format(**context),
+        get_template(text_template).render(context),
+        get_template(html_template).render(context),
+    )
+
+
+@lru_cache(maxsize=EMAIL_RENDER_CACHE_SIZE)
+def _render_cached(name, context_items):
+    return _render(name, dict(context_items))
+
+
+def render_email(name, context):
+    # Identical contexts (announcements, bulk notices) render once.
+    try:
+        return _render_cached(name, tuple(sorted(context.items())))
+    except TypeError:
+        return _render(name, context)
+
+
+def queue_email(subject, body, to, html_body='', from_email=None):
+    return EmailJob.objects.create(
+        to=list(to),
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.EMAIL_HOST_USER or '',
+    )
+
+
+def queue_templated_email(name, to, context):
+    subject, body, html_body = render_email(name, context)
+    return queue_email(subject, body, to, html_body=html_body)
+
+
+def queue_templated_emails(name, recipients):
+    # recipients: iterable of (to, context); one INSERT for the whole batch.
+    from_email = settings.EMAIL_HOST_USER or ''
+    jobs = []
+    for to, context in recipients:
+        subject, body, html_body = render_email(name, context)
+        jobs.append(EmailJob(
+            to=list(to), subject=subject, body=body, html_body=html_body, from_email=from_email,
+        ))
+    return EmailJob.objects.bulk_create(jobs, batch_size=500)
+
+
+def send_templated_emails(name, recipients, connection=None, chunk_size=100):
+    # Sends directly over one connection, bypassing the queue.
+    from_email = settings.EMAIL_HOST_USER or None
+    connection = connection or get_connection()
+    sent = 0
+    with connection:
+        chunk = []
+        for to, context in recipients:
+            subject, body, html_body = render_email(name, context)
+            message = EmailMultiAlternatives(subject, body, from_email, list(to), connection=connection)
+            message.attach_alternative(html_body, 'text/html')
+            chunk.append(message)
+            if len(chunk) >= chunk_size:
+                sent += connection.send_messages(chunk) or 0
+                chunk = []
+        if chunk:
+            sent += connection.send_messages(chunk) or 0
+    return sent
+
+
+def retry_delay(attempts):
+    # Exponential backoff with jitter so a relay outage doesn't turn into
+    # every job retrying in the same second.
+    delay = min(EMAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1), EMAIL_QUEUE_MAX_RETRY_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def build_message(job, connection):
+    message = EmailMultiAlternatives(
+        job.subject, job.body, job.from_email or None, job.to, connection=connection,
+    )
+    if job.html_body:
+        message.attach_alternative(job.html_body, 'text/html')
+    return message
+
+
+def _mark_failed(job, exc):
+    job.last_error = f'{type(exc).__name__}: {exc}'
+    if job.attempts >= EMAIL_QUEUE_MAX_ATTEMPTS:
+        job.status = 'Failed'
+    else:
+        job.available_at = timezone.now() + retry_delay(job.attempts)
+
+
+def _claim(batch_size):
+    # A short transaction: SKIP LOCKED keeps workers off each other's rows,
+    # and pushing available_at out by the lease keeps the claimed jobs off
+    # later claims once the locks are gone. A worker that dies mid-batch
+    # leaves its jobs to be retried when the lease runs out.
+    with transaction.atomic():
+        jobs = list(
+            EmailJob.objects.select_for_update(skip_locked=True)
+            .filter(status='Pending', available_at__lte=timezone.now())
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        leased_until = timezone.now() + timedelta(seconds=EMAIL_QUEUE_LEASE)
+        for job in jobs:
+            job.attempts += 1
+            job.available_at = leased_until
+        EmailJob.objects.bulk_update(jobs, ['attempts', 'available_at'])
+    return jobs
+
+
+def send_queued_emails(batch_size=EMAIL_QUEUE_BATCH_SIZE, connection=None):
+    # Claims a batch, then sends it over one SMTP connection outside any
+    # transaction, so a slow relay holds no row locks.
+    jobs = _claim(batch_size)
+    if not jobs:
+        return 0, 0
+
+    connection = connection or get_connection()
+    sent = 0
+    try:
+        connection.open()
+    except Exception as exc:
+        # The relay is unreachable: the whole batch backs off.
+        for job in jobs:
+            _mark_failed(job, exc)
+    else:
+        try:
+            for job in jobs:
+                try:
+                    connection.send_messages([build_message(job, connection)])
+                except Exception as exc:
+                    _mark_failed(job, exc)
+                else:
+                    job.status = 'Sent'
+                    job.sent_at = timezone.now()
+                    sent += 1
+        finally:
+            connection.close()
+
+    with transaction.atomic():
+        EmailJob.objects.bulk_update(jobs, ['status', 'last_error', 'available_at', 'sent_at'])
+    return sent, len(jobs) - sent
@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    ScryptPasswordHasher,
+    make_password,
+    verify_password,
+)
+
+PASSWORD_HASHING_THREADS = getattr(settings, 'PASSWORD_HASHING_THREADS', 4)
+
+
+# The cost parameters come from settings. must_update() compares stored
+# hashes against them, so raising a cost rehashes each user at their next
+# login.
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    work_factor = getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor)
+    block_size = getattr(settings, 'PASSWORD_SCRYPT_BLOCK_SIZE', ScryptPasswordHasher.block_size)
+    parallelism = getattr(settings, 'PASSWORD_SCRYPT_PARALLELISM', ScryptPasswordHasher.parallelism)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    time_cost = getattr(settings, 'PASSWORD_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+    memory_cost = getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+    parallelism = getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+
+# Hashing is CPU-bound and releases the GIL, so async views hand it to a
+# bounded pool instead of blocking the event loop (Django's own
+# acheck_password verifies on the loop).
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASHING_THREADS, thread_name_prefix='password-hashing')
+
+
+async def amake_password(raw_password):
+    return await asyncio.get_running_loop().run_in_executor(_executor, make_password, raw_password)
+
+
+async def acheck_password(user, raw_password):
+    loop = asyncio.get_running_loop()
+    is_correct, must_update = await loop.run_in_executor(_executor, verify_password, raw_password, user.password)
+    if is_correct and must_update:
+        user.password = await amake_password(raw_password)
+        await user.asave(update_fields=['password'])
+    return is_correct
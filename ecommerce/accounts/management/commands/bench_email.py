@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core import mail
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine
+
+from accounts.emails import EMAIL_TEMPLATES, send_templated_emails
+
+
+class Command(BaseCommand):
+    help = 'Measure transactional email messages/sec: per-message render and send vs cached templates over one connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--template', choices=sorted(EMAIL_TEMPLATES), default='verification')
+        parser.add_argument(
+            '--backend', default='django.core.mail.backends.locmem.EmailBackend',
+            help='Email backend to send through; point it at a test SMTP relay to include network cost.',
+        )
+
+    def contexts(self, count):
+        for i in range(count):
+            yield [f'bench{i}@example.com'], {
+                'verification_code': f'{i % 10000:04d}',
+                'first_name': 'Bench',
+                'order_id': f'ORD-BENCH-{i:05d}',
+                'item_count': i % 5 + 1,
+                'total_amount': f'{i % 200}.00',
+            }
+
+    def per_message(self, name, count, backend):
+        # The old path: templates re-read from disk and a new connection for
+        # every message.
+        engine = Engine(dirs=settings.TEMPLATES[0]['DIRS'], loaders=['django.template.loaders.filesystem.Loader'])
+        subject, text_template, html_template = EMAIL_TEMPLATES[name]
+        for to, context in self.contexts(count):
+            send_mail(
+                subject.format(**context),
+                engine.get_template(text_template).render(Context(context)),
+                settings.EMAIL_HOST_USER or None,
+                to,
+                html_message=engine.get_template(html_template).render(Context(context)),
+                connection=get_connection(backend),
+            )
+        return count
+
+    def batched(self, name, count, backend):
+        return send_templated_emails(name, self.contexts(count), connection=get_connection(backend))
+
+    def handle(self, *args, **options):
+        for label, run in (('per-message', self.per_message), ('cached+batched', self.batched)):
+            mail.outbox = []
+            start = time.perf_counter()
+            sent = run(options['template'], options['messages'], options['backend'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'{label:>15}: {sent} messages in {elapsed:.2f}s, {sent / elapsed:.0f} messages/sec')
+        mail.outbox = []
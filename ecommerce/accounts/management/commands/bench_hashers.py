@@ -0,0 +1,49 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, get_hashers, make_password, verify_password
+from django.core.management.base import BaseCommand
+
+PASSWORD = 'correct horse battery staple'
+
+
+def _logins(algorithm, encoded, seconds):
+    # Runs verify_password, which is what a login costs, for `seconds`.
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        verify_password(PASSWORD, encoded, preferred=algorithm)
+        count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = 'Measure logins/sec per core for each configured password hasher.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=3.0)
+        parser.add_argument('--processes', type=int, default=1, help='Also run this many processes in parallel.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Preferred hasher: {settings.PASSWORD_HASHERS[0]}')
+        for hasher in get_hashers():
+            try:
+                encoded = make_password(PASSWORD, hasher=hasher.algorithm)
+            except ValueError as exc:
+                self.stdout.write(f'{hasher.algorithm:>14}: skipped ({exc})')
+                continue
+
+            count = _logins(hasher.algorithm, encoded, options['seconds'])
+            line = f'{hasher.algorithm:>14}: {count / options["seconds"]:.1f} logins/sec per core'
+
+            if options['processes'] > 1:
+                with ProcessPoolExecutor(options['processes']) as pool:
+                    futures = [
+                        pool.submit(_logins, hasher.algorithm, encoded, options['seconds'])
+                        for _ in range(options['processes'])
+                    ]
+                    total = sum(future.result() for future in futures)
+                line += f', {total / options["seconds"]:.1f} logins/sec across {options["processes"]} processes'
+
+            self.stdout.write(line)
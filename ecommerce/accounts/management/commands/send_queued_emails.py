@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.emails import EMAIL_QUEUE_BATCH_SIZE, send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails in batches, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EMAIL_QUEUE_BATCH_SIZE)
+        parser.add_argument(
+            '--interval', type=float,
+            help='Keep running and poll the queue every INTERVAL seconds instead of draining it once.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = send_queued_emails(batch_size=options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < options['batch_size']:
+                    break
+            if total_sent or total_failed or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} failed.'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
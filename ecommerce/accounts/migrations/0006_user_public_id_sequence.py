@@ -0,0 +1,28 @@
+from django.db import migrations
+
+SEQUENCES = ('accounts_user_public_id_seq',)
+
+
+def create_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sequence in SEQUENCES:
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {sequence}')
+
+
+def drop_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sequence in SEQUENCES:
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {sequence}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_user_last_login_alter_user_user_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequences, drop_sequences),
+    ]
@@ -1,6 +1,9 @@
-import random
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.db import transaction
+from ecommerce.authentication import invalidate_principal
+from ecommerce.ids import next_id
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -37,15 +40,44 @@ class User(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = ['first_name', 'last_name', 'phone_number']
 
     def generate_unique_id(self):
-        while True:
-            user_id = random.randint(10000000, 99999999)
-            if not User.objects.filter(user_id=user_id).exists():
-                return user_id
+        return next_id('user')
 
     def save(self, *args, **kwargs):
         if not self.user_id:
             self.user_id = self.generate_unique_id()
         super(User, self).save(*args, **kwargs)
+        user_id = self.user_id
+        transaction.on_commit(lambda: invalidate_principal(user_id))
+
+    def delete(self, *args, **kwargs):
+        user_id = self.user_id
+        result = super(User, self).delete(*args, **kwargs)
+        transaction.on_commit(lambda: invalidate_principal(user_id))
+        return result
 
     def __str__(self):
         return self.email
+
+
+class EmailJob(models.Model):
+    STATUS_CHOICES = [('Pending', 'Pending'), ('Sent', 'Sent'), ('Failed', 'Failed')]
+
+    to = models.JSONField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='emailjob_status_available'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {", ".join(self.to)} ({self.status})'
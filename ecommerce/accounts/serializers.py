@@ -9,12 +9,8 @@ class RegisterUserSerializer(serializers.ModelSerializer):
         fields = ['user_id', 'email', 'first_name', 'last_name', 'phone_number', 'password']
 
     def create(self, validated_data):
-        password = validated_data.pop('password', None)
-        user = User.objects.create(**validated_data)
-        if password:
-            user.set_password(password)
-            user.save()
-        return user
+        # Hashed before the row is written, so registration is one INSERT.
+        return User.objects.create_user(**validated_data)
 
 
 class LoginUserSerializer(serializers.Serializer):
@@ -1,3 +1,245 @@
-from django.test import TestCase
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import cache
+from django.test import AsyncRequestFactory
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts import emails
+from accounts.emails import EMAIL_QUEUE_MAX_ATTEMPTS, send_queued_emails, send_templated_emails
+from accounts.hashers import acheck_password
+from accounts.models import EmailJob, User
+from accounts.views import VERIFICATION_CODE_MAX_ATTEMPTS, AsyncLoginUserAPIView
+from ecommerce.throttling import parse_rate
+
+
+class EmailQueueTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(
+            email='shopper@example.com',
+            password='secret-pass-123',
+            first_name='Shop',
+            last_name='Per',
+            phone_number='5550001',
+        )
+
+    def test_verification_email_is_queued_not_sent(self):
+        response = self.client.post(reverse('email-verify'), {'email': 'shopper@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailJob.objects.get().status, 'Pending')
+
+        self.assertEqual(send_queued_emails(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['shopper@example.com'])
+        self.assertEqual(EmailJob.objects.get().status, 'Sent')
+
+    def test_failed_delivery_backs_off_then_gives_up(self):
+        self.client.post(reverse('email-verify'), {'email': 'shopper@example.com'})
+        job = EmailJob.objects.get()
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=SMTPException('relay down')):
+            self.assertEqual(send_queued_emails(), (0, 1))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('Pending', 1))
+            self.assertGreater(job.available_at, job.created_at)
+            self.assertEqual(send_queued_emails(), (0, 0))
+
+            for _ in range(EMAIL_QUEUE_MAX_ATTEMPTS - 1):
+                EmailJob.objects.update(available_at=job.created_at)
+                send_queued_emails()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('Failed', EMAIL_QUEUE_MAX_ATTEMPTS))
+
+
+    def test_jobs_are_leased_while_they_are_sent(self):
+        self.client.post(reverse('email-verify'), {'email': 'shopper@example.com'})
+        seen = []
+
+        def send_messages(messages):
+            # Another worker finds nothing to claim while this one sends.
+            job = EmailJob.objects.get()
+            seen.append((job.attempts, job.available_at > timezone.now(), send_queued_emails()))
+            return 1
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=send_messages):
+            self.assertEqual(send_queued_emails(), (1, 0))
+        self.assertEqual(seen, [(1, True, (0, 0))])
+        self.assertEqual(EmailJob.objects.get().status, 'Sent')
+
+    def test_expired_lease_is_claimed_again(self):
+        self.client.post(reverse('email-verify'), {'email': 'shopper@example.com'})
+        with mock.patch('accounts.emails.EMAIL_QUEUE_LEASE', 0):
+            # The worker died after claiming the job.
+            emails._claim(10)
+        self.assertEqual(send_queued_emails(), (1, 0))
+        self.assertEqual(EmailJob.objects.get().attempts, 2)
+
+
+class TemplatedEmailTests(APITestCase):
+    def test_bulk_send_uses_one_connection(self):
+        recipients = [
+            ([f'buyer{i}@example.com'], {
+                'first_name': 'O\'Neil',
+                'order_id': f'ORD-{i}',
+                'item_count': 2,
+                'total_amount': '30.00',
+            })
+            for i in range(5)
+        ]
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as opened:
+            self.assertEqual(send_templated_emails('order_confirmation', recipients), 5)
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(mail.outbox[3].subject, 'Your order ORD-3')
+        self.assertIn("O'Neil", mail.outbox[3].body)
+        self.assertIn('O&#x27;Neil', mail.outbox[3].alternatives[0][0])
+
+
+class CachedPrincipalTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='shopper@example.com',
+            password='secret-pass-123',
+            first_name='Shop',
+            last_name='Per',
+            phone_number='5550001',
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_authenticated_reads_skip_the_user_lookup(self):
+        self.client.get(reverse('all-categories'))
+        # A warm catalog read is served from the cache: no User query.
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('all-categories'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_saving_the_user_invalidates_the_principal(self):
+        self.assertEqual(self.client.get(reverse('all-categories')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get(reverse('all-categories')).status_code, 401)
+
+
+class PasswordHashingTests(APITestCase):
+    def register(self):
+        return self.client.post(reverse('register'), {
+            'email': 'shopper@example.com',
+            'password': 'secret-pass-123',
+            'first_name': 'Shop',
+            'last_name': 'Per',
+            'phone_number': '5550001',
+        })
+
+    def test_registration_is_a_single_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.register()
+        self.assertEqual(response.status_code, 201)
+        writes = [query['sql'] for query in queries if not query['sql'].startswith('SELECT')]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT'))
+        self.assertTrue(User.objects.get().password.startswith('scrypt$'))
+
+    def test_login_upgrades_legacy_hashes(self):
+        self.register()
+        User.objects.update(password=make_password('secret-pass-123', hasher='pbkdf2_sha256'))
+
+        response = self.client.post(reverse('login'), {'email': 'shopper@example.com', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.get().password.startswith('scrypt$'))
+
+    def async_login(self, email, password):
+        request = AsyncRequestFactory().post(
+            '/', {'email': email, 'password': password}, content_type='application/json',
+        )
+        response = async_to_sync(AsyncLoginUserAPIView.as_view())(request)
+        return response.render()
+
+    def test_async_login(self):
+        cache.clear()
+        self.register()
+        User.objects.update(password=make_password('secret-pass-123', hasher='pbkdf2_sha256'))
+
+        response = self.async_login('shopper@example.com', 'secret-pass-123')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+        self.assertTrue(User.objects.get().password.startswith('scrypt$'))
+
+        self.assertEqual(self.async_login('shopper@example.com', 'wrong-pass').status_code, 401)
+        self.assertEqual(self.async_login('nobody@example.com', 'secret-pass-123').status_code, 401)
+
+    def test_async_check_runs_off_the_loop(self):
+        self.register()
+        user = User.objects.get()
+        self.assertTrue(async_to_sync(acheck_password)(user, 'secret-pass-123'))
+        self.assertFalse(async_to_sync(acheck_password)(user, 'wrong-pass'))
+
+
+class RateLimitTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='shopper@example.com',
+            password='secret-pass-123',
+            first_name='Shop',
+            last_name='Per',
+            phone_number='5550001',
+        )
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('5/m'), (5, 60))
+        self.assertEqual(parse_rate('100/hour'), (100, 3600))
+
+    def test_login_is_throttled_per_email_before_touching_the_database(self):
+        with mock.patch.dict('ecommerce.throttling.RATE_LIMITS', {'login': {'ip': '100/m', 'email': '2/m'}}):
+            for _ in range(2):
+                response = self.client.post(reverse('login'), {'email': 'Shopper@example.com', 'password': 'wrong'})
+                self.assertEqual(response.status_code, 401)
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('login'), {'email': 'shopper@example.com', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            self.assertEqual(len(queries), 0)
+
+            # Another account from the same client is still allowed.
+            response = self.client.post(reverse('login'), {'email': 'other@example.com', 'password': 'wrong'})
+            self.assertNotEqual(response.status_code, 429)
+
+            self.client.force_authenticate(User.objects.create_superuser(
+                email='admin@example.com', password='admin-pass-123', phone_number='5550002',
+            ))
+            response = self.client.get(reverse('rate-limits'), {'scope': 'login', 'email': 'shopper@example.com'})
+            self.assertEqual(response.json()['data']['rate_limits']['email']['count'], 3)
+
+    def test_forwarded_for_header_does_not_reset_the_ip_limit(self):
+        with mock.patch.dict('ecommerce.throttling.RATE_LIMITS', {'login': {'ip': '2/m'}}):
+            statuses = [
+                self.client.post(
+                    reverse('login'), {'email': f'user{i}@example.com', 'password': 'wrong'},
+                    HTTP_X_FORWARDED_FOR=f'203.0.113.{i}',
+                ).status_code
+                for i in range(3)
+            ]
+        self.assertEqual(statuses, [401, 401, 429])
+
+    def test_verification_code_is_burned_after_too_many_attempts(self):
+        cache.set('shopper@example.com', '1234', timeout=300)
+        for _ in range(VERIFICATION_CODE_MAX_ATTEMPTS):
+            response = self.client.post(reverse('code-verify'), {'email': 'shopper@example.com', 'code': '0000'})
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(reverse('code-verify'), {'email': 'shopper@example.com', 'code': '1234'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(cache.get('shopper@example.com'))
@@ -5,12 +5,56 @@ from accounts.serializers import *
 from ecommerce.renderers import CustomRenderer
 from rest_framework_simplejwt.tokens import RefreshToken
 from accounts.models import User
-from django.contrib.auth.hashers import check_password
+from django.contrib.auth.hashers import make_password
 from django.utils.crypto import get_random_string
-from django.template.loader import render_to_string
-from django.core.mail import send_mail
-from django.conf import settings
+from accounts.emails import queue_templated_email
 from django.core.cache import cache
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from rest_framework.permissions import IsAdminUser
+from ecommerce.throttling import RATE_LIMITS, SlidingWindowThrottle, get_counters
+from ecommerce.views import AsyncAPIView
+from accounts.hashers import acheck_password, amake_password
+
+VERIFICATION_CODE_MAX_ATTEMPTS = getattr(settings, 'VERIFICATION_CODE_MAX_ATTEMPTS', 5)
+
+
+def verification_attempts_key(email):
+    return f'verification-attempts:{email}'
+
+
+def count_failed_attempt(email):
+    key = verification_attempts_key(email)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=300)
+        return cache.incr(key)
+
+def invalid_login_response():
+    return Response(
+        {
+            "errors": {
+                "error": "Invalid email or password.",
+                "status_code": status.HTTP_401_UNAUTHORIZED,
+            }
+        },
+        status=status.HTTP_401_UNAUTHORIZED,
+    )
+
+
+def login_response(user):
+    # Generate JWT tokens
+    refresh = RefreshToken.for_user(user)
+    return Response(
+        {
+            "message": "Login successful.",
+            "access": str(refresh.access_token),
+            "status_code": status.HTTP_200_OK,
+        },
+        status=status.HTTP_200_OK,
+    )
+
 
 class RegisterUserAPIView(APIView):
     renderer_classes = [CustomRenderer]
@@ -42,6 +86,8 @@ class RegisterUserAPIView(APIView):
 
 class LoginUserAPIView(APIView):
     renderer_classes = [CustomRenderer]
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'login'
 
     def post(self, request):
         serializer = LoginUserSerializer(data=request.data)
@@ -52,38 +98,15 @@ class LoginUserAPIView(APIView):
             try:
                 user = User.objects.get(email=email)
             except User.DoesNotExist:
-                return Response(
-                    {
-                        "errors": {
-                            "error": "Invalid email or password.",
-                            "status_code": status.HTTP_401_UNAUTHORIZED,
-                        }
-                    },
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
+                # Hash anyway so unknown emails take as long as wrong passwords.
+                make_password(password)
+                return invalid_login_response()
             
-            # Manually check the password
-            if not check_password(password, user.password):
-                return Response(
-                    {
-                        "errors": {
-                            "error": "Invalid email or password.",
-                            "status_code": status.HTTP_401_UNAUTHORIZED,
-                        }
-                    },
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
+            # Upgrades the stored hash when the hasher or its cost changed.
+            if not user.check_password(password):
+                return invalid_login_response()
             
-            # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
-            return Response(
-                {
-                    "message": "Login successful.",
-                    "access": str(refresh.access_token),
-                    "status_code": status.HTTP_200_OK,
-                },
-                status=status.HTTP_200_OK,
-            )
+            return login_response(user)
         
         return Response(
             {
@@ -92,16 +115,42 @@ class LoginUserAPIView(APIView):
             },
             status=status.HTTP_400_BAD_REQUEST,
         )
+
+
+class AsyncLoginUserAPIView(AsyncAPIView, LoginUserAPIView):
+    async def post(self, request):
+        serializer = LoginUserSerializer(data=request.data)
+        if serializer.is_valid():
+            email = serializer.validated_data['email']
+            password = serializer.validated_data['password']
+
+            try:
+                user = await User.objects.aget(email=email)
+            except User.DoesNotExist:
+                await amake_password(password)
+                return invalid_login_response()
+
+            if not await acheck_password(user, password):
+                return invalid_login_response()
+
+            return login_response(user)
+
+        return Response(
+            {
+                "errors": serializer.errors,
+                "status_code": status.HTTP_400_BAD_REQUEST,
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
     
 
 class EmailVerifyCodeView(APIView):
     renderer_classes = [CustomRenderer]
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'email-verify'
 
     def send_verification_email(self, email, verification_code):
-        subject = 'Email Verification Code'
-        plain_message = f'Your verification code is: {verification_code}'
-        html_message = render_to_string('verification_email.html', {'verification_code': verification_code})
-        send_mail(subject, plain_message, settings.EMAIL_HOST_USER, [email], html_message=html_message)
+        queue_templated_email('verification', [email], {'verification_code': verification_code})
 
     def post(self, request, format=None):
         serializer = EmailVerifyCodeSerializer(data=request.data)
@@ -111,6 +160,7 @@ class EmailVerifyCodeView(APIView):
             if User.objects.filter(email=email).exists():
                 verification_code = get_random_string(length=4, allowed_chars='1234567890')
                 cache.set(email, verification_code, timeout=300)  # Store in cache for 5 minutes
+                cache.delete(verification_attempts_key(email))
                 self.send_verification_email(email, verification_code)  # Custom function to send email
                 return Response(
                     {
@@ -140,13 +190,16 @@ class EmailVerifyCodeView(APIView):
 
 class VerifyCodeView(APIView):
     renderer_classes = [CustomRenderer]
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'code-verify'
     def post(self, request, format=None):
         serializer = VerificationCodeSerializer(data=request.data)
         if serializer.is_valid():
             email = serializer.validated_data['email']
             verification_code = serializer.validated_data['code']
             stored_code = cache.get(email)
-            if stored_code and stored_code == verification_code:
+            if stored_code and constant_time_compare(stored_code, verification_code):
+                cache.delete(verification_attempts_key(email))
                 # Code is valid, allow the user to reset password
                 return Response(
                     {
@@ -156,6 +209,10 @@ class VerifyCodeView(APIView):
                     status=status.HTTP_200_OK,
                 )
             else:
+                if stored_code and count_failed_attempt(email) >= VERIFICATION_CODE_MAX_ATTEMPTS:
+                    # Four digits are easy to enumerate: burn the code so a
+                    # new one has to be requested.
+                    cache.delete_many([email, verification_attempts_key(email)])
                 return Response(
                 {
                     "errors": {
@@ -221,3 +278,34 @@ class ForgotPasswordResetAPIView(APIView):
         )
 
 
+
+
+class RateLimitAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    renderer_classes = [CustomRenderer]
+
+    def get(self, request):
+        scope = request.query_params.get('scope')
+        if scope not in RATE_LIMITS:
+            return Response(
+                {
+                    "errors": {
+                        "scope": f"Scope must be one of {', '.join(RATE_LIMITS)}.",
+                        "status_code": status.HTTP_400_BAD_REQUEST,
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                "rate_limits": get_counters(
+                    scope,
+                    ip=request.query_params.get('ip'),
+                    email=request.query_params.get('email'),
+                ),
+                "message": "Rate limit counters retrieved successfully.",
+                "status_code": status.HTTP_200_OK,
+            },
+            status=status.HTTP_200_OK,
+        )
@@ -0,0 +1,106 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+AUTH_PRINCIPAL_TIMEOUT = getattr(settings, 'AUTH_PRINCIPAL_TIMEOUT', 60)
+
+PRINCIPAL_FIELDS = ('pk', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _principal_key(user_id):
+    return f'auth:principal:{user_id}'
+
+
+def invalidate_principal(user_id):
+    cache.delete(_principal_key(user_id))
+
+
+class LazyPrincipal(SimpleLazyObject):
+    # Answers the attributes most views need (ids, active/staff flags) from
+    # the cached status and only loads the User row when anything else is
+    # read.
+    def __init__(self, user_id, status):
+        pk = status['pk']
+        super().__init__(lambda: get_user_model().objects.get(pk=pk))
+        self.__dict__.update(status)
+        self.__dict__['id'] = pk
+        self.__dict__[api_settings.USER_ID_FIELD] = user_id
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def __bool__(self):
+        return True
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Revocation compares against the password hash, which needs the row.
+            return super().get_user(validated_token)
+
+        user_id = self._user_id(validated_token)
+        key = _principal_key(user_id)
+        status = cache.get(key)
+        if status is None:
+            status = self._principals(user_id).first()
+            if status is not None:
+                cache.set(key, status, timeout=AUTH_PRINCIPAL_TIMEOUT)
+
+        return self._principal(user_id, status)
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return await sync_to_async(super().get_user)(validated_token)
+
+        user_id = self._user_id(validated_token)
+        key = _principal_key(user_id)
+        status = await cache.aget(key)
+        if status is None:
+            status = await self._principals(user_id).afirst()
+            if status is not None:
+                await cache.aset(key, status, timeout=AUTH_PRINCIPAL_TIMEOUT)
+
+        return self._principal(user_id, status)
+
+    def _user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def _principals(self, user_id):
+        return get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(*PRINCIPAL_FIELDS)
+
+    def _principal(self, user_id, status):
+        if status is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if not status['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return LazyPrincipal(user_id, status)
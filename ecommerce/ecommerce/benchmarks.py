@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+# Writes during a benchmark only bump generations in this private cache.
+BENCHMARK_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'},
+    'carts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-carts'},
+}
+
+
+@contextmanager
+def throwaway_database(verbosity=0):
+    # Benchmarks that write from several connections cannot be rolled back
+    # as one transaction, so they run against a freshly migrated test
+    # database that is dropped afterwards. The configured database keeps its
+    # rows, facet counts, slug counters and sequence values.
+    with override_settings(CACHES=BENCHMARK_CACHES):
+        old_config = setup_databases(verbosity, interactive=False, aliases={'default'})
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity)
@@ -0,0 +1,143 @@
+import os
+import random
+import threading
+from collections import deque
+from datetime import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+ID_BLOCK_SIZE = getattr(settings, 'ID_BLOCK_SIZE', 100)
+
+# Each scope maps a sequence number onto its public id space with an affine
+# permutation (value * multiplier mod space). The multiplier is coprime with
+# the space, so distinct sequence numbers give distinct ids.
+SCOPES = {
+    'product': {
+        'sequence': 'shop_product_public_id_seq',
+        'model': 'shop.Product',
+        'field': 'product_id',
+        'space': 90_000_000,
+        'multiplier': 61_803_397,
+    },
+    'user': {
+        'sequence': 'accounts_user_public_id_seq',
+        'model': 'accounts.User',
+        'field': 'user_id',
+        'space': 90_000_000,
+        'multiplier': 61_803_397,
+    },
+    'order': {
+        'sequence': 'shop_order_public_id_seq',
+        'model': 'shop.Order',
+        'field': 'order_id',
+        # Five digits per day, unique for up to 100k orders a day.
+        'space': 100_000,
+        'multiplier': 61_807,
+    },
+}
+
+
+def format_id(scope, value, day=None):
+    if scope == 'order':
+        day = day or datetime.now().date()
+        return f'ORD-{day.strftime("%Y%m%d")}-{value:05d}'
+    return str(10_000_000 + value)
+
+
+def _taken(scope, ids):
+    config = SCOPES[scope]
+    model = apps.get_model(config['model'])
+    field = config['field']
+    return set(model.objects.filter(**{f'{field}__in': ids}).values_list(field, flat=True))
+
+
+class RandomIdAllocator:
+    # Draws random ids and checks them in one lookup per round; used where
+    # the database has no sequences.
+    def allocate(self, scope, count=1):
+        space = SCOPES[scope]['space']
+        issued = set()
+        while len(issued) < count:
+            candidates = {format_id(scope, random.randrange(space)) for _ in range(count - len(issued))}
+            candidates -= issued
+            issued |= candidates - _taken(scope, candidates)
+        return list(issued)
+
+    def prefetch(self, scope, count):
+        # Random ids are checked as they are drawn; there is nothing to lease.
+        pass
+
+
+class SequenceIdAllocator:
+    # Leases blocks of Postgres sequence values per process, so most saves
+    # get their id without a query. nextval() is atomic and never reissues a
+    # value, which keeps concurrent writers apart without retries.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blocks = {}
+        self.pid = os.getpid()
+        self.fallback = RandomIdAllocator()
+
+    def allocate(self, scope, count=1):
+        if connection.vendor != 'postgresql':
+            return self.fallback.allocate(scope, count)
+
+        with self.lock:
+            block = self._fill(scope, count)
+            return [block.popleft() for _ in range(count)]
+
+    def prefetch(self, scope, count):
+        # Leases ahead so the next `count` ids of the scope need no query.
+        if connection.vendor == 'postgresql':
+            with self.lock:
+                self._fill(scope, count)
+
+    def _fill(self, scope, count):
+        if self.pid != os.getpid():
+            # Forked workers must not reuse the parent's leased blocks.
+            self.blocks = {}
+            self.pid = os.getpid()
+
+        # Order ids carry the day they are issued on, so each day gets its
+        # own block and whatever is left of an earlier day's is dropped.
+        day = datetime.now().date() if scope == 'order' else None
+        if (scope, day) not in self.blocks:
+            for key in [key for key in self.blocks if key[0] == scope]:
+                del self.blocks[key]
+        block = self.blocks.setdefault((scope, day), deque())
+        while len(block) < count:
+            block.extend(self.lease(scope, max(ID_BLOCK_SIZE, count - len(block)), day))
+        return block
+
+    def lease(self, scope, size, day=None):
+        config = SCOPES[scope]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [config['sequence'], size])
+            values = [(row[0] * config['multiplier']) % config['space'] for row in cursor.fetchall()]
+
+        # Ids issued before the sequences existed were random, so drop any
+        # id an older row already holds. One lookup per leased block.
+        formatted = [format_id(scope, value, day) for value in values]
+        taken = _taken(scope, formatted)
+        return [public_id for public_id in formatted if public_id not in taken]
+
+
+_allocator = None
+
+
+def get_allocator():
+    global _allocator
+    if _allocator is None:
+        _allocator = import_string(getattr(settings, 'ID_ALLOCATOR', 'ecommerce.ids.SequenceIdAllocator'))()
+    return _allocator
+
+
+def allocate_ids(scope, count):
+    return get_allocator().allocate(scope, count)
+
+
+def next_id(scope):
+    return allocate_ids(scope, 1)[0]
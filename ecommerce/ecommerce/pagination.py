@@ -0,0 +1,29 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CatalogPagination(PageNumberPagination):
+    page_size = 20
+
+
+class KeysetPagination(CursorPagination):
+    # Seeks on (created_at, id) instead of COUNT(*) + OFFSET, backed by the
+    # (deleted, created_at, id) indexes on the catalog tables.
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('created_at', 'id')
+
+
+class OrderHistoryPagination(CursorPagination):
+    # Newest first, served by the (user, -created_at, -id) order index.
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+def get_paginator(request):
+    if request.query_params.get('pagination') == 'cursor':
+        return KeysetPagination()
+
+    return CatalogPagination()
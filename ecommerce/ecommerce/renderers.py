@@ -1,97 +1,110 @@
 from rest_framework import renderers
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.utils.encoders import JSONEncoder
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    # Decimal, lazy strings, UUIDs etc. fall back to DRF's encoder.
+    if orjson is not None:
+        return orjson.dumps(data, default=_encoder.default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode('utf-8')
+
+
+def _error_codes(errors, codes):
+    if isinstance(errors, ErrorDetail):
+        codes.add(errors.code)
+    elif isinstance(errors, dict):
+        for value in errors.values():
+            _error_codes(value, codes)
+    elif isinstance(errors, (list, tuple)):
+        for value in errors:
+            _error_codes(value, codes)
+    return codes
+
+
+def _is_message_code(code):
+    return 'unique' in code or 'invalid' in code
+
+
 class CustomRenderer(renderers.JSONRenderer):
     charset = 'utf-8'
-    
+
     def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if not isinstance(data, dict):
+            return dumps({
+                'status': True,
+                'message': 'Request was successful.',
+                'status_code': 200,
+                'data': data,
+            })
+
+        status_code = data.pop('status_code', None)
+        response = {
+            'status': True,
+            'message': data.pop('message', 'Request was successful.'),
+            'status_code': 200 if status_code is None else status_code,
+            'data': data,
+        }
+
+        # Success responses carry neither key and skip classification.
+        if 'errors' in data:
+            response.update(self.render_errors(data['errors'], 400 if status_code is None else status_code))
+        elif 'detail' in data:
+            response.update(self.render_detail(data, renderer_context))
+
+        return dumps(response)
+
+    def render_errors(self, errors, status_code):
+        codes = _error_codes(errors, set())
+
+        if not codes:
+            # Errors built by hand in the views carry their own status code.
+            errors = dict(errors)
+            status_code = errors.pop('status_code', None)
+            error_details = errors
+        elif any(_is_message_code(code) for code in codes):
+            error_details = {}
+            for field, field_errors in errors.items():
+                if isinstance(field_errors, list) and field_errors:
+                    error_details[field] = f"{field_errors[0]}"
+                else:
+                    error_details[field] = f"{str(field_errors)}"
+        else:
+            error_details = {
+                field: f"{field.replace('_', ' ').capitalize()} is required."
+                for field in errors
+            }
+
+        return {
+            'status': False,
+            'status_code': status_code,
+            'message': 'An error occurred',
+            'errors': error_details,
+            'data': None,
+        }
 
-        response = {}
-        print(data)
-
-        response['status'] = True
-        response['message'] = data.get('message', 'Request was successful.')
-        response['status_code'] = data.get('status_code', 200)
-        for key in ['message', 'status_code']:
-            data.pop(key, None)
-        response['data'] = data
-        
-        if isinstance(data, dict):
-            if 'errors' in data and 'ErrorDetail' not in str(data):
-                response['status'] = False
-                response['status_code'] = data['errors'].get('status_code')
-                response['message'] = 'An error occurred'
-                errors = data['errors'].copy() 
-                if 'status_code' in errors:
-                    del errors['status_code']
-                
-                response['errors'] = errors
-                response['data'] = None
-
-    
-            elif 'errors' in data and 'ErrorDetail' in str(data) and 'invalid' not in str(data) and 'unique' not in str(data):
-                response['status'] = False
-                response['status_code'] = data.get('status_code', 400)
-                response['message'] = 'An error occurred'
-                error_details = {}
-                for field, errors in data['errors'].items():
-                    if isinstance(errors, list) and errors:
-                        error_details[field] = f"{field.replace('_', ' ').capitalize()} is required."
-                    else:
-                        error_details[field] = f"{field.replace('_', ' ').capitalize()} is required."
-                    
-                response['errors'] = error_details
-                response['data'] = None
-
-            elif 'errors' in data and 'ErrorDetail' in str(data) and 'unique' in str(data):
-                response['status'] = False
-                response['status_code'] = data.get('status_code', 400)
-                response['message'] = 'An error occurred'
-                error_details = {}
-                for field, errors in data['errors'].items():
-                    if isinstance(errors, list) and errors:
-                        error_details[field] = f"{errors[0]}"
-                    else:
-                        error_details[field] = f"{str(errors)}"
-
-                response['errors'] = error_details
-                response['data'] = None
-            
-            elif 'errors' in data and 'ErrorDetail' in str(data) and 'invalid' in str(data):
-                response['status'] = False
-                response['status_code'] = data.get('status_code', 400)
-                response['message'] = 'An error occurred'
-                error_details = {}
-                for field, errors in data['errors'].items():
-                    if isinstance(errors, list) and errors:
-                        error_details[field] = f"{errors[0]}"
-                    else:
-                        error_details[field] = f"{str(errors)}"
-
-                response['errors'] = error_details
-                response['data'] = None
-
-            elif 'detail' in data and 'Authentication' in str(data):
-                response['status'] = False
-                response['message'] = 'A detailed error occurred.'
-                response['status_code'] = data.get('status_code', 401)
-                response['data'] = None
-                response['errors'] = data.get('detail', 'A detailed error occurred.')
-            
-            elif 'detail' in data and 'Authorization' in str(data):
-                response['status'] = False
-                response['message'] = 'A detailed error occurred.'
-                response['status_code'] = data.get('status_code', 401)
-                response['data'] = None
-                response['errors'] = data.get('detail', 'A detailed error occurred.')
-            
-            elif 'detail' in data and 'ErrorDetail' in str(data) and 'authentication_failed' in str(data):
-                response['status'] = False
-                response['message'] = 'A detailed error occurred.'
-                response['status_code'] = data.get('status_code', 404)
-                response['data'] = None
-                response['errors'] = data.get('detail', 'A detailed error occurred.')
-
-        
-        return json.dumps(response, ensure_ascii=False)
+    def render_detail(self, data, renderer_context):
+        response = renderer_context.get('response') if renderer_context else None
+        status_code = response.status_code if response is not None else 401
+        if status_code < 400 or not _error_codes(data['detail'], set()):
+            return {}
 
+        return {
+            'status': False,
+            'message': 'A detailed error occurred.',
+            'status_code': status_code,
+            'errors': data['detail'],
+            'data': None,
+        }
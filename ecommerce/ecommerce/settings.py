@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
@@ -66,8 +67,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates are compiled once per process (and warmed when the
+            # accounts app loads) instead of re-read from disk per render.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -97,6 +105,41 @@ DATABASES = {
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# Serve the catalog listings and login from native async views. Only worth
+# it behind ecommerce.asgi; under WSGI every request would start an event
+# loop.
+
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+# Password hashing
+# PASSWORD_HASHER picks the hasher for new and upgraded hashes (argon2 needs
+# argon2-cffi); the others stay listed so existing hashes still verify and
+# are rehashed at the next login.
+
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'scrypt')
+
+PASSWORD_SCRYPT_WORK_FACTOR = 2 ** 14
+PASSWORD_SCRYPT_BLOCK_SIZE = 8
+PASSWORD_SCRYPT_PARALLELISM = 1
+
+PASSWORD_ARGON2_TIME_COST = 2
+PASSWORD_ARGON2_MEMORY_COST = 64 * 1024
+PASSWORD_ARGON2_PARALLELISM = 1
+
+PASSWORD_HASHING_THREADS = 4
+
+_PASSWORD_HASHERS = {
+    'scrypt': 'accounts.hashers.TunedScryptPasswordHasher',
+    'argon2': 'accounts.hashers.TunedArgon2PasswordHasher',
+}
+
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS.pop(PASSWORD_HASHER),
+    *_PASSWORD_HASHERS.values(),
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -138,6 +181,17 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Uploads are stored once per distinct content and hard-linked under each
+# file's name, so MEDIA_ROOT must be on a filesystem with hard links.
+STORAGES = {
+    'default': {
+        'BACKEND': 'ecommerce.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -149,10 +203,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'ecommerce.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,  # Set the number of products per page
+    # Reverse proxies in front of the app. Client IPs used for throttling are
+    # read from X-Forwarded-For only this many hops deep; with 0 the header is
+    # ignored and REMOTE_ADDR is used, so clients cannot pick their own IP.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
 }
 
 from datetime import timedelta
@@ -173,6 +231,10 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',  
 }
 
+# How long a token's user status (active/staff flags) is trusted before it
+# is re-read; User.save clears it immediately.
+AUTH_PRINCIPAL_TIMEOUT = 60
+
 
 
 # send email
@@ -182,6 +244,15 @@ EMAIL_PORT = os.getenv('EMAIL_PORT')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS')
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER') 
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD') 
+# Used when EMAIL_BACKEND is django.core.mail.backends.filebased.EmailBackend.
+EMAIL_FILE_PATH = os.getenv('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
+
+# outbound email queue (drained by the send_queued_emails command)
+EMAIL_QUEUE_BATCH_SIZE = 50
+EMAIL_QUEUE_MAX_ATTEMPTS = 5
+EMAIL_QUEUE_RETRY_DELAY = 30
+EMAIL_QUEUE_MAX_RETRY_DELAY = 60 * 60
+EMAIL_RENDER_CACHE_SIZE = 256
 
 
 
@@ -193,3 +264,71 @@ CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
+
+
+
+# catalog cache
+
+CATALOG_CACHE_TIMEOUT = 300
+
+
+
+# public id allocation (product_id, user_id, order_id)
+
+ID_ALLOCATOR = 'ecommerce.ids.SequenceIdAllocator'
+ID_BLOCK_SIZE = 100
+
+
+
+# cart store (set CART_REDIS_URL to keep carts in Redis; tests and local
+# development use the in-process cache)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CART_REDIS_URL'),
+    } if os.getenv('CART_REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'carts',
+    },
+}
+
+CART_CACHE_ALIAS = 'carts'
+CART_TTL = 60 * 60 * 24 * 30
+CART_FLUSH_BATCH_SIZE = 500
+
+
+
+# inventory
+
+INVENTORY_RESERVATION_TTL = 15 * 60
+
+
+
+# rate limiting (sliding-window counters in the default cache), per view
+# throttle_scope and per client ip / submitted email
+
+RATE_LIMITS = {
+    'login': {'ip': '30/m', 'email': '10/m'},
+    'email-verify': {'ip': '10/m', 'email': '3/m'},
+    'code-verify': {'ip': '30/m', 'email': '10/m'},
+}
+
+VERIFICATION_CODE_MAX_ATTEMPTS = 5
+
+
+
+# product image variants (longest edge in pixels), rendered after upload in
+# a pool of IMAGE_PROCESSING_WORKERS processes (0 renders in-process)
+
+IMAGE_VARIANTS = {
+    'thumbnail': 150,
+    'medium': 600,
+    'large': 1200,
+}
+
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_PROCESSING_WORKERS = 2
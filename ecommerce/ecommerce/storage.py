@@ -0,0 +1,215 @@
+import hashlib
+import logging
+import os
+import stat
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+
+logger = logging.getLogger(__name__)
+
+STATS = ('uploads', 'bytes_received', 'bytes_written')
+
+
+def _stats_key(name):
+    return f'media:stats:{name}'
+
+
+def _incr_stat(name, delta):
+    try:
+        cache.incr(_stats_key(name), delta)
+    except ValueError:
+        cache.add(_stats_key(name), 0, timeout=None)
+        cache.incr(_stats_key(name), delta)
+
+
+def get_upload_stats():
+    values = cache.get_many([_stats_key(name) for name in STATS])
+    return {name: values.get(_stats_key(name), 0) for name in STATS}
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    # Every saved file is a hard link to a blob named after its sha256, so
+    # identical uploads take the disk space of one while each keeps its own
+    # name and URL. The blob's link count is its reference count: a blob
+    # with n links backs n - 1 files and goes away with its last file.
+    blob_directory = '.blobs'
+
+    def blob_root(self):
+        return os.path.join(self.location, self.blob_directory)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_root(), digest[:2], digest)
+
+    def _makedirs(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        # os.makedirs() doesn't apply the mode to intermediate directories.
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def _write_temporary(self, content):
+        # Streams the content to a temporary file next to the blobs while
+        # hashing it, so nothing is held in memory beyond one chunk.
+        self._makedirs(self.blob_root())
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.blob_root(), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    hasher.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return temp_path, hasher.hexdigest(), size
+
+    def _publish(self, temp_path, blob):
+        # Returns the bytes this upload added to the disk: none when the
+        # blob already exists, which is then left untouched.
+        self._makedirs(os.path.dirname(blob))
+        try:
+            os.link(temp_path, blob)
+        except FileExistsError:
+            return 0
+        return os.stat(blob).st_size
+
+    def _save(self, name, content):
+        if self._allow_overwrite:
+            self.delete(name)
+
+        temp_path, digest, size = self._write_temporary(content)
+        blob = self.blob_path(digest)
+        try:
+            written = self._publish(temp_path, blob)
+            full_path = self.path(name)
+            self._makedirs(os.path.dirname(full_path))
+            while True:
+                try:
+                    os.link(blob, full_path)
+                except FileExistsError:
+                    name = self.get_available_name(name)
+                    full_path = self.path(name)
+                except FileNotFoundError:
+                    # The blob lost its last file in between; this upload
+                    # becomes the blob again.
+                    written = self._publish(temp_path, blob)
+                else:
+                    break
+            # Every link shares the blob's inode, so its mtime is that of the
+            # first upload unless refreshed: age checks such as
+            # clean_orphaned_images --min-age must see this upload.
+            os.utime(full_path)
+        finally:
+            # The temporary link kept the blob alive until the file existed.
+            os.unlink(temp_path)
+
+        _incr_stat('uploads', 1)
+        _incr_stat('bytes_received', size)
+        _incr_stat('bytes_written', written)
+        logger.info('Stored %s: %d bytes, %d written.', name, size, written)
+
+        name = os.path.relpath(full_path, self.location)
+        return str(name).replace('\\', '/')
+
+    def _digest(self, path):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(64 * 1024), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def delete(self, name):
+        path = self.path(name)
+        try:
+            file_stat = os.stat(path)
+        except FileNotFoundError:
+            return
+
+        # Only the last file of a blob needs its content hashed, to find the
+        # blob and drop it too.
+        blob = None
+        if stat.S_ISREG(file_stat.st_mode) and file_stat.st_nlink == 2:
+            blob = self.blob_path(self._digest(path))
+        super().delete(name)
+        if blob is None:
+            return
+        try:
+            blob_stat = os.stat(blob)
+            if blob_stat.st_ino == file_stat.st_ino and blob_stat.st_nlink == 1:
+                os.unlink(blob)
+        except FileNotFoundError:
+            pass
+
+    def reclaimable_size(self, names):
+        # Bytes that deleting all of `names` gives back: a blob's size once
+        # none of its files are left, nothing while other files link to it.
+        inodes = {}
+        for name in names:
+            file_stat = os.stat(self.path(name))
+            _, count = inodes.get(file_stat.st_ino, (file_stat, 0))
+            inodes[file_stat.st_ino] = (file_stat, count + 1)
+        # One link left is the blob itself (or none, for a file saved before
+        # this backend).
+        return sum(file_stat.st_size for file_stat, count in inodes.values() if file_stat.st_nlink - count <= 1)
+
+    def deduplicate(self, name):
+        # Turns a file saved before this backend into a link to its blob.
+        # Returns the bytes freed.
+        path = self.path(name)
+        file_stat = os.stat(path)
+        if file_stat.st_nlink > 1:
+            return 0
+
+        blob = self.blob_path(self._digest(path))
+        self._makedirs(os.path.dirname(blob))
+        try:
+            os.link(path, blob)
+            return 0
+        except FileExistsError:
+            pass
+
+        temp_path = f'{path}.dedupe'
+        os.link(blob, temp_path)
+        os.replace(temp_path, path)
+        return file_stat.st_size
+
+    def usage(self):
+        # Walks the blobs only. Orphaned blobs (no files left, e.g. after a
+        # crash) are counted separately and removed by collect_garbage().
+        usage = {'blobs': 0, 'files': 0, 'stored_bytes': 0, 'logical_bytes': 0, 'orphaned_blobs': 0}
+        for directory, _, files in os.walk(self.blob_root()):
+            for file in files:
+                if file.startswith('.upload-'):
+                    continue
+                blob_stat = os.stat(os.path.join(directory, file))
+                if blob_stat.st_nlink == 1:
+                    usage['orphaned_blobs'] += 1
+                    continue
+                usage['blobs'] += 1
+                usage['files'] += blob_stat.st_nlink - 1
+                usage['stored_bytes'] += blob_stat.st_size
+                usage['logical_bytes'] += blob_stat.st_size * (blob_stat.st_nlink - 1)
+        usage['saved_bytes'] = usage['logical_bytes'] - usage['stored_bytes']
+        return usage
+
+    def collect_garbage(self):
+        removed = 0
+        for directory, _, files in os.walk(self.blob_root()):
+            for file in files:
+                path = os.path.join(directory, file)
+                if not file.startswith('.upload-') and os.stat(path).st_nlink == 1:
+                    os.unlink(path)
+                    removed += 1
+        return removed
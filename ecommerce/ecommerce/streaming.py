@@ -0,0 +1,82 @@
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework import status
+
+from ecommerce.renderers import dumps
+
+STREAM_CHUNK_SIZE = 500
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _serialized_batches(queryset, serializer_class, chunk_size):
+    # iterator() uses a server-side cursor on Postgres, so only one batch of
+    # rows and serialized items is held in memory at a time.
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            return
+        yield serializer_class(batch, many=True).data
+
+
+def _json_stream(queryset, serializer_class, data_key, message, chunk_size):
+    yield b'{"status":true,"message":%s,"status_code":%d,"data":{%s:[' % (
+        dumps(message), status.HTTP_200_OK, dumps(data_key),
+    )
+    separator = b''
+    for batch in _serialized_batches(queryset, serializer_class, chunk_size):
+        yield separator + b','.join(dumps(item) for item in batch)
+        separator = b','
+    yield b']}}'
+
+
+def _ndjson_stream(queryset, serializer_class, data_key, message, chunk_size):
+    # First line carries the envelope, every following line is one item.
+    yield dumps({
+        'status': True,
+        'message': message,
+        'status_code': status.HTTP_200_OK,
+        'data_key': data_key,
+    }) + b'\n'
+    for batch in _serialized_batches(queryset, serializer_class, chunk_size):
+        yield b''.join(dumps(item) + b'\n' for item in batch)
+
+
+async def _aiterate(content):
+    # Django would buffer a synchronous iterator into a list before sending
+    # it over ASGI; pulling it one chunk per thread hop keeps it streaming.
+    content = iter(content)
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(content, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def get_stream_format(request):
+    stream_format = request.query_params.get('stream')
+    if stream_format in STREAM_FORMATS:
+        return stream_format
+    return None
+
+
+def stream_queryset(stream_format, queryset, serializer_class, data_key, message, chunk_size=STREAM_CHUNK_SIZE, asynchronous=False):
+    if stream_format == 'ndjson':
+        content = _ndjson_stream(queryset, serializer_class, data_key, message, chunk_size)
+    else:
+        content = _json_stream(queryset, serializer_class, data_key, message, chunk_size)
+    if asynchronous:
+        content = _aiterate(content)
+
+    return StreamingHttpResponse(
+        content,
+        content_type=f'{STREAM_FORMATS[stream_format]}; charset=utf-8',
+        status=status.HTTP_200_OK,
+    )
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_delete
 
 
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        from shop.facets import remove_deleted_product_facets
+
+        pre_delete.connect(remove_deleted_product_facets, sender='shop.Product', dispatch_uid='shop.product_facets')
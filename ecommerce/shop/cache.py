@@ -0,0 +1,208 @@
+import hashlib
+import inspect
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+# A cached response is only valid while the generations of every entity it
+# serializes are unchanged, e.g. products embed their category and
+# subcategory.
+DEPENDENCIES = {
+    'category': ('category',),
+    'subcategory': ('category', 'subcategory'),
+    'product': ('category', 'subcategory', 'product'),
+}
+
+STATS = ('hits', 'misses', 'invalidations')
+
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified')
+
+
+def _generation_key(entity):
+    return f'catalog:generation:{entity}'
+
+
+def _stats_key(name):
+    return f'catalog:stats:{name}'
+
+
+def _bumped_key(entity):
+    return f'catalog:bumped:{entity}'
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Seed missing counters from the clock so a generation evicted from
+        # the cache never falls back to a value that was already used.
+        if cache.add(key, int(time.time() * 1000), timeout=None):
+            return cache.get(key)
+        return cache.incr(key)
+
+
+async def _aincr(key):
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        if await cache.aadd(key, int(time.time() * 1000), timeout=None):
+            return await cache.aget(key)
+        return await cache.aincr(key)
+
+
+def _incr_stat(name):
+    try:
+        cache.incr(_stats_key(name))
+    except ValueError:
+        cache.add(_stats_key(name), 0, timeout=None)
+        cache.incr(_stats_key(name))
+
+
+async def _aincr_stat(name):
+    try:
+        await cache.aincr(_stats_key(name))
+    except ValueError:
+        await cache.aadd(_stats_key(name), 0, timeout=None)
+        await cache.aincr(_stats_key(name))
+
+
+def get_generations(entity):
+    keys = [_generation_key(name) for name in DEPENDENCIES[entity]]
+    generations = cache.get_many(keys)
+    return tuple(generations.get(key) or _incr(key) for key in keys)
+
+
+async def aget_generations(entity):
+    keys = [_generation_key(name) for name in DEPENDENCIES[entity]]
+    generations = await cache.aget_many(keys)
+    return tuple([generations.get(key) or await _aincr(key) for key in keys])
+
+
+def _seed_bumped(key):
+    # A timestamp evicted from the cache restarts at now: later than any
+    # Last-Modified already handed out, so no client gets a stale 304.
+    now = int(time.time())
+    cache.add(key, now, timeout=None)
+    return cache.get(key) or now
+
+
+async def _aseed_bumped(key):
+    now = int(time.time())
+    await cache.aadd(key, now, timeout=None)
+    return await cache.aget(key) or now
+
+
+def get_last_modified(entity):
+    # When any entity a response depends on was last bumped, in epoch
+    # seconds. Unlike updated_at this also moves on deletes, image and
+    # stock changes, and never goes backwards.
+    keys = [_bumped_key(name) for name in DEPENDENCIES[entity]]
+    bumped = cache.get_many(keys)
+    return max(bumped.get(key) or _seed_bumped(key) for key in keys)
+
+
+async def aget_last_modified(entity):
+    keys = [_bumped_key(name) for name in DEPENDENCIES[entity]]
+    bumped = await cache.aget_many(keys)
+    return max([bumped.get(key) or await _aseed_bumped(key) for key in keys])
+
+
+def bump_generation(entity):
+    # Model.save() bumps its entity. QuerySet.update(), bulk_create() and
+    # bulk_update() skip save(), so every bulk write to a catalog table
+    # (importer, image diffs, variant generation, facet rebuilds) must call
+    # this itself once it is done.
+    def bump():
+        _incr(_generation_key(entity))
+        now = int(time.time())
+        if cache.get(_bumped_key(entity), 0) < now:
+            cache.set(_bumped_key(entity), now, timeout=None)
+        _incr_stat('invalidations')
+
+    transaction.on_commit(bump)
+
+
+def get_stats():
+    values = cache.get_many([_stats_key(name) for name in STATS])
+    return {name: values.get(_stats_key(name), 0) for name in STATS}
+
+
+def _response_key(entity, request, generations):
+    generations = '.'.join(str(generation) for generation in generations)
+    url = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return f'catalog:response:{entity}:{generations}:{url}'
+
+
+def _is_cacheable(response):
+    # Streaming exports and errors are never cached.
+    return isinstance(response, Response) and response.status_code == status.HTTP_200_OK
+
+
+def _cache_entry(response):
+    # The validators set by conditional_catalog_response are stored with the
+    # payload, so a hit can answer conditional requests without the ORM.
+    return {
+        'data': response.data,
+        'headers': {header: response[header] for header in VALIDATOR_HEADERS if response.has_header(header)},
+    }
+
+
+def _cached_response(request, entry):
+    headers = entry['headers']
+    response = get_conditional_response(
+        request,
+        etag=headers.get('ETag'),
+        last_modified=parse_http_date_safe(headers.get('Last-Modified')),
+    )
+    if response is None:
+        response = Response(entry['data'], status=status.HTTP_200_OK)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def cache_catalog_response(entity):
+    def decorator(view_method):
+        if inspect.iscoroutinefunction(view_method):
+            @wraps(view_method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                key = _response_key(entity, request, await aget_generations(entity))
+                entry = await cache.aget(key)
+                if entry is not None:
+                    await _aincr_stat('hits')
+                    return _cached_response(request, entry)
+
+                await _aincr_stat('misses')
+                response = await view_method(self, request, *args, **kwargs)
+                if _is_cacheable(response):
+                    await cache.aset(key, _cache_entry(response), timeout=CATALOG_CACHE_TIMEOUT)
+                return response
+
+            return async_wrapper
+
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = _response_key(entity, request, get_generations(entity))
+            entry = cache.get(key)
+            if entry is not None:
+                _incr_stat('hits')
+                return _cached_response(request, entry)
+
+            _incr_stat('misses')
+            response = view_method(self, request, *args, **kwargs)
+            if _is_cacheable(response):
+                cache.set(key, _cache_entry(response), timeout=CATALOG_CACHE_TIMEOUT)
+            return response
+
+        return wrapper
+
+    return decorator
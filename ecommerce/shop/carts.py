@@ -0,0 +1,207 @@
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User
+from shop.models import Cart, CartItem, Product
+
+CART_CACHE_ALIAS = getattr(settings, 'CART_CACHE_ALIAS', 'carts')
+CART_TTL = getattr(settings, 'CART_TTL', 60 * 60 * 24 * 30)
+CART_FLUSH_BATCH_SIZE = getattr(settings, 'CART_FLUSH_BATCH_SIZE', 500)
+# How long a writer may hold a cart version before others may claim it again.
+CART_CLAIM_TIMEOUT = getattr(settings, 'CART_CLAIM_TIMEOUT', 5)
+
+# Every cart change appends the owner's user_id to a journal of numbered
+# entries; the flusher replays it in order and writes each touched cart back
+# to Cart/CartItem rows in one transaction per batch.
+SEQUENCE_KEY = 'cart:journal:sequence'
+CURSOR_KEY = 'cart:journal:cursor'
+GAP_KEY = 'cart:journal:gap'
+
+CartLine = namedtuple('CartLine', ('product', 'quantity', 'subtotal'))
+
+
+def cart_store():
+    return caches[CART_CACHE_ALIAS]
+
+
+def _cart_key(user_id):
+    return f'cart:{user_id}'
+
+
+def _claim_key(user_id, version):
+    return f'cart:{user_id}:claim:{version}'
+
+
+def _journal_key(sequence):
+    return f'cart:journal:{sequence}'
+
+
+def _next_sequence(store):
+    try:
+        return store.incr(SEQUENCE_KEY)
+    except ValueError:
+        store.add(SEQUENCE_KEY, 0, timeout=None)
+        return store.incr(SEQUENCE_KEY)
+
+
+def _load_items(user):
+    cart = Cart.objects.filter(user=user).order_by('-updated_at').first()
+    if cart is None:
+        return {}
+    return dict(cart.items.values_list('product_id', 'quantity'))
+
+
+def _versioned(items):
+    return {'version': uuid.uuid4().hex, 'items': items}
+
+
+def _get_cart(store, user):
+    key = _cart_key(user.user_id)
+    cart = store.get(key)
+    if cart is None:
+        # Cold cart: read the last flushed copy once and keep it in the store.
+        store.add(key, _versioned(_load_items(user)), timeout=CART_TTL)
+        cart = store.get(key)
+    return cart
+
+
+def get_items(user):
+    return _get_cart(cart_store(), user)['items']
+
+
+def save_items(user, items):
+    store = cart_store()
+    store.set(_cart_key(user.user_id), _versioned(items), timeout=CART_TTL)
+    store.set(_journal_key(_next_sequence(store)), user.user_id, timeout=CART_TTL)
+
+
+def _change_items(user, change):
+    # Compare-and-set on the cart's version: writers edit the copy they read,
+    # and only the first to claim that version (an atomic add) stores its
+    # edit. The others re-read the new version and apply their change again,
+    # so concurrent adds never drop a line.
+    store = cart_store()
+    while True:
+        cart = _get_cart(store, user)
+        items = dict(cart['items'])
+        if not change(items):
+            return None
+        if store.add(_claim_key(user.user_id, cart['version']), True, timeout=CART_CLAIM_TIMEOUT):
+            save_items(user, items)
+            return items
+        time.sleep(0.001)
+
+
+def add_item(user, product, quantity):
+    def change(items):
+        items[product.id] = items.get(product.id, 0) + quantity
+        return True
+
+    return _change_items(user, change)
+
+
+def update_item(user, product, quantity):
+    def change(items):
+        if product.id not in items:
+            return False
+        items[product.id] = quantity
+        return True
+
+    return _change_items(user, change)
+
+
+def remove_item(user, product):
+    def change(items):
+        return items.pop(product.id, None) is not None
+
+    return _change_items(user, change)
+
+
+def clear_items(user):
+    def change(items):
+        items.clear()
+        return True
+
+    return _change_items(user, change)
+
+
+def hydrate(items):
+    products = Product.objects.filter(id__in=list(items), deleted=False).only(
+        'id', 'product_id', 'slug', 'name', 'sale_price',
+    )
+    lines = [
+        CartLine(product, items[product.id], product.sale_price * items[product.id])
+        for product in products
+    ]
+    return sorted(lines, key=lambda line: line.product.name)
+
+
+def _write_carts(user_ids):
+    carts = cart_store().get_many([_cart_key(user_id) for user_id in user_ids])
+    users = dict(User.objects.filter(user_id__in=user_ids).values_list('user_id', 'id'))
+    wanted = {
+        users[user_id]: carts[_cart_key(user_id)]['items']
+        for user_id in user_ids
+        if user_id in users and _cart_key(user_id) in carts
+    }
+    if not wanted:
+        return 0
+
+    product_ids = {product_id for items in wanted.values() for product_id in items}
+    existing_products = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+
+    with transaction.atomic():
+        cart_ids = {}
+        for cart_id, user_pk in Cart.objects.filter(user_id__in=wanted).order_by('updated_at').values_list('id', 'user_id'):
+            cart_ids[user_pk] = cart_id
+        new_carts = Cart.objects.bulk_create([Cart(user_id=user_pk) for user_pk in wanted.keys() - cart_ids.keys()])
+        cart_ids.update({cart.user_id: cart.id for cart in new_carts})
+
+        CartItem.objects.filter(cart_id__in=cart_ids.values()).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=cart_ids[user_pk], product_id=product_id, quantity=quantity)
+            for user_pk, items in wanted.items()
+            for product_id, quantity in items.items()
+            if product_id in existing_products
+        ])
+        Cart.objects.filter(id__in=cart_ids.values()).update(updated_at=timezone.now())
+    return len(wanted)
+
+
+def flush_carts(batch_size=CART_FLUSH_BATCH_SIZE):
+    store = cart_store()
+    cursor = store.get(CURSOR_KEY, 0)
+    head = store.get(SEQUENCE_KEY, 0)
+    gap = store.get(GAP_KEY)
+    flushed = 0
+
+    while cursor < head:
+        sequences = range(cursor + 1, min(head, cursor + batch_size) + 1)
+        entries = store.get_many([_journal_key(sequence) for sequence in sequences])
+
+        # A writer can sit between taking a sequence number and writing its
+        # entry; stop in front of the first hole for one pass, then move past.
+        ready = []
+        for sequence in sequences:
+            if _journal_key(sequence) not in entries and sequence != gap:
+                break
+            ready.append(sequence)
+
+        user_ids = {entries[_journal_key(sequence)] for sequence in ready if _journal_key(sequence) in entries}
+        flushed += _write_carts(user_ids)
+        store.delete_many([_journal_key(sequence) for sequence in ready])
+
+        if len(ready) < len(sequences):
+            hole = sequences[len(ready)]
+            store.set_many({CURSOR_KEY: hole - 1, GAP_KEY: hole}, timeout=None)
+            return flushed
+
+        cursor = sequences[-1]
+        store.set(CURSOR_KEY, cursor, timeout=None)
+    return flushed
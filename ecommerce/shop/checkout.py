@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models import F, Subquery, Sum
+
+from shop import carts
+from shop.inventory import InsufficientStock, consume_reservations, seed_inventory, take_stock
+from shop.models import Order, OrderItem, Payment, Product, ProductImage, Shipping
+
+
+class CheckoutError(Exception):
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+        self.message = message
+
+
+def checkout(user, payment_method, shipping):
+    items = carts.get_items(user)
+    if not items:
+        raise CheckoutError('cart', 'Cart is empty.')
+
+    products = list(
+        Product.objects.filter(id__in=list(items), deleted=False, status=True)
+        .only('id', 'product_id', 'slug', 'name', 'sale_price', 'quantity')
+        .order_by('id')
+    )
+    if len(products) != len(items):
+        raise CheckoutError('cart', 'Some products in the cart are no longer available.')
+
+    with transaction.atomic():
+        seed_inventory(products)
+        try:
+            # Units the user already holds through a reservation were taken
+            # from stock when they were reserved.
+            take_stock(consume_reservations(user, items))
+        except InsufficientStock as exc:
+            short = [product.name for product in products if product.id in exc.product_ids]
+            raise CheckoutError('stock', f'Not enough stock for {", ".join(short)}.')
+
+        order = Order.objects.create(user=user, item_count=sum(items.values()))
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=items[product.id], price=product.sale_price)
+            for product in products
+        ])
+
+        total = OrderItem.objects.filter(order=order).aggregate(total=Sum(F('price') * F('quantity')))['total']
+        first_image = (
+            ProductImage.objects.filter(product=products[0], deleted=False)
+            .order_by('position', 'id')
+            .values('image')[:1]
+        )
+        Order.objects.filter(pk=order.pk).update(total_amount=total, thumbnail=Subquery(first_image))
+        order.total_amount = total
+
+        payment = Payment.objects.create(order=order, amount=total, payment_method=payment_method)
+        shipping = Shipping.objects.create(user=user, order=order, **shipping)
+
+    carts.clear_items(user)
+    return order, order_items, payment, shipping
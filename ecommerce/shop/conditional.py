@@ -0,0 +1,99 @@
+import hashlib
+import inspect
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from shop.cache import aget_generations, aget_last_modified, get_generations, get_last_modified
+
+# Every updated_at that feeds a serialized row: products embed their
+# category and subcategory (which embeds its own category).
+TIMESTAMP_FIELDS = {
+    'category': ('updated_at',),
+    'subcategory': ('updated_at', 'category__updated_at'),
+    'product': (
+        'updated_at', 'category__updated_at',
+        'sub_category__updated_at', 'sub_category__category__updated_at',
+    ),
+}
+
+
+def _aggregates(entity):
+    fields = TIMESTAMP_FIELDS[entity]
+    return {
+        'row_count': Count('id'),
+        **{f'last_{i}': Max(field) for i, field in enumerate(fields)},
+    }
+
+
+def _validators(entity, aggregates, generations, last_modified, request):
+    fields = TIMESTAMP_FIELDS[entity]
+    timestamps = [aggregates[f'last_{i}'] for i in range(len(fields))]
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    last_updated = max(timestamps) if timestamps else None
+
+    # Generations also cover changes that leave updated_at alone, such as
+    # product image replacement.
+    fingerprint = '|'.join([
+        request.get_full_path(),
+        str(aggregates['row_count']),
+        last_updated.isoformat() if last_updated else '',
+        '.'.join(str(generation) for generation in generations),
+    ])
+    etag = quote_etag(hashlib.md5(fingerprint.encode('utf-8')).hexdigest())
+    # Last-Modified comes from when the entities were last bumped, not from
+    # updated_at: the newest row's timestamp stays put or goes backwards
+    # when rows are deleted, and image or stock changes never set it.
+    return etag, last_modified
+
+
+def get_validators(entity, queryset, request):
+    aggregates = queryset.aggregate(**_aggregates(entity))
+    return _validators(entity, aggregates, get_generations(entity), get_last_modified(entity), request)
+
+
+async def aget_validators(entity, queryset, request):
+    aggregates = await queryset.aaggregate(**_aggregates(entity))
+    return _validators(entity, aggregates, await aget_generations(entity), await aget_last_modified(entity), request)
+
+
+def _finalize(response, etag, last_modified):
+    if response.status_code == 200:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional_catalog_response(model, entity):
+    # Goes inside cache_catalog_response, which stores the validators set
+    # here with the payload: the aggregate only runs on a cache miss.
+    def decorator(view_method):
+        if inspect.iscoroutinefunction(view_method):
+            @wraps(view_method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                etag, last_modified = await aget_validators(entity, model.objects.filter(deleted=False), request)
+
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is not None:
+                    return response
+
+                return _finalize(await view_method(self, request, *args, **kwargs), etag, last_modified)
+
+            return async_wrapper
+
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            etag, last_modified = get_validators(entity, model.objects.filter(deleted=False), request)
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+
+            return _finalize(view_method(self, request, *args, **kwargs), etag, last_modified)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,198 @@
+import json
+from collections import Counter, defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from shop.cache import bump_generation
+from shop.models import FacetCount, Product, ProductFacetValue
+
+FACETS = ('category', 'sub_category', 'gender', 'sizes', 'colors', 'price')
+
+PRICE_BUCKETS = (
+    (Decimal('0'), Decimal('25')),
+    (Decimal('25'), Decimal('50')),
+    (Decimal('50'), Decimal('100')),
+    (Decimal('100'), Decimal('200')),
+    (Decimal('200'), None),
+)
+
+VALUE_MAX_LENGTH = ProductFacetValue._meta.get_field('value').max_length
+
+
+def price_bucket(price):
+    price = Decimal(price)
+    for low, high in PRICE_BUCKETS:
+        if high is None:
+            return f'{low}+'
+        if price < high:
+            return f'{low}-{high}'
+
+
+def _as_list(value):
+    # Older rows hold the JSON-encoded string the views used to store.
+    if value is None:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = value.split(',')
+    if not isinstance(value, list):
+        value = [value]
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def facet_values(product):
+    if product.deleted:
+        return set()
+
+    values = set()
+    if product.category_id:
+        values.add(('category', str(product.category_id)))
+    if product.sub_category_id:
+        values.add(('sub_category', str(product.sub_category_id)))
+    if product.gender:
+        values.add(('gender', product.gender))
+    for size in _as_list(product.sizes):
+        values.add(('sizes', size))
+    for color in _as_list(product.colors):
+        values.add(('colors', color))
+    if product.sale_price is not None:
+        values.add(('price', price_bucket(product.sale_price)))
+    return {(facet, value[:VALUE_MAX_LENGTH]) for facet, value in values}
+
+
+def _adjust_counts(deltas):
+    deltas = {facet_value: delta for facet_value, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    FacetCount.objects.bulk_create(
+        [FacetCount(facet=facet, value=value) for facet, value in deltas],
+        ignore_conflicts=True,
+    )
+    by_delta = defaultdict(list)
+    for (facet, value), delta in deltas.items():
+        by_delta[delta].append(Q(facet=facet, value=value))
+    for delta, conditions in by_delta.items():
+        FacetCount.objects.filter(reduce(or_, conditions)).update(count=F('count') + delta)
+
+
+def sync_product_facets(products):
+    _sync_facets({product.pk: facet_values(product) for product in products if product.pk})
+
+
+def remove_deleted_product_facets(sender, instance, **kwargs):
+    # pre_delete receiver. Hard deletes (admin, QuerySet.delete()) would
+    # cascade the facet rows away without touching FacetCount, so the
+    # product's values are taken out through the same locked diff first.
+    _sync_facets({instance.pk: set()})
+    bump_generation('product')
+
+
+def _sync_facets(wanted):
+    if not wanted:
+        return
+
+    with transaction.atomic():
+        # Concurrent saves of a product queue here, so each one diffs
+        # against the facet rows the previous one committed.
+        list(Product.objects.select_for_update().filter(pk__in=wanted).order_by('pk').values_list('pk'))
+        existing = defaultdict(dict)
+        rows = ProductFacetValue.objects.filter(product_id__in=wanted).values_list('id', 'product_id', 'facet', 'value')
+        for row_id, product_id, facet, value in rows:
+            existing[product_id][(facet, value)] = row_id
+
+        deltas = Counter()
+        removed_ids = []
+        added = []
+        for product_id, values in wanted.items():
+            current = existing[product_id]
+            for facet_value in current.keys() - values:
+                removed_ids.append(current[facet_value])
+                deltas[facet_value] -= 1
+            for facet, value in values - current.keys():
+                added.append(ProductFacetValue(product_id=product_id, facet=facet, value=value))
+                deltas[(facet, value)] += 1
+
+        if removed_ids:
+            ProductFacetValue.objects.filter(id__in=removed_ids).delete()
+        if added:
+            ProductFacetValue.objects.bulk_create(added, ignore_conflicts=True)
+        _adjust_counts(deltas)
+
+
+def rebuild_facets(batch_size=1000):
+    with transaction.atomic():
+        ProductFacetValue.objects.all().delete()
+        FacetCount.objects.all().delete()
+
+        products = Product.objects.filter(deleted=False).only(
+            'id', 'deleted', 'category_id', 'sub_category_id', 'gender', 'sizes', 'colors', 'sale_price',
+        )
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            batch.extend(
+                ProductFacetValue(product_id=product.pk, facet=facet, value=value)
+                for facet, value in facet_values(product)
+            )
+            if len(batch) >= batch_size:
+                ProductFacetValue.objects.bulk_create(batch)
+                batch = []
+        ProductFacetValue.objects.bulk_create(batch)
+
+        counts = ProductFacetValue.objects.values('facet', 'value').annotate(total=Count('id')).order_by()
+        FacetCount.objects.bulk_create(
+            [FacetCount(facet=row['facet'], value=row['value'], count=row['total']) for row in counts],
+            batch_size=batch_size,
+        )
+
+
+def parse_facet_filters(query_params):
+    filters = {}
+    for facet in FACETS:
+        values = [value.strip() for value in query_params.get(facet, '').split(',') if value.strip()]
+        if values:
+            filters[facet] = values
+    return filters
+
+
+def filter_by_facets(queryset, filters):
+    # OR within a facet, AND across facets.
+    for facet, values in filters.items():
+        matching = ProductFacetValue.objects.filter(facet=facet, value__in=values).values('product_id')
+        queryset = queryset.filter(id__in=matching)
+    return queryset
+
+
+def _value_counts(queryset):
+    return (
+        ProductFacetValue.objects.filter(product__in=queryset.values('id'))
+        .values_list('facet', 'value')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+
+
+def facet_counts(queryset=None, filters=None):
+    # Disjunctive counts: values OR within a facet, so each selected facet
+    # is counted against the products matching every other facet. Picking
+    # red still shows how many products are blue.
+    if queryset is None:
+        # Unfiltered listings read the precomputed totals.
+        rows = FacetCount.objects.filter(count__gt=0).values_list('facet', 'value', 'count')
+    else:
+        filters = filters or {}
+        rows = list(_value_counts(filter_by_facets(queryset, filters)).exclude(facet__in=filters))
+        for facet in filters:
+            others = {name: values for name, values in filters.items() if name != facet}
+            rows.extend(_value_counts(filter_by_facets(queryset, others)).filter(facet=facet))
+
+    counts = {facet: {} for facet in FACETS}
+    for facet, value, count in rows:
+        counts.setdefault(facet, {})[value] = count
+    return counts
@@ -0,0 +1,26 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+# Containment lookups compile to `@>`, served by the jsonb_path_ops GIN
+# indexes on these fields.
+JSON_LIST_FIELDS = ('sizes', 'colors', 'tags')
+
+
+def filter_products(queryset, params):
+    if params.get('category') is not None:
+        queryset = queryset.filter(category_id=params['category'])
+    if params.get('sub_category') is not None:
+        queryset = queryset.filter(sub_category_id=params['sub_category'])
+    if params.get('min_price') is not None:
+        queryset = queryset.filter(sale_price__gte=params['min_price'])
+    if params.get('max_price') is not None:
+        queryset = queryset.filter(sale_price__lte=params['max_price'])
+    for field in JSON_LIST_FIELDS:
+        values = params.get(field)
+        if values:
+            queryset = queryset.filter(
+                reduce(or_, (Q(**{f'{field}__contains': [value]}) for value in values))
+            )
+    return queryset
@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from shop.cache import bump_generation
+from shop.imaging import ENCODERS, render_variants
+from shop.models import Order, ProductImage
+
+# Longest edge in pixels per variant.
+IMAGE_VARIANTS = getattr(settings, 'IMAGE_VARIANTS', {'thumbnail': 150, 'medium': 600, 'large': 1200})
+IMAGE_VARIANT_QUALITY = getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+IMAGE_PROCESSING_WORKERS = getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2)
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Uploads only queue their ids here; the thread hands the decoding and
+# resizing to the process pool so it never competes with request threads
+# for the GIL.
+_dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-variants')
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Workers are spawned rather than forked from a threaded server.
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_PROCESSING_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def variant_name(name, variant, extension):
+    # Variants sit next to the original: products/shoe.jpg -> products/shoe_medium.webp
+    root, _ = os.path.splitext(name)
+    return f'{root}_{variant}.{extension}'
+
+
+def variant_paths(variants):
+    return [path for variant in variants.values() for key, path in variant.items() if key in ENCODERS]
+
+
+def _read(image):
+    with image.image.open('rb') as source:
+        return source.read()
+
+
+def _submit(image):
+    # Every image of a batch is submitted before any result is awaited, so
+    # the batch renders in parallel across the pool.
+    sizes = sorted(IMAGE_VARIANTS.items(), key=lambda item: item[1])
+    try:
+        data = _read(image)
+        image.content_hash = image.content_hash or hashlib.sha256(data).hexdigest()
+        if IMAGE_PROCESSING_WORKERS:
+            return get_pool().submit(render_variants, data, sizes, IMAGE_VARIANT_QUALITY)
+        future = Future()
+        future.set_result(render_variants(data, sizes, IMAGE_VARIANT_QUALITY))
+    except Exception as exc:
+        future = Future()
+        future.set_exception(exc)
+    return future
+
+
+def generate_variants(images):
+    # Renders each image's variants, stores them next to the original and
+    # records their names on the row. Returns (generated, failed).
+    images = [image for image in images if image.image]
+    if not images:
+        return 0, 0
+
+    futures = [_submit(image) for image in images]
+    generated = []
+    for image, future in zip(images, futures):
+        try:
+            rendered = future.result()
+        except Exception:
+            logger.exception('Could not render variants of %s', image.image.name)
+            continue
+
+        storage = image.image.storage
+        for path in variant_paths(image.variants):
+            storage.delete(path)
+
+        variants = {}
+        for name, width, height, encodings in rendered:
+            variant = {'width': width, 'height': height}
+            for extension, content in encodings.items():
+                variant[extension] = storage.save(variant_name(image.image.name, name, extension), ContentFile(content))
+            variants[name] = variant
+        image.variants = variants
+        generated.append(image)
+
+    if generated:
+        ProductImage.objects.bulk_update(generated, ['variants', 'content_hash'])
+        bump_generation('product')
+    return len(generated), len(images) - len(generated)
+
+
+def _generate_in_background(image_ids):
+    try:
+        generate_variants(ProductImage.objects.filter(id__in=image_ids, deleted=False))
+    except Exception:
+        logger.exception('Image variant generation failed for %s', image_ids)
+    finally:
+        connection.close()
+
+
+def schedule_variants(images):
+    # Rendering starts once the upload is committed, so the request never
+    # waits on Pillow.
+    image_ids = [image.id for image in images]
+    if image_ids:
+        transaction.on_commit(lambda: _dispatcher.submit(_generate_in_background, image_ids))
+
+
+def file_hash(upload):
+    hasher = hashlib.sha256()
+    for chunk in upload.chunks():
+        hasher.update(chunk)
+    upload.seek(0)
+    return hasher.hexdigest()
+
+
+def update_product_images(product, uploads, keep=None, remove=()):
+    # Applies an image diff and returns True when anything changed. `keep`
+    # lists the existing ids to keep in display order (None keeps all but
+    # `remove`); uploads follow them. An upload identical to one of the
+    # product's images reuses that row instead of storing the file again.
+    current = list(ProductImage.objects.filter(product=product, deleted=False))
+    by_id = {image.id: image for image in current}
+    by_hash = {image.content_hash: image for image in current if image.content_hash}
+
+    if keep is None:
+        images = [image for image in current if image.id not in remove]
+    else:
+        images = [by_id[image_id] for image_id in dict.fromkeys(keep) if image_id not in remove]
+
+    added, seen = [], set()
+    for upload in uploads:
+        content_hash = file_hash(upload)
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        image = by_hash.get(content_hash)
+        if image is None:
+            image = ProductImage(product=product, image=upload, content_hash=content_hash)
+            added.append(image)
+        if image not in images:
+            images.append(image)
+
+    moved = []
+    for position, image in enumerate(images):
+        if image.position != position:
+            image.position = position
+            if image.pk:
+                moved.append(image)
+    removed = [image for image in current if image not in images]
+
+    if not (removed or added or moved):
+        return False
+
+    with transaction.atomic():
+        if removed:
+            ProductImage.objects.filter(id__in=[image.id for image in removed]).delete()
+        if added:
+            ProductImage.objects.bulk_create(added)
+        if moved:
+            ProductImage.objects.bulk_update(moved, ['position'])
+        bump_generation('product')
+
+    schedule_variants(added)
+    schedule_cleanup(removed)
+    return True
+
+
+def delete_orphaned_files(names):
+    # Originals can be shared (imports by path, order thumbnails), so a file
+    # is only deleted once no row references it.
+    names = set(names)
+    referenced = set(ProductImage.objects.filter(image__in=names).values_list('image', flat=True))
+    referenced.update(Order.objects.filter(thumbnail__in=names).values_list('thumbnail', flat=True))
+    storage = ProductImage._meta.get_field('image').storage
+    orphaned = names - referenced
+    for name in orphaned:
+        storage.delete(name)
+    return len(orphaned)
+
+
+def _clean_up_in_background(names):
+    try:
+        delete_orphaned_files(names)
+    except Exception:
+        logger.exception('Could not delete orphaned image files %s', names)
+    finally:
+        connection.close()
+
+
+def schedule_cleanup(images):
+    names = [name for image in images for name in (image.image.name, *variant_paths(image.variants)) if name]
+    if names:
+        transaction.on_commit(lambda: _dispatcher.submit(_clean_up_in_background, names))
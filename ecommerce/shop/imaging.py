@@ -0,0 +1,44 @@
+import io
+
+from PIL import Image, ImageOps
+
+# Kept free of Django imports: it is loaded by the image worker processes.
+
+ENCODERS = {
+    'jpg': ('JPEG', lambda quality: {'quality': quality, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', lambda quality: {'optimize': True}),
+    'webp': ('WEBP', lambda quality: {'quality': quality, 'method': 4}),
+}
+
+
+def encode(image, extension, quality):
+    image_format, options = ENCODERS[extension]
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options(quality))
+    return buffer.getvalue()
+
+
+def render_variants(data, sizes, quality):
+    # Takes the original's bytes and returns (name, width, height,
+    # {extension: bytes}) per variant. Sizes bound the longest edge and are
+    # skipped when they would upscale; 'original' is a WebP copy at full
+    # size.
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    fallback = 'png' if has_alpha else 'jpg'
+    variants = [('original', image.width, image.height, {'webp': encode(image, 'webp', quality)})]
+    for name, size in sizes:
+        longest = max(image.width, image.height)
+        if size >= longest:
+            continue
+        width = max(1, round(image.width * size / longest))
+        height = max(1, round(image.height * size / longest))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        variants.append((name, width, height, {
+            fallback: encode(resized, fallback, quality),
+            'webp': encode(resized, 'webp', quality),
+        }))
+    return variants
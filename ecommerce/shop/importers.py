@@ -0,0 +1,229 @@
+import csv
+import io
+import json
+import os
+import time
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+
+from ecommerce.ids import allocate_ids
+from shop.cache import bump_generation
+from shop.facets import sync_product_facets
+from shop.images import schedule_variants
+from shop.models import Category, Product, ProductImage, SubCategory
+from shop.serializers import ProductImportSerializer
+from shop.slugs import allocate_slugs
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def detect_format(filename, default='csv'):
+    extension = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if extension == 'csv':
+        return 'csv'
+    return default
+
+
+def read_rows(binary_file, file_format):
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'ndjson':
+            for line in text:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as exc:
+                    # A bad line is reported against its row, not the file.
+                    yield ImportFileError(f'Invalid JSON: {exc}')
+        else:
+            yield from csv.DictReader(text)
+    except (ValueError, csv.Error) as exc:
+        raise ImportFileError(str(exc))
+
+
+def _split_refs(refs):
+    ids = {int(ref) for ref in refs if ref.isdigit()}
+    slugs = {ref for ref in refs if not ref.isdigit()}
+    return ids, slugs
+
+
+def _resolve(model, refs):
+    ids, slugs = _split_refs(refs)
+    if not ids and not slugs:
+        return {}
+    resolved = {}
+    for obj in model.objects.filter(Q(id__in=ids) | Q(slug__in=slugs), deleted=False):
+        resolved[str(obj.id)] = obj
+        resolved[obj.slug] = obj
+    return resolved
+
+
+class ProductImporter:
+    def __init__(self, batch_size=500, images_dir=None):
+        self.batch_size = batch_size
+        self.images_dir = os.path.realpath(images_dir) if images_dir else None
+        self.seen_names = set()
+        self.created = 0
+        self.rows = 0
+        self.errors = []
+        self.file_error = None
+
+    def run(self, rows):
+        # Batches commit as they go. A file that stops parsing part-way keeps
+        # the rows read before the error and reports it as file_error.
+        started = time.perf_counter()
+        batch = []
+        try:
+            try:
+                for row in enumerate(rows, start=1):
+                    batch.append(row)
+                    if len(batch) == self.batch_size:
+                        self.import_batch(batch)
+                        batch = []
+            except ImportFileError as exc:
+                self.file_error = {'row': self.rows + len(batch) + 1, 'error': str(exc)}
+            if batch:
+                self.import_batch(batch)
+        finally:
+            if self.created:
+                bump_generation('product')
+
+        elapsed = time.perf_counter() - started
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+            'file_error': self.file_error,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else None,
+        }
+
+    def add_error(self, line, errors):
+        self.errors.append({'row': line, 'errors': errors})
+
+    def validate(self, batch):
+        valid = []
+        for line, row in batch:
+            self.rows += 1
+            if isinstance(row, ImportFileError):
+                self.add_error(line, {'row': str(row)})
+                continue
+            serializer = ProductImportSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((line, serializer.validated_data))
+            else:
+                self.add_error(line, serializer.errors)
+        return valid
+
+    def import_batch(self, batch):
+        valid = self.validate(batch)
+        if not valid:
+            return
+
+        categories = _resolve(Category, {data['category'] for _, data in valid})
+        sub_categories = _resolve(SubCategory, {data['sub_category'] for _, data in valid})
+        existing_names = set(
+            Product.objects.filter(name__in=[data['name'] for _, data in valid], deleted=False)
+            .values_list('name', flat=True)
+        )
+
+        accepted = []
+        for line, data in valid:
+            category = categories.get(data['category'])
+            sub_category = sub_categories.get(data['sub_category'])
+            if data['name'] in existing_names or data['name'] in self.seen_names:
+                self.add_error(line, {'name': 'A Product with this name already exists.'})
+            elif category is None:
+                self.add_error(line, {'category': 'Category does not exist.'})
+            elif sub_category is None or sub_category.category_id != category.id:
+                self.add_error(line, {'sub_category': 'SubCategory does not exist.'})
+            else:
+                image_paths, image_errors = self.resolve_images(data.get('images', []))
+                if image_errors:
+                    self.add_error(line, {'images': image_errors})
+                    continue
+                self.seen_names.add(data['name'])
+                accepted.append((data, category, sub_category, image_paths))
+
+        if accepted:
+            self.write(accepted)
+
+    def resolve_images(self, images):
+        paths, errors = [], []
+        for image in images:
+            if self.images_dir:
+                source = os.path.realpath(os.path.join(self.images_dir, image))
+                if not source.startswith(self.images_dir + os.sep) or not os.path.isfile(source):
+                    errors.append(f'{image} not found.')
+                else:
+                    paths.append(source)
+            elif not default_storage.exists(image):
+                errors.append(f'{image} not found.')
+            else:
+                paths.append(image)
+        return paths, errors
+
+    def store_images(self, accepted):
+        # Returns the stored names per product and the names this batch
+        # copied into storage, which a failed batch deletes again.
+        stored, copied = [], []
+        try:
+            for _, _, _, paths in accepted:
+                names = []
+                for path in paths:
+                    if self.images_dir:
+                        with open(path, 'rb') as source:
+                            path = default_storage.save(f'products/{os.path.basename(path)}', File(source))
+                        copied.append(path)
+                    names.append(path)
+                stored.append(names)
+        except Exception:
+            self.delete_images(copied)
+            raise
+        return stored, copied
+
+    def delete_images(self, names):
+        for name in names:
+            default_storage.delete(name)
+
+    def write(self, accepted):
+        product_ids = allocate_ids('product', len(accepted))
+        slugs = allocate_slugs(Product, [data['name'] for data, *_ in accepted])
+
+        products = []
+        for (data, category, sub_category, _), product_id, slug in zip(accepted, product_ids, slugs):
+            fields = {key: value for key, value in data.items() if key not in ('category', 'sub_category', 'images')}
+            products.append(Product(
+                product_id=product_id, slug=slug, category=category, sub_category=sub_category, **fields,
+            ))
+
+        # Files are copied before the transaction so it holds no locks
+        # during file I/O, and removed if the batch rolls back.
+        stored, copied = self.store_images(accepted)
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(products)
+                images = [
+                    ProductImage(product=product, image=name, position=position)
+                    for product, names in zip(products, stored)
+                    for position, name in enumerate(names)
+                ]
+                ProductImage.objects.bulk_create(images)
+                schedule_variants(images)
+                sync_product_facets(products)
+        except Exception:
+            self.delete_images(copied)
+            raise
+
+        self.created += len(products)
@@ -0,0 +1,226 @@
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from shop.cache import bump_generation
+from shop.models import Inventory, InventoryShard, Product, StockReservation
+
+RESERVATION_TTL = getattr(settings, 'INVENTORY_RESERVATION_TTL', 15 * 60)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f'Not enough stock for products {sorted(product_ids)}.')
+        self.product_ids = sorted(product_ids)
+
+
+def seed_inventory(products):
+    # Products without an Inventory row start from Product.quantity.
+    Inventory.objects.bulk_create(
+        [Inventory(product_id=product.id, stock_quantity=max(product.quantity, 0)) for product in products],
+        ignore_conflicts=True,
+    )
+
+
+def _adjust(product_ids, quantities, sign):
+    return Case(*[
+        When(product_id=product_id, then=F('stock_quantity') + sign * quantities[product_id])
+        for product_id in product_ids
+    ])
+
+
+def _take_plain(quantities):
+    product_ids = sorted(quantities)
+    if len(product_ids) == 1:
+        # One row: a conditional decrement needs no separate lock.
+        product_id = product_ids[0]
+        taken = Inventory.objects.filter(
+            product_id=product_id, stock_quantity__gte=quantities[product_id],
+        ).update(stock_quantity=F('stock_quantity') - quantities[product_id])
+        return [] if taken else [product_id]
+
+    # Several rows are locked in product id order so overlapping carts
+    # always queue on the same row first instead of deadlocking.
+    rows = Inventory.objects.select_for_update().filter(product_id__in=product_ids).order_by('product_id')
+    stock = dict(rows.values_list('product_id', 'stock_quantity'))
+    short = [product_id for product_id in product_ids if stock[product_id] < quantities[product_id]]
+    if not short:
+        Inventory.objects.filter(product_id__in=product_ids).update(
+            stock_quantity=_adjust(product_ids, quantities, -1)
+        )
+    return short
+
+
+def _take_sharded(product_id, shards, quantity):
+    start = random.randrange(shards)
+    for offset in range(shards):
+        taken = InventoryShard.objects.filter(
+            product_id=product_id, shard=(start + offset) % shards, stock_quantity__gte=quantity,
+        ).update(stock_quantity=F('stock_quantity') - quantity)
+        if taken:
+            return True
+
+    # No single shard holds enough; drain them in shard order.
+    rows = list(InventoryShard.objects.select_for_update().filter(product_id=product_id).order_by('shard'))
+    if sum(row.stock_quantity for row in rows) < quantity:
+        return False
+    for row in rows:
+        used = min(row.stock_quantity, quantity)
+        row.stock_quantity -= used
+        quantity -= used
+    InventoryShard.objects.bulk_update(rows, ['stock_quantity'])
+    return True
+
+
+def take_stock(quantities):
+    # Must run inside the caller's transaction so a later failure puts the
+    # stock back.
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+
+    shards = dict(Inventory.objects.filter(product_id__in=quantities, shards__gt=0).values_list('product_id', 'shards'))
+    plain = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in shards}
+    short = _take_plain(plain) if plain else []
+    for product_id in sorted(shards):
+        if not _take_sharded(product_id, shards[product_id], quantities[product_id]):
+            short.append(product_id)
+    if short:
+        raise InsufficientStock(short)
+    # Product responses report live stock, so cached pages must go.
+    bump_generation('product')
+
+
+def return_stock(quantities):
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+
+    shards = dict(Inventory.objects.filter(product_id__in=quantities, shards__gt=0).values_list('product_id', 'shards'))
+    plain = sorted(product_id for product_id in quantities if product_id not in shards)
+    if plain:
+        Inventory.objects.filter(product_id__in=plain).update(stock_quantity=_adjust(plain, quantities, 1))
+    for product_id, count in shards.items():
+        InventoryShard.objects.filter(product_id=product_id, shard=random.randrange(count)).update(
+            stock_quantity=F('stock_quantity') + quantities[product_id]
+        )
+    bump_generation('product')
+
+
+def stock_levels(product_ids):
+    levels = dict(Inventory.objects.filter(product_id__in=product_ids, shards=0).values_list('product_id', 'stock_quantity'))
+    sharded = (
+        InventoryShard.objects.filter(product_id__in=product_ids)
+        .values_list('product_id')
+        .annotate(total=Sum('stock_quantity'))
+        .order_by()
+    )
+    levels.update(sharded)
+    return levels
+
+
+def with_stock(queryset):
+    # Annotates each product's live stock in the same query: its shards'
+    # total when sharded, else its Inventory row, else the opening
+    # Product.quantity that has not been seeded yet.
+    shard_total = (
+        InventoryShard.objects.filter(product=OuterRef('pk'))
+        .values('product')
+        .annotate(total=Sum('stock_quantity'))
+        .values('total')
+    )
+    return queryset.annotate(stock=Coalesce(Subquery(shard_total), F('inventory__stock_quantity'), F('quantity')))
+
+
+def stock_level(product):
+    return with_stock(Product.objects.filter(pk=product.pk)).values_list('stock', flat=True).get()
+
+
+def adjust_stock(product, adjustment):
+    # Restocks (adjustment > 0) or writes off (adjustment < 0) a product and
+    # returns its new stock level. Write-offs never take stock below zero.
+    with transaction.atomic():
+        seed_inventory([product])
+        if adjustment > 0:
+            return_stock({product.id: adjustment})
+        else:
+            take_stock({product.id: -adjustment})
+    return stock_level(product)
+
+
+def shard_inventory(product_id, shards):
+    # Moves a product's stock into `shards` counters, or back onto the
+    # Inventory row when shards is 0.
+    with transaction.atomic():
+        inventory = Inventory.objects.select_for_update().get(product_id=product_id)
+        rows = InventoryShard.objects.select_for_update().filter(product_id=product_id).order_by('shard')
+        total = inventory.stock_quantity + sum(row.stock_quantity for row in rows)
+        InventoryShard.objects.filter(product_id=product_id).delete()
+
+        InventoryShard.objects.bulk_create([
+            InventoryShard(product_id=product_id, shard=shard, stock_quantity=total // shards + (shard < total % shards))
+            for shard in range(shards)
+        ])
+        inventory.stock_quantity = 0 if shards else total
+        inventory.shards = shards
+        inventory.save(update_fields=['stock_quantity', 'shards'])
+        bump_generation('product')
+    return total
+
+
+def consume_reservations(user, quantities):
+    # Turns the user's live holds into part of this purchase and returns
+    # what still has to come out of stock. Holds beyond what is bought go
+    # back to stock. Locking the rows keeps release_expired from returning
+    # the same units.
+    rows = list(
+        StockReservation.objects.select_for_update()
+        .filter(user=user, expires_at__gt=timezone.now())
+        .values_list('id', 'product_id', 'quantity')
+    )
+    if not rows:
+        return dict(quantities)
+
+    held = Counter()
+    for _, product_id, quantity in rows:
+        held[product_id] += quantity
+    StockReservation.objects.filter(id__in=[row_id for row_id, _, _ in rows]).delete()
+
+    return_stock({product_id: held[product_id] - quantities.get(product_id, 0) for product_id in held})
+    return {product_id: max(quantity - held[product_id], 0) for product_id, quantity in quantities.items()}
+
+
+def reserve(user, quantities, ttl=RESERVATION_TTL):
+    # Replaces the user's holds with `quantities` for `ttl` seconds.
+    with transaction.atomic():
+        take_stock(consume_reservations(user, quantities))
+        expires_at = timezone.now() + timedelta(seconds=ttl)
+        return StockReservation.objects.bulk_create([
+            StockReservation(user=user, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        ])
+
+
+def release_expired(batch_size=500):
+    with transaction.atomic():
+        rows = list(
+            StockReservation.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lte=timezone.now())
+            .order_by('id')
+            .values_list('id', 'product_id', 'quantity')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        quantities = Counter()
+        for _, product_id, quantity in rows:
+            quantities[product_id] += quantity
+        StockReservation.objects.filter(id__in=[row_id for row_id, _, _ in rows]).delete()
+        return_stock(quantities)
+    return len(rows)
@@ -0,0 +1,172 @@
+import asyncio
+import io
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import path
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from shop.views import (
+    AllCategoryAPIView,
+    AllProductAPIView,
+    AllSubCategoryAPIView,
+    AsyncAllCategoryAPIView,
+    AsyncAllProductAPIView,
+    AsyncAllSubCategoryAPIView,
+)
+
+VIEWS = {
+    'all-categories': (AllCategoryAPIView, AsyncAllCategoryAPIView),
+    'all-sub-categories': (AllSubCategoryAPIView, AsyncAllSubCategoryAPIView),
+    'all-products': (AllProductAPIView, AsyncAllProductAPIView),
+}
+
+# The command doubles as the URLconf so both variants of every view are
+# routable side by side while it runs.
+urlpatterns = [
+    route
+    for name, (sync_view, async_view) in VIEWS.items()
+    for route in (
+        path(f'sync/{name}/', sync_view.as_view()),
+        path(f'async/{name}/', async_view.as_view()),
+    )
+]
+
+
+def wsgi_environ(url, token):
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': url,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_AUTHORIZATION': f'Bearer {token}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def asgi_scope(url, token):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': url,
+        'raw_path': url.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare sync views under WSGI, sync views under ASGI and native async views on the catalog listings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', choices=list(VIEWS), default='all-products')
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--concurrency', type=int, default=1000, help='Requests in flight under ASGI.')
+        parser.add_argument('--threads', type=int, default=32, help='Worker threads under WSGI.')
+
+    def run_wsgi(self, url, token, requests, threads):
+        handler = WSGIHandler()
+        statuses = []
+
+        def call(_):
+            def start_response(status, headers, exc_info=None):
+                statuses.append(int(status.split()[0]))
+
+            response = handler(wsgi_environ(url, token), start_response)
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            start = time.perf_counter()
+            list(executor.map(call, range(requests)))
+            elapsed = time.perf_counter() - start
+        return elapsed, statuses
+
+    def run_asgi(self, url, token, requests, concurrency):
+        handler = ASGIHandler()
+        statuses = []
+
+        async def call(semaphore):
+            async with semaphore:
+                finished = asyncio.Event()
+                body_sent = False
+
+                async def receive():
+                    nonlocal body_sent
+                    if not body_sent:
+                        body_sent = True
+                        return {'type': 'http.request', 'body': b'', 'more_body': False}
+                    await finished.wait()
+                    return {'type': 'http.disconnect'}
+
+                async def send(message):
+                    if message['type'] == 'http.response.start':
+                        statuses.append(message['status'])
+                    elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                        finished.set()
+
+                await handler(asgi_scope(url, token), receive, send)
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+            start = time.perf_counter()
+            await asyncio.gather(*[call(semaphore) for _ in range(requests)])
+            return time.perf_counter() - start
+
+        return asyncio.run(main()), statuses
+
+    def report(self, label, elapsed, statuses, requests):
+        failed = sum(1 for status in statuses if status != 200)
+        self.stdout.write(
+            f'{label:<20} {requests / elapsed:8.0f} req/s  {elapsed * 1000 / requests:7.2f} ms/req  '
+            f'{failed} non-200 responses'
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(
+            email=f'bench-async-{uuid.uuid4().hex[:8]}@example.com',
+            password=None,
+            first_name='Bench',
+            last_name='Async',
+            phone_number=uuid.uuid4().hex[:15],
+        )
+        token = str(RefreshToken.for_user(user).access_token)
+        view, requests = options['view'], options['requests']
+
+        try:
+            with override_settings(ROOT_URLCONF=__name__, ALLOWED_HOSTS=['testserver']):
+                elapsed, statuses = self.run_wsgi(f'/sync/{view}/', token, requests, options['threads'])
+                self.report('sync WSGI', elapsed, statuses, requests)
+
+                elapsed, statuses = self.run_asgi(f'/sync/{view}/', token, requests, options['concurrency'])
+                self.report('sync under ASGI', elapsed, statuses, requests)
+
+                elapsed, statuses = self.run_asgi(f'/async/{view}/', token, requests, options['concurrency'])
+                self.report('native async', elapsed, statuses, requests)
+        finally:
+            user.delete()
@@ -0,0 +1,69 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ecommerce import ids
+from ecommerce.benchmarks import throwaway_database
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Measure product inserts/sec under parallel writers for each id allocator.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--inserts', type=int, default=500, help='Inserts per writer.')
+        parser.add_argument('--allocators', nargs='+', default=['RandomIdAllocator', 'SequenceIdAllocator'])
+
+    def write(self, prefix, writer, inserts, errors):
+        try:
+            for i in range(inserts):
+                Product.objects.create(
+                    name=f'{prefix}-{writer}-{i}',
+                    description='Benchmark product',
+                    regular_price='10.00',
+                    sale_price='10.00',
+                )
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    def run(self, allocator, writers, inserts):
+        prefix = f'bench-ids-{uuid.uuid4().hex[:8]}'
+        errors = []
+        threads = [
+            threading.Thread(target=self.write, args=(prefix, writer, inserts, errors))
+            for writer in range(writers)
+        ]
+
+        previous, ids._allocator = ids._allocator, allocator
+        try:
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            ids._allocator = previous
+
+        products = Product.objects.filter(name__startswith=prefix)
+        created = products.count()
+        unique = products.values('product_id').distinct().count()
+        return created, unique, elapsed, errors
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            for name in options['allocators']:
+                allocator = getattr(ids, name)()
+                created, unique, elapsed, errors = self.run(allocator, options['writers'], options['inserts'])
+                self.stdout.write(
+                    f'{name:>20}: {created} inserts ({unique} unique ids) by {options["writers"]} writers '
+                    f'in {elapsed:.2f}s, {created / elapsed:.0f} inserts/sec, {len(errors)} failed writers'
+                )
+                for exc in errors[:3]:
+                    self.stderr.write(f'  {type(exc).__name__}: {exc}')
@@ -0,0 +1,78 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from ecommerce.benchmarks import throwaway_database
+from shop.inventory import InsufficientStock, shard_inventory, stock_levels, take_stock
+from shop.models import Inventory, Product
+
+
+class Command(BaseCommand):
+    help = 'Measure checkouts/sec of parallel buyers against a single hot product.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=16)
+        parser.add_argument('--purchases', type=int, default=200, help='Purchases per buyer.')
+        parser.add_argument('--shards', type=int, nargs='+', default=[0, 8])
+        parser.add_argument(
+            '--hold', type=float, default=0.002,
+            help='Seconds each purchase keeps its transaction open after taking stock.',
+        )
+
+    def buy(self, product_id, purchases, hold, results, errors):
+        try:
+            for _ in range(purchases):
+                try:
+                    with transaction.atomic():
+                        take_stock({product_id: 1})
+                        # Stands in for the rest of the checkout transaction.
+                        time.sleep(hold)
+                    results.append(True)
+                except InsufficientStock:
+                    results.append(False)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    def run(self, shards, buyers, purchases, hold):
+        product = Product.objects.create(
+            name=f'bench-inventory-{uuid.uuid4().hex[:8]}',
+            description='Benchmark product',
+            regular_price='10.00',
+            sale_price='10.00',
+        )
+        stock = buyers * purchases
+        Inventory.objects.create(product=product, stock_quantity=stock)
+        if shards:
+            shard_inventory(product.id, shards)
+
+        results, errors = [], []
+        threads = [
+            threading.Thread(target=self.buy, args=(product.id, purchases, hold, results, errors))
+            for _ in range(buyers)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        left = stock_levels([product.id]).get(product.id, 0)
+        return results.count(True), left, stock, elapsed, errors
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            for shards in options['shards']:
+                sold, left, stock, elapsed, errors = self.run(
+                    shards, options['buyers'], options['purchases'], options['hold'],
+                )
+                self.stdout.write(
+                    f'{shards:>3} shards: {sold} sold, {left} left of {stock} by {options["buyers"]} buyers '
+                    f'in {elapsed:.2f}s, {sold / elapsed:.0f} checkouts/sec, {len(errors)} failed buyers'
+                )
+                for exc in errors[:3]:
+                    self.stderr.write(f'  {type(exc).__name__}: {exc}')
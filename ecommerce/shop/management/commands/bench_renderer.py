@@ -0,0 +1,177 @@
+import copy
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework import renderers
+
+from ecommerce.renderers import CustomRenderer
+
+
+class LegacyCustomRenderer(renderers.JSONRenderer):
+    # The renderer as it was before the structured rewrite, minus its debug
+    # print, kept only as the benchmark baseline.
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+
+        response = {}
+
+        response['status'] = True
+        response['message'] = data.get('message', 'Request was successful.')
+        response['status_code'] = data.get('status_code', 200)
+        for key in ['message', 'status_code']:
+            data.pop(key, None)
+        response['data'] = data
+        
+        if isinstance(data, dict):
+            if 'errors' in data and 'ErrorDetail' not in str(data):
+                response['status'] = False
+                response['status_code'] = data['errors'].get('status_code')
+                response['message'] = 'An error occurred'
+                errors = data['errors'].copy() 
+                if 'status_code' in errors:
+                    del errors['status_code']
+                
+                response['errors'] = errors
+                response['data'] = None
+
+    
+            elif 'errors' in data and 'ErrorDetail' in str(data) and 'invalid' not in str(data) and 'unique' not in str(data):
+                response['status'] = False
+                response['status_code'] = data.get('status_code', 400)
+                response['message'] = 'An error occurred'
+                error_details = {}
+                for field, errors in data['errors'].items():
+                    if isinstance(errors, list) and errors:
+                        error_details[field] = f"{field.replace('_', ' ').capitalize()} is required."
+                    else:
+                        error_details[field] = f"{field.replace('_', ' ').capitalize()} is required."
+                    
+                response['errors'] = error_details
+                response['data'] = None
+
+            elif 'errors' in data and 'ErrorDetail' in str(data) and 'unique' in str(data):
+                response['status'] = False
+                response['status_code'] = data.get('status_code', 400)
+                response['message'] = 'An error occurred'
+                error_details = {}
+                for field, errors in data['errors'].items():
+                    if isinstance(errors, list) and errors:
+                        error_details[field] = f"{errors[0]}"
+                    else:
+                        error_details[field] = f"{str(errors)}"
+
+                response['errors'] = error_details
+                response['data'] = None
+            
+            elif 'errors' in data and 'ErrorDetail' in str(data) and 'invalid' in str(data):
+                response['status'] = False
+                response['status_code'] = data.get('status_code', 400)
+                response['message'] = 'An error occurred'
+                error_details = {}
+                for field, errors in data['errors'].items():
+                    if isinstance(errors, list) and errors:
+                        error_details[field] = f"{errors[0]}"
+                    else:
+                        error_details[field] = f"{str(errors)}"
+
+                response['errors'] = error_details
+                response['data'] = None
+
+            elif 'detail' in data and 'Authentication' in str(data):
+                response['status'] = False
+                response['message'] = 'A detailed error occurred.'
+                response['status_code'] = data.get('status_code', 401)
+                response['data'] = None
+                response['errors'] = data.get('detail', 'A detailed error occurred.')
+            
+            elif 'detail' in data and 'Authorization' in str(data):
+                response['status'] = False
+                response['message'] = 'A detailed error occurred.'
+                response['status_code'] = data.get('status_code', 401)
+                response['data'] = None
+                response['errors'] = data.get('detail', 'A detailed error occurred.')
+            
+            elif 'detail' in data and 'ErrorDetail' in str(data) and 'authentication_failed' in str(data):
+                response['status'] = False
+                response['message'] = 'A detailed error occurred.'
+                response['status_code'] = data.get('status_code', 404)
+                response['data'] = None
+                response['errors'] = data.get('detail', 'A detailed error occurred.')
+
+        
+        return json.dumps(response, ensure_ascii=False)
+
+
+
+def product_payload(count):
+    category = {
+        'id': 1, 'name': 'Shoes', 'slug': 'shoes', 'description': 'All shoes',
+        'image': None, 'status': True, 'created_at': '2024-09-10T11:28:00Z',
+        'updated_at': '2024-09-10T11:28:00Z', 'deleted': False,
+    }
+    products = [
+        {
+            'id': i,
+            'images': [{'id': i * 2, 'image': f'/media/products/{i}-a.jpg'}, {'id': i * 2 + 1, 'image': f'/media/products/{i}-b.jpg'}],
+            'category': category,
+            'sub_category': {**category, 'id': 2, 'name': 'Sneakers', 'slug': 'sneakers', 'category': category},
+            'product_id': str(10000000 + i),
+            'name': f'Product {i}',
+            'slug': f'product-{i}',
+            'description': 'Lightweight running shoe with a breathable mesh upper.',
+            'regular_price': '120.00',
+            'sale_price': '99.00',
+            'sizes': ['7', '8', '9', '10'],
+            'colors': ['black', 'white'],
+            'gender': 'unisex',
+            'product_code': f'PC-{i}',
+            'product_sku': f'SKU-{i}',
+            'tags': ['running', 'sport'],
+            'quantity': 25,
+            'status': True,
+            'created_at': '2024-09-10T11:28:00Z',
+            'updated_at': '2024-09-10T11:28:00Z',
+            'deleted': False,
+        }
+        for i in range(count)
+    ]
+    return {
+        'Products_data': products,
+        'message': 'Products retrieved successfully.',
+        'status_code': 200,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare CustomRenderer against the legacy renderer on product list payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[20, 10000])
+        parser.add_argument('--repeat', type=int, default=0, help='Renders per size (default scales with payload size).')
+
+    def time_renderer(self, renderer, payload, repeat):
+        # The renderer pops keys off its input, so every run gets a fresh copy
+        # and the copying is kept out of the measurement.
+        payloads = [copy.deepcopy(payload) for _ in range(repeat)]
+        start = time.perf_counter()
+        for data in payloads:
+            renderer.render(data)
+        return (time.perf_counter() - start) / repeat
+
+    def handle(self, *args, **options):
+        legacy, current = LegacyCustomRenderer(), CustomRenderer()
+
+        for size in options['sizes']:
+            payload = product_payload(size)
+            repeat = options['repeat'] or max(3, 20000 // size)
+
+            legacy_time = self.time_renderer(legacy, payload, repeat)
+            current_time = self.time_renderer(current, payload, repeat)
+
+            self.stdout.write(
+                f'{size:>6} items: legacy {legacy_time * 1000:8.3f} ms  '
+                f'current {current_time * 1000:8.3f} ms  '
+                f'speedup {legacy_time / current_time:5.1f}x'
+            )
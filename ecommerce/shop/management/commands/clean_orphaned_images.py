@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.images import variant_paths
+from shop.models import Order, ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Delete files under products/ that no product image or order references.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Only delete files older than this many seconds, so uploads still in flight are left alone.',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def walk(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield f'{directory}/{name}'
+        for name in directories:
+            yield from self.walk(storage, f'{directory}/{name}')
+
+    def handle(self, *args, **options):
+        storage = ProductImage._meta.get_field('image').storage
+        if not storage.exists('products'):
+            return
+
+        referenced = set(ProductImage.objects.values_list('image', flat=True))
+        for variants in ProductImage.objects.exclude(variants={}).values_list('variants', flat=True).iterator():
+            referenced.update(variant_paths(variants))
+        referenced.update(Order.objects.exclude(thumbnail='').values_list('thumbnail', flat=True))
+
+        cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        orphaned = [
+            name for name in self.walk(storage, 'products')
+            if name not in referenced and storage.get_modified_time(name) <= cutoff
+        ]
+        # Content-addressed files share their bytes with every other link to
+        # the same blob; only links that are the last of their blob free any.
+        if hasattr(storage, 'reclaimable_size'):
+            freed = storage.reclaimable_size(orphaned)
+        else:
+            freed = sum(storage.size(name) for name in orphaned)
+        if not options['dry_run']:
+            for name in orphaned:
+                storage.delete(name)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(orphaned)} orphaned files ({freed / 1024 / 1024:.1f} MiB).'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by expired reservations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--interval', type=float,
+            help='Keep running and release every INTERVAL seconds instead of once.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = 0
+            while True:
+                batch = release_expired(batch_size=options['batch_size'])
+                released += batch
+                if batch < options['batch_size']:
+                    break
+            if released or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations.'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
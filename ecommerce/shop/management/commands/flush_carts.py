@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.carts import CART_FLUSH_BATCH_SIZE, flush_carts
+
+
+class Command(BaseCommand):
+    help = 'Write carts changed in the cart store back to the Cart and CartItem tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CART_FLUSH_BATCH_SIZE)
+        parser.add_argument(
+            '--interval', type=float,
+            help='Keep running and flush every INTERVAL seconds instead of once.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_carts(batch_size=options['batch_size'])
+            if flushed or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} carts.'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from shop.images import generate_variants
+from shop.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Backfill resized and WebP variants for product images that have none.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--all', action='store_true', help='Regenerate variants for every image.')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.filter(deleted=False).exclude(image='').order_by('id')
+        if not options['all']:
+            images = images.filter(variants={})
+
+        generated = failed = last_id = 0
+        while True:
+            batch = list(images.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            batch_generated, batch_failed = generate_variants(batch)
+            generated += batch_generated
+            failed += batch_failed
+            last_id = batch[-1].id
+            self.stdout.write(f'{generated} generated, {failed} failed')
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {generated} images, {failed} failed.'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.importers import IMPORT_FORMATS, ProductImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or NDJSON product file into the catalog with batched inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--images-dir', help='Directory that image paths in the file are relative to.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['path'])
+        importer = ProductImporter(batch_size=options['batch_size'], images_dir=options['images_dir'])
+
+        try:
+            with open(options['path'], 'rb') as source:
+                report = importer.run(read_rows(source, file_format))
+        except OSError as exc:
+            raise CommandError(f'Could not import {options["path"]}: {exc}')
+
+        for error in report['errors']:
+            self.stderr.write(f'row {error["row"]}: {error["errors"]}')
+        if report['file_error']:
+            self.stderr.write(
+                f'Stopped reading at row {report["file_error"]["row"]}: {report["file_error"]["error"]}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report["created"]} of {report["rows"]} rows '
+            f'({report["failed"]} failed) in {report["elapsed_seconds"]}s, '
+            f'{report["rows_per_second"]} rows/sec.'
+        ))
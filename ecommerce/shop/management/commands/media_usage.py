@@ -0,0 +1,58 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.storage import ContentAddressedStorage, get_upload_stats
+
+UPLOAD_DIRECTORIES = ('products', 'category_images', 'subcategories')
+
+
+def mib(size):
+    return f'{size / 1024 / 1024:.1f} MiB'
+
+
+class Command(BaseCommand):
+    help = 'Report disk space saved by the content-addressed media storage and bytes written per upload.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dedupe', action='store_true',
+            help='First link files stored before content addressing to their blobs.',
+        )
+        parser.add_argument('--collect-garbage', action='store_true', help='Remove blobs no file uses any more.')
+
+    def walk(self, directory):
+        directories, files = default_storage.listdir(directory)
+        for name in files:
+            yield f'{directory}/{name}'
+        for name in directories:
+            yield from self.walk(f'{directory}/{name}')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError('The default storage is not ContentAddressedStorage.')
+
+        if options['dedupe']:
+            freed = files = 0
+            for directory in UPLOAD_DIRECTORIES:
+                if default_storage.exists(directory):
+                    for name in self.walk(directory):
+                        freed += default_storage.deduplicate(name)
+                        files += 1
+            self.stdout.write(f'Checked {files} files, freed {mib(freed)}.')
+
+        if options['collect_garbage']:
+            self.stdout.write(f'Removed {default_storage.collect_garbage()} orphaned blobs.')
+
+        usage = default_storage.usage()
+        self.stdout.write(
+            f'{usage["files"]} files in {usage["blobs"]} blobs: {mib(usage["logical_bytes"])} stored as '
+            f'{mib(usage["stored_bytes"])}, {mib(usage["saved_bytes"])} saved '
+            f'({usage["orphaned_blobs"]} orphaned blobs).'
+        )
+
+        stats = get_upload_stats()
+        if stats['uploads']:
+            self.stdout.write(
+                f'{stats["uploads"]} uploads: {stats["bytes_received"] / stats["uploads"]:.0f} bytes received '
+                f'and {stats["bytes_written"] / stats["uploads"]:.0f} bytes written per upload.'
+            )
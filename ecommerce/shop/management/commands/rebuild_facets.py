@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from shop.cache import bump_generation
+from shop.facets import rebuild_facets
+from shop.models import FacetCount, ProductFacetValue
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product facet values and facet counts from the product table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuild_facets(batch_size=options['batch_size'])
+        bump_generation('product')
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {ProductFacetValue.objects.count()} facet values '
+            f'across {FacetCount.objects.count()} facet counts.'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.inventory import seed_inventory, shard_inventory
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Spread a hot product's stock over several counters, or collapse it back with --shards 0."
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug')
+        parser.add_argument('--shards', type=int, default=8)
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shards'] <= 256:
+            raise CommandError('--shards must be between 0 and 256.')
+        product = Product.objects.filter(slug=options['slug']).first()
+        if product is None:
+            raise CommandError(f'Product {options["slug"]} not found.')
+
+        seed_inventory([product])
+        total = shard_inventory(product.id, options['shards'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{product.name}: {total} items in stock across {options["shards"] or 1} counters.'
+        ))
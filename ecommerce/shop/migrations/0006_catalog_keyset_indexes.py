@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-18 16:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_alter_product_colors_alter_product_sizes_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['deleted', 'created_at', 'id'], name='category_deleted_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['deleted', 'created_at', 'id'], name='product_deleted_created'),
+        ),
+        migrations.AddIndex(
+            model_name='subcategory',
+            index=models.Index(fields=['deleted', 'created_at', 'id'], name='subcategory_deleted_created'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1 on 2026-10-18 16:43
+
+import json
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+LIST_FIELDS = ('sizes', 'colors', 'tags')
+
+
+def as_list(value):
+    # Values written as json.dumps(list) were stored as JSON strings.
+    try:
+        value = json.loads(value)
+    except ValueError:
+        value = value.split(',')
+    if not isinstance(value, list):
+        value = [value]
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def normalize_json_lists(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    batch = []
+    for product in Product.objects.only('id', *LIST_FIELDS).iterator(chunk_size=1000):
+        changed = False
+        for field in LIST_FIELDS:
+            value = getattr(product, field)
+            if isinstance(value, str):
+                setattr(product, field, as_list(value))
+                changed = True
+        if changed:
+            batch.append(product)
+        if len(batch) >= 1000:
+            Product.objects.bulk_update(batch, LIST_FIELDS)
+            batch = []
+    Product.objects.bulk_update(batch, LIST_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_product_facets'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_json_lists, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['sizes'], name='product_sizes_gin', opclasses=['jsonb_path_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['colors'], name='product_colors_gin', opclasses=['jsonb_path_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tags'], name='product_tags_gin', opclasses=['jsonb_path_ops']),
+        ),
+    ]
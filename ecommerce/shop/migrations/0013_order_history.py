@@ -0,0 +1,52 @@
+# Generated by Django 5.1 on 2026-10-18 16:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_summaries(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    ProductImage = apps.get_model('shop', 'ProductImage')
+
+    item_count = (
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    first_product = OrderItem.objects.filter(order=OuterRef(OuterRef('pk'))).order_by('id').values('product')[:1]
+    thumbnail = (
+        ProductImage.objects.filter(product=Subquery(first_product), deleted=False)
+        .order_by('id')
+        .values('image')[:1]
+    )
+    Order.objects.update(item_count=Coalesce(Subquery(item_count), 0), thumbnail=Subquery(thumbnail))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_inventory_reservations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='products/'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created'),
+        ),
+        migrations.RunPython(backfill_order_summaries, migrations.RunPython.noop),
+    ]
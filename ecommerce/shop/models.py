@@ -1,10 +1,25 @@
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from accounts.models import User
-from django.utils.text import slugify
-import uuid
-from datetime import datetime
-import random
+from ecommerce.ids import next_id
+from shop.cache import bump_generation
+from shop.slugs import allocate_slug
+
+class SlugCounter(models.Model):
+    scope = models.CharField(max_length=100)
+    base = models.CharField(max_length=255)
+    last = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'base'], name='unique_slug_counter'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}:{self.base} ({self.last})'
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -16,10 +31,16 @@ class Category(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     deleted = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted', 'created_at', 'id'], name='category_deleted_created'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = allocate_slug(type(self), self.name)
         super(Category, self).save(*args, **kwargs)
+        bump_generation('category')
 
     def __str__(self):
         return self.name
@@ -35,10 +56,16 @@ class SubCategory(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     deleted = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted', 'created_at', 'id'], name='subcategory_deleted_created'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = allocate_slug(type(self), self.name)
         super(SubCategory, self).save(*args, **kwargs)
+        bump_generation('subcategory')
 
     def __str__(self):
         return f"{self.category.name} - {self.name}"
@@ -64,28 +91,80 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     deleted = models.BooleanField(default=False)
+    # Maintained by the shop_product_search_vector trigger (migration 0007).
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted', 'created_at', 'id'], name='product_deleted_created'),
+            GinIndex(fields=['search_vector'], name='product_search_vector'),
+            GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['sizes'], name='product_sizes_gin', opclasses=['jsonb_path_ops']),
+            GinIndex(fields=['colors'], name='product_colors_gin', opclasses=['jsonb_path_ops']),
+            GinIndex(fields=['tags'], name='product_tags_gin', opclasses=['jsonb_path_ops']),
+        ]
 
     def generate_unique_id(self):
-        while True:
-            product_id = random.randint(10000000, 99999999)
-            if not Product.objects.filter(product_id=product_id).exists():
-                return product_id
+        return next_id('product')
             
     def save(self, *args, **kwargs):
         if not self.product_id:
             self.product_id = self.generate_unique_id()
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = allocate_slug(type(self), self.name)
         super(Product, self).save(*args, **kwargs)
+        from shop.facets import sync_product_facets
+        sync_product_facets([self])
+        bump_generation('product')
 
     def __str__(self):
         return self.name
 
 
+class ProductFacetValue(models.Model):
+    product = models.ForeignKey(Product, related_name='facet_values', on_delete=models.CASCADE)
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'facet', 'value'], name='unique_product_facet_value'),
+        ]
+        indexes = [
+            models.Index(fields=['facet', 'value', 'product'], name='facet_value_product'),
+        ]
+
+    def __str__(self):
+        return f'{self.facet}={self.value} for {self.product_id}'
+
+
+class FacetCount(models.Model):
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='unique_facet_count'),
+        ]
+
+    def __str__(self):
+        return f'{self.facet}={self.value}: {self.count}'
+
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/')
     deleted = models.BooleanField(default=False)
+    # Resized and WebP copies, filled in by shop.images:
+    # {name: {'width': ..., 'height': ..., 'jpg'|'png'|'webp': storage name}}
+    variants = models.JSONField(default=dict, blank=True)
+    position = models.PositiveIntegerField(default=0)
+    # sha256 of the original, so re-uploading the same file is a no-op.
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        ordering = ['position', 'id']
 
     def __str__(self):
         return f'Image for {self.product.name}'
@@ -98,17 +177,17 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=50, choices=[('Pending', 'Pending'), ('Shipped', 'Shipped'), ('Delivered', 'Delivered'), ('Canceled', 'Canceled')], default='Pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # Denormalized at checkout so order history needs no item joins.
+    item_count = models.PositiveIntegerField(default=0)
+    thumbnail = models.ImageField(upload_to='products/', null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created'),
+        ]
 
     def generate_order_id(self):
-        date_str = datetime.now().strftime('%Y%m%d')
-        unique_number = str(uuid.uuid4().int)[:5]
-        order_id = f'ORD-{date_str}-{unique_number}'
-
-        if not Order.objects.filter(order_id=order_id).exists():
-            return order_id
-        
-        return self.generate_order_id()
+        return next_id('order')
 
     def save(self, *args, **kwargs):
         if not self.order_id:
@@ -116,7 +195,7 @@ class Order(models.Model):
         super(Order, self).save(*args, **kwargs)
 
     def __str__(self):
-        return f'Order {self.id} by {self.user.email}'
+        return f'Order {self.order_id}'
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -135,17 +214,45 @@ class Payment(models.Model):
     status = models.CharField(max_length=50, choices=[('Pending', 'Pending'), ('Completed', 'Completed'), ('Failed', 'Failed')], default='Pending')
 
     def __str__(self):
-        return f'Payment for Order {self.order.id}'
+        return f'Payment for Order {self.order_id}'
     
 
 class Inventory(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE)
     stock_quantity = models.PositiveIntegerField(default=0)
+    # When set, stock lives in this many InventoryShard rows instead of
+    # stock_quantity, so hot products don't serialize on one row lock.
+    shards = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return f'{self.product.name} - {self.stock_quantity} items in stock'
 
 
+class InventoryShard(models.Model):
+    product = models.ForeignKey(Product, related_name='inventory_shards', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    stock_quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='unique_inventory_shard'),
+        ]
+
+    def __str__(self):
+        return f'{self.product.name} shard {self.shard} - {self.stock_quantity} items in stock'
+
+
+class StockReservation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product.name} held for {self.user.email}'
+
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -174,5 +281,5 @@ class Shipping(models.Model):
     status = models.CharField(max_length=50, choices=[('Pending', 'Pending'), ('Shipped', 'Shipped'), ('Delivered', 'Delivered')], default='Pending')
 
     def __str__(self):
-        return f'Shipping for Order {self.order.id}'
+        return f'Shipping for Order {self.order_id}'
 
@@ -0,0 +1,16 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import F, Q
+
+SEARCH_CONFIG = 'english'
+
+
+def search_products(queryset, q):
+    # One query: full-text matches, ranked first, plus names within trigram
+    # similarity of q so typos still find something. Postgres combines the
+    # product_search_vector and product_name_trgm indexes for the OR.
+    query = SearchQuery(q, config=SEARCH_CONFIG, search_type='websearch')
+    return (
+        queryset.filter(Q(search_vector=query) | Q(name__trigram_similar=q))
+        .annotate(rank=SearchRank(F('search_vector'), query), similarity=TrigramSimilarity('name', q))
+        .order_by(F('rank').desc(nulls_last=True), '-similarity', 'id')
+    )
@@ -1,8 +1,38 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from shop.models import *
+from shop.images import update_product_images
+from shop.inventory import seed_inventory, stock_level, with_stock
+from shop.imaging import ENCODERS
 
+CART_MAX_QUANTITY = 1000
 
-class CategorySerializer(serializers.ModelSerializer):
+
+class EagerLoadingMixin:
+    # Relations the serializer reads, and columns it never does, declared so
+    # list views can plan the queryset up front instead of issuing one query
+    # per row.
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    deferred_fields = ()
+
+    @classmethod
+    def get_prefetch_related(cls):
+        return list(cls.prefetch_related_fields)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        prefetch_related = cls.get_prefetch_related()
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if cls.deferred_fields:
+            queryset = queryset.defer(*cls.deferred_fields)
+        return queryset
+
+
+class CategorySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
@@ -16,8 +46,11 @@ class SubCategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class GetSubCategorySerializer(serializers.ModelSerializer):
+class GetSubCategorySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
+
+    select_related_fields = ('category',)
+
     class Meta:
         model = SubCategory
         fields = '__all__'
@@ -26,7 +59,32 @@ class GetSubCategorySerializer(serializers.ModelSerializer):
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'variants']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+
+        # Variants smallest first, as URLs, plus srcset strings the client
+        # can hand to <img>/<source> directly.
+        url = instance.image.storage.url
+        variants, srcset, webp_srcset = {}, [], []
+        for name, variant in sorted(instance.variants.items(), key=lambda item: item[1]['width']):
+            variants[name] = {
+                key: url(value) if key in ENCODERS else value for key, value in variant.items()
+            }
+            width = variant['width']
+            for extension in ('jpg', 'png'):
+                if extension in variant:
+                    srcset.append(f'{variants[name][extension]} {width}w')
+            if 'webp' in variant:
+                webp_srcset.append(f'{variants[name]["webp"]} {width}w')
+        if 'original' in variants and data['image']:
+            srcset.append(f'{data["image"]} {variants["original"]["width"]}w')
+
+        data['variants'] = variants
+        data['srcset'] = ', '.join(srcset)
+        data['webp_srcset'] = ', '.join(webp_srcset)
+        return data
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -34,6 +92,16 @@ class ProductSerializer(serializers.ModelSerializer):
     uploaded_images = serializers.ListField(
         child=serializers.ImageField(), write_only=True, required=False
     )
+    # Image ids to keep, in display order, and to remove.
+    keep_images = serializers.ListField(
+        child=serializers.IntegerField(), write_only=True, required=False
+    )
+    remove_images = serializers.ListField(
+        child=serializers.IntegerField(), write_only=True, required=False
+    )
+    # Opening stock, accepted on create only. Stock then lives in Inventory
+    # and is changed through the product-stock endpoint.
+    quantity = serializers.IntegerField(min_value=0, required=False)
 
     class Meta:
         model = Product
@@ -41,40 +109,192 @@ class ProductSerializer(serializers.ModelSerializer):
             'id', 'product_id', 'name', 'slug', 'description', 'regular_price',
             'sale_price', 'sizes', 'colors', 'category', 'sub_category',
             'gender', 'product_code', 'product_sku', 'tags', 'quantity', 'status',
-            'created_at', 'updated_at', 'images', 'uploaded_images'
+            'created_at', 'updated_at', 'images', 'uploaded_images', 'keep_images', 'remove_images'
         ]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['quantity'] = stock_level(instance)
+        return data
+
+    def validate(self, attrs):
+        image_ids = {*attrs.get('keep_images', ()), *attrs.get('remove_images', ())}
+        if image_ids:
+            known = set()
+            if self.instance is not None:
+                known = set(self.instance.images.filter(deleted=False).values_list('id', flat=True))
+            unknown = sorted(image_ids - known)
+            if unknown:
+                raise serializers.ValidationError(
+                    {'images': f'Unknown image ids: {", ".join(map(str, unknown))}.'}, code='invalid',
+                )
+        return attrs
+
     def create(self, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
+        validated_data.pop('keep_images', None)
+        validated_data.pop('remove_images', None)
         product = Product.objects.create(**validated_data)
-        
-        # Save multiple images
-        for image in uploaded_images:
-            ProductImage.objects.create(product=product, image=image)
+        seed_inventory([product])
+
+        update_product_images(product, uploaded_images)
         
         return product
 
     def update(self, instance, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
+        keep_images = validated_data.pop('keep_images', None)
+        remove_images = validated_data.pop('remove_images', [])
+        validated_data.pop('quantity', None)
         instance = super().update(instance, validated_data)
-        
-        if uploaded_images:
-            # Optionally delete old images
-            ProductImage.objects.filter(product=instance).delete()
 
-            # Save new images
-            for image in uploaded_images:
-                ProductImage.objects.create(product=instance, image=image)
+        if uploaded_images or keep_images is not None or remove_images:
+            if keep_images is None and not remove_images:
+                # A plain upload replaces the product's images.
+                keep_images = []
+            update_product_images(instance, uploaded_images, keep=keep_images, remove=set(remove_images))
 
         return instance
 
 
 
-class GetProductSerializer(serializers.ModelSerializer):
+class GetProductSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     category = CategorySerializer(read_only=True)
     sub_category = GetSubCategorySerializer(read_only=True)
 
+    quantity = serializers.IntegerField(source='stock', read_only=True)
+
+    select_related_fields = ('category', 'sub_category__category')
+    deferred_fields = ('search_vector',)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return with_stock(super().setup_eager_loading(queryset))
+
+    @classmethod
+    def get_prefetch_related(cls):
+        return [
+            Prefetch('images', queryset=ProductImage.objects.filter(deleted=False)),
+        ]
+
     class Meta:
         model = Product
-        fields = '__all__'
\ No newline at end of file
+        # The tsvector is an index column, not product data.
+        exclude = ['search_vector']
+
+
+class CommaSeparatedListField(serializers.CharField):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            return [str(item).strip() for item in data if str(item).strip()]
+        value = super().to_internal_value(data)
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    category = serializers.IntegerField(required=False)
+    sub_category = serializers.IntegerField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    sizes = CommaSeparatedListField(required=False)
+    colors = CommaSeparatedListField(required=False)
+    tags = CommaSeparatedListField(required=False)
+
+
+class ProductSearchSerializer(ProductFilterSerializer):
+    q = serializers.CharField(max_length=255)
+
+
+class ProductImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField()
+    regular_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    sale_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    # Category and subcategory are given by id or slug and resolved per batch.
+    category = serializers.CharField()
+    sub_category = serializers.CharField()
+    sizes = CommaSeparatedListField(required=False, allow_blank=True)
+    colors = CommaSeparatedListField(required=False, allow_blank=True)
+    tags = CommaSeparatedListField(required=False, allow_blank=True)
+    gender = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    product_code = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    product_sku = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    quantity = serializers.IntegerField(required=False, default=0)
+    status = serializers.BooleanField(required=False, default=True)
+    images = CommaSeparatedListField(required=False, allow_blank=True)
+
+
+class StockAdjustmentSerializer(serializers.Serializer):
+    # Units to add (restock) or remove (write-off) from a product's stock.
+    adjustment = serializers.IntegerField()
+
+    def validate_adjustment(self, value):
+        if value == 0:
+            raise serializers.ValidationError('Adjustment must not be zero.', code='invalid')
+        return value
+
+
+class CartQuantitySerializer(serializers.Serializer):
+    quantity = serializers.IntegerField()
+
+    def validate_quantity(self, value):
+        if not 1 <= value <= CART_MAX_QUANTITY:
+            raise serializers.ValidationError(f'Quantity must be between 1 and {CART_MAX_QUANTITY}.', code='invalid')
+        return value
+
+
+class CartItemSerializer(CartQuantitySerializer):
+    product = serializers.SlugField()
+    quantity = serializers.IntegerField(default=1)
+
+
+class CartLineSerializer(serializers.Serializer):
+    product_id = serializers.CharField(source='product.product_id')
+    slug = serializers.CharField(source='product.slug')
+    name = serializers.CharField(source='product.name')
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, source='product.sale_price')
+    quantity = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    payment_method = serializers.ChoiceField(choices=Payment._meta.get_field('payment_method').choices)
+    address = serializers.CharField()
+    city = serializers.CharField(max_length=100)
+    postal_code = serializers.CharField(max_length=20)
+    country = serializers.CharField(max_length=100)
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    product_id = serializers.CharField(source='product.product_id')
+    slug = serializers.CharField(source='product.slug')
+    name = serializers.CharField(source='product.name')
+
+    class Meta:
+        model = OrderItem
+        fields = ['product_id', 'slug', 'name', 'quantity', 'price']
+
+
+class PaymentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ['amount', 'payment_method', 'status', 'paid_at']
+
+
+class ShippingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Shipping
+        fields = ['address', 'city', 'postal_code', 'country', 'status', 'shipped_at']
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ['order_id', 'status', 'total_amount', 'created_at', 'updated_at']
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ['order_id', 'status', 'total_amount', 'item_count', 'thumbnail', 'created_at']
@@ -0,0 +1,118 @@
+import re
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils.text import slugify
+
+# Room left at the end of the slug field for a "-<n>" suffix.
+SUFFIX_RESERVE = 10
+
+NUMBERED_SLUG = re.compile(r'-\d+$')
+
+UPSERT_SQL = """
+INSERT INTO shop_slugcounter (scope, base, last) VALUES {values}
+ON CONFLICT (scope, base) DO UPDATE SET last = shop_slugcounter.last + EXCLUDED.last
+RETURNING base, last
+"""
+
+
+def _slug_counter():
+    return apps.get_model('shop', 'SlugCounter')
+
+
+def _base(model, name):
+    max_length = model._meta.get_field('slug').max_length - SUFFIX_RESERVE
+    return slugify(name)[:max_length].strip('-') or model._meta.model_name
+
+
+def _slug(base, number):
+    return base if number == 1 else f'{base}-{number}'
+
+
+def _seed_counters(model, scope, bases):
+    # Bases seen for the first time start after the highest slug already in
+    # the table, found with one prefix query served by the slug's LIKE index.
+    SlugCounter = _slug_counter()
+    known = set(SlugCounter.objects.filter(scope=scope, base__in=bases).values_list('base', flat=True))
+    new_bases = set(bases) - known
+    if not new_bases:
+        return
+
+    highest = dict.fromkeys(new_bases, 0)
+    patterns = {base: re.compile(rf'^{re.escape(base)}(?:-(\d+))?$') for base in new_bases}
+    existing = model.objects.filter(reduce(or_, (Q(slug__startswith=base) for base in new_bases)))
+    for slug in existing.values_list('slug', flat=True):
+        for base, pattern in patterns.items():
+            match = pattern.match(slug)
+            if match:
+                highest[base] = max(highest[base], int(match.group(1) or 1))
+
+    SlugCounter.objects.bulk_create(
+        [SlugCounter(scope=scope, base=base, last=last) for base, last in highest.items()],
+        ignore_conflicts=True,
+    )
+
+
+def _reserve(scope, needed):
+    # Atomically advances every base's counter by the number of slugs it
+    # needs and returns the new high-water marks.
+    if connection.vendor == 'postgresql':
+        values = ', '.join(['(%s, %s, %s)'] * len(needed))
+        params = [value for base, count in needed.items() for value in (scope, base, count)]
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_SQL.format(values=values), params)
+            return dict(cursor.fetchall())
+
+    SlugCounter = _slug_counter()
+    with transaction.atomic():
+        for base, count in needed.items():
+            SlugCounter.objects.filter(scope=scope, base=base).update(last=F('last') + count)
+        return dict(SlugCounter.objects.filter(scope=scope, base__in=needed).values_list('base', 'last'))
+
+
+def _counted_slugs(model, scope, names):
+    bases = [_base(model, name) for name in names]
+    needed = Counter(bases)
+
+    _seed_counters(model, scope, needed)
+    last = _reserve(scope, needed)
+
+    next_number = {base: last[base] - count + 1 for base, count in needed.items()}
+    slugs = []
+    for base in bases:
+        slugs.append(_slug(base, next_number[base]))
+        next_number[base] += 1
+    return slugs
+
+
+def allocate_slugs(model, names):
+    scope = model._meta.label_lower
+    slugs = _counted_slugs(model, scope, names)
+
+    # "shirt" #2 and a product literally named "Shirt 2" both want
+    # "shirt-2", whether the other one is already in the table or in the
+    # same batch. Only slugs ending in a number can clash across bases;
+    # the later of two clashing slugs takes its base's next number.
+    kept = set()
+    pending = list(range(len(slugs)))
+    while pending:
+        numbered = [slugs[i] for i in pending if NUMBERED_SLUG.search(slugs[i])]
+        taken = set(model.objects.filter(slug__in=numbered).values_list('slug', flat=True)) if numbered else set()
+        clashes = []
+        for i in pending:
+            if slugs[i] in taken or slugs[i] in kept:
+                clashes.append(i)
+            else:
+                kept.add(slugs[i])
+        for i, slug in zip(clashes, _counted_slugs(model, scope, [names[i] for i in clashes])):
+            slugs[i] = slug
+        pending = clashes
+    return slugs
+
+
+def allocate_slug(model, name):
+    return allocate_slugs(model, [name])[0]
@@ -1,3 +1,1452 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from PIL import Image
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.core.files.base import ContentFile
+from django.test import AsyncRequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.response import Response
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from ecommerce.ids import SCOPES, RandomIdAllocator, SequenceIdAllocator, format_id
+from ecommerce.pagination import CatalogPagination
+from ecommerce.renderers import CustomRenderer
+from ecommerce.storage import ContentAddressedStorage, get_upload_stats
+from ecommerce.streaming import STREAM_FORMATS, stream_queryset
+from shop.cache import get_stats
+from shop import carts
+from shop.carts import add_item, cart_store, flush_carts, get_items
+from shop.checkout import CheckoutError, checkout
+from shop.facets import sync_product_facets
+from shop.importers import ImportFileError, ProductImporter, read_rows
+from shop.images import delete_orphaned_files, generate_variants, update_product_images
+from shop.inventory import InsufficientStock, release_expired, reserve, shard_inventory, stock_levels, take_stock
+from shop.models import (
+    Category, SubCategory, Product, ProductImage, CartItem, FacetCount, Inventory, Order, OrderItem, ProductFacetValue,
+    StockReservation,
+)
+from shop.serializers import GetProductSerializer, ProductImageSerializer
+from shop.slugs import allocate_slugs
+from shop.views import AsyncAllCategoryAPIView, AsyncAllProductAPIView, AsyncAllSubCategoryAPIView
+
+
+class CatalogFixtureMixin:
+    def create_user(self, number=1):
+        return User.objects.create_user(
+            email=f'shopper{number}@example.com',
+            password='secret-pass-123',
+            first_name='Shop',
+            last_name='Per',
+            phone_number=f'555{number:04d}',
+        )
+
+    def create_catalog(self, count):
+        for i in range(count):
+            category = Category.objects.create(name=f'Category {i}')
+            sub_category = SubCategory.objects.create(category=category, name=f'Sub {i}')
+            product = Product.objects.create(
+                name=f'Product {i}',
+                description='A product',
+                regular_price='20.00',
+                sale_price='15.00',
+                category=category,
+                sub_category=sub_category,
+            )
+            ProductImage.objects.create(product=product, image=f'products/{i}-a.jpg')
+            ProductImage.objects.create(product=product, image=f'products/{i}-b.jpg')
+            ProductImage.objects.create(product=product, image=f'products/{i}-c.jpg', deleted=True)
+
+
+class RendererTests(SimpleTestCase):
+    def render(self, data, status_code=200):
+        context = {'response': Response(status=status_code)}
+        return json.loads(CustomRenderer().render(data, renderer_context=context))
+
+    def test_success_envelope(self):
+        self.assertEqual(self.render({'items': [1], 'message': 'Listed.', 'status_code': 201}), {
+            'status': True, 'message': 'Listed.', 'status_code': 201, 'data': {'items': [1]},
+        })
+        # Types orjson can't encode go through DRF's encoder.
+        self.assertEqual(self.render({'price': Decimal('9.50')}), {
+            'status': True, 'message': 'Request was successful.', 'status_code': 200, 'data': {'price': 9.5},
+        })
+
+    def test_non_dict_data(self):
+        self.assertEqual(self.render([1, 2]), {
+            'status': True, 'message': 'Request was successful.', 'status_code': 200, 'data': [1, 2],
+        })
+        self.assertEqual(CustomRenderer().render(None), b'')
+
+    def test_hand_built_errors_keep_their_status_code(self):
+        data = {'errors': {'name': 'A category with this name already exists.', 'status_code': 409}}
+        self.assertEqual(self.render(data, 409), {
+            'status': False, 'message': 'An error occurred', 'status_code': 409,
+            'errors': {'name': 'A category with this name already exists.'}, 'data': None,
+        })
+
+    def test_validation_errors_are_classified_by_code(self):
+        missing = {'name': [ErrorDetail('This field is required.', code='required')], 'sale_price': [ErrorDetail('This field is required.', code='required')]}
+        rendered = self.render({'errors': missing, 'status_code': 400}, 400)
+        self.assertEqual(rendered['errors'], {'name': 'Name is required.', 'sale_price': 'Sale price is required.'})
+        self.assertEqual((rendered['status'], rendered['status_code'], rendered['data']), (False, 400, None))
+
+        invalid = {
+            'email': [ErrorDetail('Enter a valid email address.', code='invalid')],
+            'name': [ErrorDetail('This field is required.', code='required')],
+        }
+        rendered = self.render({'errors': invalid}, 400)
+        self.assertEqual(rendered['errors'], {'email': 'Enter a valid email address.', 'name': 'This field is required.'})
+        self.assertEqual(rendered['status_code'], 400)
+
+        unique = {'slug': [ErrorDetail('product with this slug already exists.', code='unique')]}
+        self.assertEqual(self.render({'errors': unique}, 400)['errors'], {'slug': 'product with this slug already exists.'})
+
+    def test_detail_takes_the_response_status(self):
+        detail = ErrorDetail('Authentication credentials were not provided.', code='not_authenticated')
+        self.assertEqual(self.render({'detail': detail}, 401), {
+            'status': False, 'message': 'A detailed error occurred.', 'status_code': 401,
+            'errors': 'Authentication credentials were not provided.', 'data': None,
+        })
+        self.assertEqual(self.render({'detail': ErrorDetail('Not found.', code='not_found')}, 404)['status_code'], 404)
+        # A plain 'detail' key in a successful payload is just data.
+        self.assertTrue(self.render({'detail': 'Shipping details'})['status'])
+
+    def test_json_fallback_matches_orjson(self):
+        data = {'price': Decimal('9.50'), 'name': 'Café', 'message': 'Listed.'}
+        expected = self.render(dict(data))
+        with mock.patch('ecommerce.renderers.orjson', None):
+            self.assertEqual(self.render(dict(data)), expected)
+
+
+class CatalogQueryCountTests(CatalogFixtureMixin, APITestCase):
+    # Each endpoint must cost the same number of queries regardless of how
+    # many rows it returns, including the validator aggregate.
+    expected_queries = {
+        'categories': 3,
+        'all-categories': 2,
+        'sub-categories': 3,
+        'all-sub-categories': 2,
+        'products': 4,
+        'all-products': 3,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.create_user())
+
+    def assert_query_count(self, rows):
+        for url_name, expected in self.expected_queries.items():
+            with self.subTest(url_name=url_name, rows=rows):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(reverse(url_name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_query_count_with_single_row(self):
+        self.create_catalog(1)
+        self.assert_query_count(1)
+
+    def test_query_count_with_many_rows(self):
+        self.create_catalog(15)
+        self.assert_query_count(15)
+
+    def test_unchanged_list_returns_not_modified(self):
+        self.create_catalog(3)
+        for url_name in self.expected_queries:
+            with self.subTest(url_name=url_name):
+                response = self.client.get(reverse(url_name))
+                # The validators are cached with the payload.
+                with self.assertNumQueries(0):
+                    response = self.client.get(reverse(url_name), HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_cache_hits_carry_the_validators(self):
+        self.create_catalog(1)
+        miss = self.client.get(reverse('all-products'))
+        with self.assertNumQueries(0):
+            hit = self.client.get(reverse('all-products'))
+            not_modified = self.client.get(reverse('all-products'), HTTP_IF_MODIFIED_SINCE=miss['Last-Modified'])
+        self.assertEqual((hit['ETag'], hit['Last-Modified']), (miss['ETag'], miss['Last-Modified']))
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], miss['ETag'])
+
+    def test_last_modified_moves_when_the_newest_product_is_deleted(self):
+        self.create_catalog(2)
+        with mock.patch('shop.cache.time') as clock:
+            clock.time.return_value = 1_800_000_000
+            first = self.client.get(reverse('all-products'))
+
+            clock.time.return_value += 60
+            newest = Product.objects.latest('created_at')
+            newest.deleted = True
+            with self.captureOnCommitCallbacks(execute=True):
+                newest.save()
+            response = self.client.get(reverse('all-products'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']['Products_data']), 1)
+        self.assertGreater(parse_http_date(response['Last-Modified']), parse_http_date(first['Last-Modified']))
+
+    def test_soft_deleted_images_are_not_listed(self):
+        self.create_catalog(1)
+        response = self.client.get(reverse('all-products'))
+        products = response.json()['data']['Products_data']
+        self.assertEqual(len(products[0]['images']), 2)
+
+
+class ProductSearchTests(CatalogFixtureMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.create_user())
+        self.create_catalog(1)
+        self.product = Product.objects.get()
+
+    def create_product(self, name, description='A product', **fields):
+        return Product.objects.create(
+            name=name, description=description, regular_price='20.00', sale_price='15.00',
+            category=self.product.category, sub_category=self.product.sub_category, **fields,
+        )
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('product-search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']['results']['Products_data']
+
+    def test_listings_do_not_expose_the_search_vector(self):
+        responses = [
+            self.client.get(reverse('all-products')).json()['data']['Products_data'],
+            self.client.get(reverse('products')).json()['data']['results']['Products_data'],
+            json.loads(b''.join(self.client.get(reverse('all-products'), {'stream': 'json'}).streaming_content))['data']['Products_data'],
+        ]
+        for products in responses:
+            self.assertNotIn('search_vector', products[0])
+            self.assertIn('name', products[0])
+
+    def test_trigger_maintains_the_vector(self):
+        self.assertIsNotNone(Product.objects.values_list('search_vector', flat=True).get(pk=self.product.pk))
+        # Bulk updates skip save() but not the trigger.
+        Product.objects.filter(pk=self.product.pk).update(name='Waterproof hiking boot')
+        self.assertEqual([product['id'] for product in self.search('hiking')], [self.product.id])
+
+    def test_ranking_filters_and_typo_fallback(self):
+        in_name = self.create_product('Trail running shoe')
+        in_description = self.create_product('Sock', description='Made for running shoes.')
+        self.create_product('Raincoat', tags=['running'])
+
+        self.assertEqual([product['name'] for product in self.search('running shoe')], [in_name.name, in_description.name])
+        self.assertEqual([product['name'] for product in self.search('running', max_price='10.00')], [])
+        self.assertEqual(self.search('raincaot')[0]['name'], 'Raincoat')
+
+        # Count, page and images: the typo fallback costs no extra query.
+        cache.clear()
+        with self.assertNumQueries(3):
+            self.search('raincaot')
+
+    def test_search_pages_like_the_catalog(self):
+        for number in range(CatalogPagination.page_size):
+            self.create_product(f'Running shoe {number}')
+
+        # A cursor cannot seek on rank, so search ignores pagination=cursor.
+        response = self.client.get(reverse('product-search'), {'q': 'running', 'pagination': 'cursor'})
+        results = response.json()['data']['results']
+        self.assertEqual(len(results['Products_data']), CatalogPagination.page_size)
+        self.assertIn('page=2', response.json()['data']['next'])
+
+    def test_search_indexes(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Product._meta.db_table)
+        self.assertEqual(constraints['product_search_vector']['type'], 'gin')
+        self.assertEqual(constraints['product_name_trgm']['type'], 'gin')
+
+
+class FacetTests(CatalogFixtureMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.create_user())
+        self.category = Category.objects.create(name='Shoes')
+        self.sub_category = SubCategory.objects.create(category=self.category, name='Boots')
+        self.red_small = self.create_product('Red small', colors=['red'], sizes=['S'])
+        self.red_large = self.create_product('Red large', colors=['red'], sizes=['L'], sale_price='60.00')
+        self.blue_small = self.create_product('Blue small', colors=['blue'], sizes=['S'])
+
+    def create_product(self, name, sale_price='15.00', **fields):
+        return Product.objects.create(
+            name=name, description='A product', regular_price='80.00', sale_price=sale_price,
+            category=self.category, sub_category=self.sub_category, **fields,
+        )
+
+    def counts(self):
+        return {
+            (facet, value): count
+            for facet, value, count in FacetCount.objects.filter(count__gt=0).values_list('facet', 'value', 'count')
+        }
+
+    def get_facets(self, **params):
+        response = self.client.get(reverse('product-facets'), params)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['data']['results']
+        return sorted(product['name'] for product in results['Products_data']), results['facets']
+
+    def test_counts_follow_saves_and_deletes(self):
+        self.assertEqual(self.counts()[('colors', 'red')], 2)
+        self.assertEqual(self.counts()[('price', '0-25')], 2)
+
+        self.red_large.colors = ['blue']
+        self.red_large.save()
+        self.blue_small.deleted = True
+        self.blue_small.save()
+        counts = self.counts()
+        self.assertEqual((counts[('colors', 'red')], counts[('colors', 'blue')]), (1, 1))
+        self.assertEqual(counts[('category', str(self.category.id))], 2)
+        self.assertEqual(
+            set(ProductFacetValue.objects.filter(product=self.red_large).values_list('facet', 'value')),
+            {('category', str(self.category.id)), ('sub_category', str(self.sub_category.id)),
+             ('colors', 'blue'), ('sizes', 'L'), ('price', '50-100')},
+        )
+
+    def test_hard_deletes_decrement_counts(self):
+        self.red_large.delete()
+        Product.objects.filter(pk=self.blue_small.pk).delete()
+        counts = self.counts()
+        self.assertEqual(counts, {
+            ('category', str(self.category.id)): 1, ('sub_category', str(self.sub_category.id)): 1,
+            ('colors', 'red'): 1, ('sizes', 'S'): 1, ('price', '0-25'): 1,
+        })
+        # Unfiltered counts match what a filter finds.
+        _, facets = self.get_facets()
+        self.assertEqual(facets['colors'], {'red': 1})
+
+    def test_resaving_is_idempotent(self):
+        counts = self.counts()
+        self.red_small.save()
+        sync_product_facets([self.red_small, self.red_small])
+        self.assertEqual(self.counts(), counts)
+
+    def test_or_within_and_across_facets(self):
+        names, facets = self.get_facets()
+        self.assertEqual(facets['colors'], {'red': 2, 'blue': 1})
+
+        names, _ = self.get_facets(colors='red,blue')
+        self.assertEqual(names, ['Blue small', 'Red large', 'Red small'])
+        names, _ = self.get_facets(colors='red', sizes='S')
+        self.assertEqual(names, ['Red small'])
+
+    def test_counts_are_disjunctive(self):
+        _, facets = self.get_facets(colors='red')
+        # The selected facet keeps its other values; the rest narrow.
+        self.assertEqual(facets['colors'], {'red': 2, 'blue': 1})
+        self.assertEqual(facets['sizes'], {'S': 1, 'L': 1})
+
+        _, facets = self.get_facets(colors='red', sizes='S')
+        self.assertEqual(facets['colors'], {'red': 1, 'blue': 1})
+        self.assertEqual(facets['sizes'], {'S': 1, 'L': 1})
+        self.assertEqual(facets['price'], {'0-25': 1})
+
+    def test_rebuild_command(self):
+        FacetCount.objects.update(count=99)
+        ProductFacetValue.objects.filter(product=self.blue_small).delete()
+        call_command('rebuild_facets', stdout=io.StringIO())
+        self.assertEqual(self.counts()[('colors', 'red')], 2)
+        self.assertEqual(self.counts()[('colors', 'blue')], 1)
+        self.assertEqual(self.counts()[('sizes', 'S')], 2)
+
+
+class ProductListFieldTests(CatalogFixtureMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.create_user())
+        self.create_catalog(1)
+        self.product = Product.objects.get()
+
+    def post_product(self, name, data_format, **fields):
+        return self.client.post(reverse('product-create'), {
+            'name': name,
+            'description': 'A boot',
+            'regular_price': '20.00',
+            'sale_price': '15.00',
+            'category': self.product.category_id,
+            'sub_category': self.product.sub_category_id,
+            **fields,
+        }, format=data_format)
+
+    def test_comma_separated_input_is_stored_as_lists(self):
+        for data_format in ('multipart', 'json'):
+            with self.subTest(data_format=data_format):
+                response = self.post_product(f'Boot {data_format}', data_format, sizes='8, 9,,10', colors='black', tags='winter,hiking ')
+                self.assertEqual(response.status_code, 201)
+                product = Product.objects.get(name=f'Boot {data_format}')
+                self.assertEqual((product.sizes, product.colors, product.tags), (['8', '9', '10'], ['black'], ['winter', 'hiking']))
+
+    def test_json_arrays_are_kept(self):
+        response = self.post_product('Boot', 'json', sizes=['8', '9'], colors=[])
+        self.assertEqual(response.status_code, 201)
+        product = Product.objects.get(name='Boot')
+        self.assertEqual((product.sizes, product.colors), (['8', '9'], []))
+
+    def test_migration_normalizes_json_strings(self):
+        migration = importlib.import_module('shop.migrations.0009_normalize_product_json_lists')
+        self.assertEqual(migration.as_list('["S", " M ", ""]'), ['S', 'M'])
+        self.assertEqual(migration.as_list('red, blue'), ['red', 'blue'])
+        self.assertEqual(migration.as_list('"red"'), ['red'])
+
+        Product.objects.update(sizes=json.dumps(['S', 'M']), colors='red,blue', tags=['kept'])
+        migration.normalize_json_lists(apps, None)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.sizes, self.product.colors, self.product.tags), (['S', 'M'], ['red', 'blue'], ['kept']))
+
+    def test_containment_filters(self):
+        Product.objects.update(sizes=['S', 'M'], colors=['red'], tags=['winter'])
+        other = Product.objects.create(
+            name='Other', description='A product', regular_price='20.00', sale_price='15.00',
+            category=self.product.category, sub_category=self.product.sub_category,
+            sizes=['L'], colors=['red', 'blue'], tags=['summer'],
+        )
+
+        def names(**params):
+            response = self.client.get(reverse('all-products'), params)
+            return sorted(product['name'] for product in response.json()['data']['Products_data'])
+
+        self.assertEqual(names(sizes='M'), ['Product 0'])
+        self.assertEqual(names(sizes='M,L'), ['Other', 'Product 0'])
+        self.assertEqual(names(colors='red', tags='summer'), ['Other'])
+        self.assertEqual(names(colors='green'), [])
+        # Whole values only: 'S' is not contained in ['SM'].
+        Product.objects.filter(pk=other.pk).update(sizes=['SM'])
+        cache.clear()
+        self.assertEqual(names(sizes='S'), ['Product 0'])
+
+
+class KeysetPaginationTests(CatalogFixtureMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.create_user())
+        self.create_catalog(5)
+
+    def get_page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        return [category['name'] for category in data['results']['categories_data']], data['next'], data['previous']
+
+    def walk(self):
+        names, url, _ = self.get_page(reverse('categories'), {'pagination': 'cursor', 'page_size': 2})
+        pages = [names]
+        while url:
+            names, url, previous = self.get_page(url)
+            pages.append(names)
+        return pages, previous
+
+    def test_cursors_round_trip(self):
+        pages, previous = self.walk()
+        self.assertEqual(pages, [['Category 0', 'Category 1'], ['Category 2', 'Category 3'], ['Category 4']])
+
+        names, _, previous = self.get_page(previous)
+        self.assertEqual(names, ['Category 2', 'Category 3'])
+        names, _, previous = self.get_page(previous)
+        self.assertEqual(names, ['Category 0', 'Category 1'])
+        self.assertIsNone(previous)
+
+    def test_ties_on_the_ordering_key(self):
+        Category.objects.update(created_at=timezone.now())
+        pages, _ = self.walk()
+        names = [name for page in pages for name in page]
+        self.assertEqual(names, [f'Category {i}' for i in range(5)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('categories'), {'pagination': 'cursor', 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.json()['status'])
+        self.assertEqual(response.json()['errors'], 'Invalid cursor')
+
+
+class StreamingExportTests(CatalogFixtureMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.create_user())
+        self.create_catalog(5)
+
+    def stream(self, url_name, stream_format):
+        response = self.client.get(reverse(url_name), {'stream': stream_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response['Content-Type'], b''.join(response.streaming_content)
+
+    def test_json_export_matches_the_listing(self):
+        content_type, content = self.stream('all-products', 'json')
+        self.assertEqual(content_type, 'application/json; charset=utf-8')
+        data = json.loads(content)
+        self.assertEqual(data['status_code'], 200)
+        self.assertEqual(data['message'], 'Products retrieved successfully.')
+        listed = self.client.get(reverse('all-products')).json()['data']['Products_data']
+        self.assertEqual(data['data']['Products_data'], sorted(listed, key=lambda product: product['id']))
+
+    def test_ndjson_export_is_one_item_per_line(self):
+        content_type, content = self.stream('all-categories', 'ndjson')
+        self.assertEqual(content_type, 'application/x-ndjson; charset=utf-8')
+        header, *lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(header, {
+            'status': True, 'message': 'Categories retrieved successfully.',
+            'status_code': 200, 'data_key': 'categories_data',
+        })
+        self.assertEqual([category['name'] for category in lines], [f'Category {i}' for i in range(5)])
+
+    def test_unknown_format_is_not_streamed(self):
+        response = self.client.get(reverse('all-products'), {'stream': 'xml'})
+        self.assertFalse(response.streaming)
+
+    def test_rows_are_serialized_one_chunk_at_a_time(self):
+        products = GetProductSerializer.setup_eager_loading(Product.objects.order_by('id'))
+        for stream_format in STREAM_FORMATS:
+            with self.subTest(stream_format=stream_format):
+                response = stream_queryset(
+                    stream_format, products, GetProductSerializer, 'Products_data', 'Exported.', chunk_size=2,
+                )
+                chunks = list(response.streaming_content)
+                # The envelope, then batches of 2, 2 and 1 rows.
+                batches = chunks[1:4]
+                if stream_format == 'json':
+                    self.assertEqual(chunks[-1], b']}}')
+                    batches = [b'[' + batch.lstrip(b',') + b']' for batch in batches]
+                    self.assertEqual(len(json.loads(b''.join(chunks))['data']['Products_data']), 5)
+                    rows = [len(json.loads(batch)) for batch in batches]
+                else:
+                    rows = [len(batch.splitlines()) for batch in batches]
+                self.assertEqual(rows, [2, 2, 1])
+
+
+class AsyncCatalogViewTests(CatalogFixtureMixin, APITestCase):
+    views = {
+        'all-categories': AsyncAllCategoryAPIView,
+        'all-sub-categories': AsyncAllSubCategoryAPIView,
+        'all-products': AsyncAllProductAPIView,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.create_catalog(3)
+
+    def get(self, view_class, authenticated=True, **headers):
+        if authenticated:
+            headers['authorization'] = f'Bearer {self.token}'
+        request = AsyncRequestFactory().get('/', headers=headers)
+        response = async_to_sync(view_class.as_view())(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_async_views_match_sync_views(self):
+        self.client.force_authenticate(self.user)
+        for url_name, view_class in self.views.items():
+            with self.subTest(url_name=url_name):
+                response = self.get(view_class)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.content), self.client.get(reverse(url_name)).json())
+
+    def test_async_views_cost_the_same_queries(self):
+        for url_name, view_class in self.views.items():
+            with self.subTest(url_name=url_name):
+                # The principal lookup, then the same validator aggregate and
+                # list queries as the sync views.
+                cache.clear()
+                with self.assertNumQueries(1 + CatalogQueryCountTests.expected_queries[url_name]):
+                    self.get(view_class)
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.get(view_class).status_code, 200)
+
+    def test_async_views_honour_validators_and_authentication(self):
+        response = self.get(AsyncAllProductAPIView)
+        self.assertEqual(self.get(AsyncAllProductAPIView, if_none_match=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(AsyncAllProductAPIView, authenticated=False).status_code, 401)
+
+    def test_async_streaming_export(self):
+        request = AsyncRequestFactory().get('/', {'stream': 'ndjson'}, headers={'authorization': f'Bearer {self.token}'})
+
+        async def fetch():
+            response = await AsyncAllProductAPIView.as_view()(request)
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        lines = async_to_sync(fetch)().splitlines()
+        self.assertEqual(json.loads(lines[0])['data_key'], 'Products_data')
+        self.assertEqual(len(lines), 4)
+
+
+class FakeSequenceConnection:
+    # Stands in for Postgres nextval() so SequenceIdAllocator.lease() runs
+    # as is; the taken-id lookups still go to the test database.
+    vendor = 'postgresql'
+
+    def __init__(self):
+        self.values = iter(range(1, 1_000_000))
+        self.lock = threading.Lock()
+        self.leases = 0
+
+    @contextmanager
+    def cursor(self):
+        rows = []
+        cursor = mock.Mock()
+
+        def execute(sql, params):
+            with self.lock:
+                self.leases += 1
+                rows[:] = [(next(self.values),) for _ in range(params[1])]
+
+        cursor.execute.side_effect = execute
+        cursor.fetchall.side_effect = lambda: rows
+        yield cursor
+
+
+def sequence_id(scope, value):
+    return format_id(scope, value * SCOPES[scope]['multiplier'] % SCOPES[scope]['space'])
+
+
+class PublicIdTests(CatalogFixtureMixin, APITestCase):
+    def sequence_allocator(self):
+        sequence = FakeSequenceConnection()
+        for patch in (mock.patch('ecommerce.ids.connection', sequence), mock.patch('ecommerce.ids.ID_BLOCK_SIZE', 10)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        return SequenceIdAllocator(), sequence
+
+    def test_random_allocator_retries_taken_and_repeated_ids(self):
+        self.create_catalog(1)
+        Product.objects.update(product_id=format_id('product', 1))
+        with mock.patch('ecommerce.ids.random.randrange', side_effect=[1, 2, 2, 3]):
+            # 1 is taken, then 2 is drawn twice in the same round.
+            self.assertEqual(sorted(RandomIdAllocator().allocate('product', 2)), [format_id('product', value) for value in (2, 3)])
+
+    def test_blocks_skip_taken_ids(self):
+        self.create_catalog(1)
+        Product.objects.update(product_id=sequence_id('product', 2))
+        allocator, sequence = self.sequence_allocator()
+
+        issued = allocator.allocate('product', 25)
+        self.assertEqual(issued[:2], [sequence_id('product', 1), sequence_id('product', 3)])
+        self.assertEqual(len(set(issued)), 25)
+        # 24 usable ids from the first lease, then one block of 10.
+        self.assertEqual(sequence.leases, 2)
+        with self.assertNumQueries(0):
+            allocator.allocate('product', 9)
+
+    def test_prefetched_ids_need_no_query(self):
+        allocator, sequence = self.sequence_allocator()
+        allocator.prefetch('order', 3)
+        self.assertEqual(sequence.leases, 1)
+        with self.assertNumQueries(0):
+            allocator.allocate('order', 3)
+
+    def test_order_ids_carry_the_day_they_are_issued(self):
+        allocator, sequence = self.sequence_allocator()
+        with mock.patch('ecommerce.ids.datetime') as clock:
+            clock.now.return_value = datetime(2026, 10, 18, 23, 59, 59)
+            first = allocator.allocate('order')[0]
+            clock.now.return_value = datetime(2026, 10, 19, 0, 0, 1)
+            second = allocator.allocate('order')[0]
+        self.assertTrue(first.startswith('ORD-20261018-'))
+        # The rest of the previous day's block is dropped, not reissued.
+        self.assertTrue(second.startswith('ORD-20261019-'))
+        self.assertEqual(sequence.leases, 2)
+        self.assertEqual(list(allocator.blocks), [('order', datetime(2026, 10, 19).date())])
+
+    def test_concurrent_allocations_never_repeat(self):
+        allocator, _ = self.sequence_allocator()
+        barrier = threading.Barrier(8)
+        issued = []
+
+        def allocate():
+            try:
+                barrier.wait()
+                for _ in range(25):
+                    issued.extend(allocator.allocate('product', 3))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(issued), 600)
+        self.assertEqual(len(set(issued)), 600)
+
+
+class SequenceIdConcurrencyTests(TransactionTestCase):
+    def test_parallel_writers_get_distinct_ids(self):
+        allocators = [SequenceIdAllocator() for _ in range(4)]
+        issued = []
+
+        def allocate(allocator):
+            try:
+                for _ in range(150):
+                    issued.append(allocator.allocate('order')[0])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate, args=(allocator,)) for allocator in allocators]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(issued), 600)
+        self.assertEqual(len(set(issued)), 600)
+
+
+class SlugAllocationTests(APITestCase):
+    def test_numbered_slugs_do_not_clash_within_a_batch(self):
+        self.assertEqual(
+            allocate_slugs(Category, ['T-Shirt', 'T Shirt', 'T Shirt 2']),
+            ['t-shirt', 't-shirt-2', 't-shirt-2-2'],
+        )
+
+    def test_numbered_slugs_do_not_clash_with_existing_rows(self):
+        Category.objects.create(name='Shirt')
+        Category.objects.create(name='Shirt 2')
+        self.assertEqual(sorted(allocate_slugs(Category, ['Shirt', 'Shirt'])), ['shirt-3', 'shirt-4'])
+
+    def test_counters_never_reuse_a_number(self):
+        Category.objects.create(name='Hat')
+        Category.objects.create(name='HAT').delete()
+        self.assertEqual(Category.objects.create(name='hat').slug, 'hat-3')
+        self.assertEqual(allocate_slugs(Category, ['Hat', 'Cap']), ['hat-4', 'cap'])
+
+
+class CartTests(CatalogFixtureMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        cart_store().clear()
+        self.user = self.create_user()
+        self.client.force_authenticate(self.user)
+        self.create_catalog(2)
+        self.products = list(Product.objects.order_by('name'))
+
+    def test_add_update_remove(self):
+        first, second = self.products
+        self.client.post(reverse('cart-items'), {'product': first.slug, 'quantity': 2})
+        self.client.post(reverse('cart-items'), {'product': first.slug})
+        self.client.post(reverse('cart-items'), {'product': second.slug, 'quantity': 1})
+        self.client.put(reverse('cart-item', args=[second.slug]), {'quantity': 4})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('cart'))
+        cart = response.json()['data']['cart_data']
+        self.assertEqual([item['quantity'] for item in cart['items']], [3, 4])
+        self.assertEqual(cart['total_amount'], '105.00')
+
+        response = self.client.delete(reverse('cart-item', args=[first.slug]))
+        self.assertEqual(len(response.json()['data']['cart_data']['items']), 1)
+
+    def test_invalid_quantity_is_rejected(self):
+        response = self.client.post(reverse('cart-items'), {'product': self.products[0].slug, 'quantity': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_flush_writes_carts_back(self):
+        first, second = self.products
+        self.client.post(reverse('cart-items'), {'product': first.slug, 'quantity': 2})
+        self.client.post(reverse('cart-items'), {'product': second.slug, 'quantity': 1})
+        self.assertEqual(flush_carts(), 1)
+        self.assertEqual(flush_carts(), 0)
+
+        items = CartItem.objects.filter(cart__user=self.user)
+        self.assertEqual(dict(items.values_list('product_id', 'quantity')), {first.id: 2, second.id: 1})
+
+        # A cold store reloads the flushed cart.
+        cart_store().clear()
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.json()['data']['cart_data']['total_quantity'], 3)
+
+    def test_add_retries_when_the_cart_changed_underneath(self):
+        first, second = self.products
+        get_cart = carts._get_cart
+        raced = []
+
+        def racing_get_cart(store, user):
+            cart = get_cart(store, user)
+            if not raced:
+                # Another request adds a line after this one read the cart.
+                raced.append(second)
+                add_item(user, second, 1)
+            return cart
+
+        with mock.patch('shop.carts._get_cart', side_effect=racing_get_cart):
+            items = add_item(self.user, first, 2)
+        self.assertEqual(items, {first.id: 2, second.id: 1})
+        self.assertEqual(get_items(self.user), {first.id: 2, second.id: 1})
+
+    def test_concurrent_adds_keep_every_line(self):
+        get_items(self.user)
+        barrier = threading.Barrier(8)
+
+        def add(number):
+            try:
+                barrier.wait()
+                for _ in range(25):
+                    add_item(self.user, Product(id=1000 + number), 1)
+                    add_item(self.user, self.products[0], 1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add, args=(number,)) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        items = get_items(self.user)
+        self.assertEqual(items.pop(self.products[0].id), 200)
+        self.assertEqual(items, {1000 + number: 25 for number in range(8)})
+
+
+SHIPPING = {'address': '1 Main St', 'city': 'Springfield', 'postal_code': '12345', 'country': 'US'}
+
+
+class CheckoutTests(CatalogFixtureMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        cart_store().clear()
+        self.user = self.create_user()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, products, quantity=1):
+        for product in products:
+            add_item(self.user, product, quantity)
+
+    def post_checkout(self):
+        return self.client.post(reverse('checkout'), {'payment_method': 'PayPal', **SHIPPING})
+
+    def test_checkout_creates_order(self):
+        self.create_catalog(2)
+        Product.objects.update(quantity=2)
+        self.fill_cart(Product.objects.all(), quantity=2)
+        response = self.post_checkout()
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(str(order.total_amount), '60.00')
+        self.assertEqual(order.payment.amount, order.total_amount)
+        self.assertEqual(order.shipping.city, 'Springfield')
+        self.assertEqual(set(Inventory.objects.values_list('stock_quantity', flat=True)), {0})
+        self.assertEqual(get_items(self.user), {})
+
+    def test_query_count_does_not_grow_with_cart_lines(self):
+        self.create_catalog(7)
+        Product.objects.update(quantity=10)
+        products = list(Product.objects.order_by('id'))
+        # Order ids come from a block leased up front, so no checkout pays
+        # for a lease whatever earlier tests left in the process allocator.
+        allocator = SequenceIdAllocator()
+        allocator.prefetch('order', 3)
+        # One line takes its stock with a single conditional update; more
+        # lines lock their rows first, one query more however many there are.
+        for lines, queries in ((products[:1], 14), (products[1:3], 15), (products[3:], 15)):
+            with self.subTest(lines=len(lines)), mock.patch('ecommerce.ids._allocator', allocator):
+                self.fill_cart(lines)
+                with self.assertNumQueries(queries):
+                    response = self.post_checkout()
+                self.assertEqual(response.status_code, 201)
+
+    def test_insufficient_stock_rolls_back(self):
+        self.create_catalog(1)
+        Product.objects.update(quantity=2)
+        self.fill_cart(Product.objects.all(), quantity=3)
+        response = self.post_checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Inventory.objects.exists())
+        self.assertEqual(len(get_items(self.user)), 1)
+
+
+class OrderHistoryTests(CatalogFixtureMixin, APITestCase):
+    def setUp(self):
+        cart_store().clear()
+        self.user = self.create_user()
+        self.client.force_authenticate(self.user)
+        self.create_catalog(3)
+        Product.objects.update(quantity=10)
+
+    def test_orders_page_is_one_query(self):
+        for product in Product.objects.order_by('id'):
+            add_item(self.user, product, 2)
+            self.client.post(reverse('checkout'), {'payment_method': 'PayPal', **SHIPPING})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('orders'), {'page_size': 2})
+        data = response.json()['data']
+        orders = data['results']['orders_data']
+        self.assertEqual(len(orders), 2)
+        self.assertEqual(orders[0]['item_count'], 2)
+        self.assertTrue(orders[0]['thumbnail'].endswith('products/2-a.jpg'))
+
+        response = self.client.get(data['next'])
+        self.assertEqual(len(response.json()['data']['results']['orders_data']), 1)
+
+
+class InventoryTests(CatalogFixtureMixin, APITestCase):
+    def setUp(self):
+        cart_store().clear()
+        self.user = self.create_user()
+        self.client.force_authenticate(self.user)
+        self.create_catalog(1)
+        self.product = Product.objects.get()
+        Inventory.objects.create(product=self.product, stock_quantity=5)
+
+    def test_conditional_decrement_never_goes_negative(self):
+        take_stock({self.product.id: 5})
+        with self.assertRaises(InsufficientStock):
+            take_stock({self.product.id: 1})
+        self.assertEqual(stock_levels([self.product.id]), {self.product.id: 0})
+
+    def test_sharded_stock_drains_across_shards(self):
+        shard_inventory(self.product.id, 3)
+        take_stock({self.product.id: 1})
+        take_stock({self.product.id: 4})
+        with self.assertRaises(InsufficientStock):
+            take_stock({self.product.id: 1})
+        shard_inventory(self.product.id, 0)
+        self.assertEqual(Inventory.objects.get().stock_quantity, 0)
+
+    def test_expired_reservation_returns_stock(self):
+        reserve(self.user, {self.product.id: 3})
+        self.assertEqual(stock_levels([self.product.id])[self.product.id], 2)
+        self.assertEqual(release_expired(), 0)
+
+        StockReservation.objects.update(expires_at=timezone.now())
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(stock_levels([self.product.id])[self.product.id], 5)
+
+    def test_products_report_stock_from_inventory(self):
+        cache.clear()
+        Product.objects.create(
+            name='Unseeded', description='A product', regular_price='20.00', sale_price='15.00', quantity=7,
+            category=self.product.category, sub_category=self.product.sub_category,
+        )
+
+        def listed():
+            response = self.client.get(reverse('products'))
+            products = response.json()['data']['results']['Products_data']
+            return response['ETag'], {product['name']: product['quantity'] for product in products}
+
+        etag, stock = listed()
+        self.assertEqual(stock, {'Product 0': 5, 'Unseeded': 7})
+
+        # Every stock writer invalidates the cached pages and their ETags.
+        for write, expected in (
+            (lambda: take_stock({self.product.id: 2}), 3),
+            (lambda: shard_inventory(self.product.id, 2), 3),
+            (lambda: reserve(self.user, {self.product.id: 3}), 0),
+            (lambda: StockReservation.objects.update(expires_at=timezone.now()) and release_expired(), 3),
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            previous, (etag, stock) = etag, listed()
+            self.assertNotEqual(etag, previous)
+            self.assertEqual(stock['Product 0'], expected)
+
+    def test_quantity_is_not_writable(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(reverse('product-update', args=[self.product.slug]), {
+                'category': self.product.category_id,
+                'sub_category': self.product.sub_category_id,
+                'quantity': 50,
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['quantity'], 5)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity, Inventory.objects.get().stock_quantity), (0, 5))
+
+    def test_opening_stock_seeds_inventory_on_create(self):
+        response = self.client.post(reverse('product-create'), {
+            'name': 'Boot', 'description': 'A boot', 'regular_price': '20.00', 'sale_price': '15.00',
+            'category': self.product.category_id, 'sub_category': self.product.sub_category_id, 'quantity': 8,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['data']['quantity'], 8)
+        self.assertEqual(Inventory.objects.get(product__name='Boot').stock_quantity, 8)
+
+    def test_admins_adjust_stock(self):
+        def adjust(adjustment):
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post(reverse('product-stock', args=[self.product.slug]), {'adjustment': adjustment})
+
+        self.assertEqual(adjust(3).status_code, 403)
+        self.client.force_authenticate(User.objects.create_superuser(
+            email='admin@example.com', password='admin-pass-123', phone_number='5550009',
+        ))
+        self.assertEqual(adjust(3).json()['data']['quantity'], 8)
+        self.assertEqual(adjust(-6).json()['data']['quantity'], 2)
+        response = adjust(-3)
+        self.assertEqual((response.status_code, response.json()['errors']), (400, {'stock': 'Not enough stock to write off.'}))
+        self.assertEqual(adjust(0).status_code, 400)
+
+        shard_inventory(self.product.id, 2)
+        self.assertEqual(adjust(4).json()['data']['quantity'], 6)
+        self.assertEqual(stock_levels([self.product.id]), {self.product.id: 6})
+
+    def test_checkout_uses_held_stock(self):
+        add_item(self.user, self.product, 4)
+        self.client.post(reverse('cart-reserve'))
+        self.assertEqual(stock_levels([self.product.id])[self.product.id], 1)
+
+        response = self.client.post(reverse('checkout'), {'payment_method': 'PayPal', **SHIPPING})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(stock_levels([self.product.id])[self.product.id], 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class CheckoutConcurrencyTests(CatalogFixtureMixin, TransactionTestCase):
+    buyers = 12
+    stock = 5
+
+    def test_parallel_checkouts_never_oversell(self):
+        cart_store().clear()
+        self.create_catalog(1)
+        product = Product.objects.get()
+        Inventory.objects.create(product=product, stock_quantity=self.stock)
+        users = [self.create_user(number) for number in range(self.buyers)]
+        for user in users:
+            add_item(user, product, 1)
+
+        barrier = threading.Barrier(self.buyers)
+        results = []
+
+        def buy(user):
+            try:
+                barrier.wait()
+                checkout(user, 'PayPal', SHIPPING)
+                results.append('ok')
+            except CheckoutError:
+                results.append('short')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count('ok'), self.stock)
+        self.assertEqual(results.count('short'), self.buyers - self.stock)
+        self.assertEqual(Inventory.objects.get().stock_quantity, 0)
+        self.assertEqual(OrderItem.objects.count(), self.stock)
+
+
+def image_upload(name, size, mode='RGB', image_format='JPEG'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'red').save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+class ImageFixtureMixin(CatalogFixtureMixin):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        cache.clear()
+        self.create_catalog(1)
+        self.product = Product.objects.get()
+
+    def create_image(self, *args, **kwargs):
+        return ProductImage.objects.create(product=self.product, image=image_upload(*args, **kwargs))
+
+
+class CatalogCacheTests(ImageFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_authenticate(self.user)
+
+    def product_names(self):
+        response = self.client.get(reverse('all-products'))
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()['data']['Products_data']]
+
+    def test_hits_misses_and_invalidation(self):
+        self.assertEqual(self.product_names(), ['Product 0'])
+        self.assertEqual(self.product_names(), ['Product 0'])
+        self.assertEqual(get_stats(), {'hits': 1, 'misses': 1, 'invalidations': 0})
+
+        # A saved row only invalidates once its transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(name='Renamed')
+        self.assertEqual(self.product_names(), ['Product 0'])
+        self.product.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.product_names(), ['Renamed'])
+        self.assertEqual(get_stats(), {'hits': 2, 'misses': 2, 'invalidations': 1})
+
+    def test_dependent_entities_invalidate_products(self):
+        self.product_names()
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='New category')
+        self.product_names()
+        self.assertEqual(get_stats()['misses'], 2)
+
+    def test_bulk_image_writes_invalidate(self):
+        self.product_names()
+        with mock.patch('shop.images._dispatcher'), self.captureOnCommitCallbacks(execute=True):
+            update_product_images(self.product, [image_upload('new.jpg', (40, 40))], keep=[])
+        images = self.client.get(reverse('all-products')).json()['data']['Products_data'][0]['images']
+        self.assertEqual(len(images), 1)
+        self.assertEqual(get_stats()['invalidations'], 1)
+
+    def test_stats_endpoint_is_for_admins(self):
+        self.product_names()
+        self.assertEqual(self.client.get(reverse('cache-stats')).status_code, 403)
+
+        self.client.force_authenticate(User.objects.create_superuser(
+            email='admin@example.com', password='admin-pass-123', phone_number='5550002',
+        ))
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['cache_stats'], {'hits': 0, 'misses': 1, 'invalidations': 0})
+
+
+def import_csv(*rows):
+    header = 'name,description,regular_price,sale_price,category,sub_category,colors,images\n'
+    return (header + ''.join(f'{row}\n' for row in rows)).encode('utf-8')
+
+
+class ProductImportTests(ImageFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.create_user())
+        self.images_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.images_dir)
+        with open(os.path.join(self.images_dir, 'boot.jpg'), 'wb') as image:
+            image.write(image_upload('boot.jpg', (40, 40)).read())
+        dispatcher = mock.patch('shop.images._dispatcher')
+        dispatcher.start()
+        self.addCleanup(dispatcher.stop)
+
+    def row(self, name, price='15.00', images=''):
+        return f'{name},A product,20.00,{price},category-0,{self.product.sub_category.slug},"red,blue",{images}'
+
+    def test_batches_report_row_errors(self):
+        rows = [self.row('Boot'), self.row('Sandal', price='cheap'), self.row('Product 0'), self.row('Clog'), self.row('Boot')]
+        with self.captureOnCommitCallbacks(execute=True):
+            report = ProductImporter(batch_size=2).run(read_rows(io.BytesIO(import_csv(*rows)), 'csv'))
+
+        self.assertEqual((report['rows'], report['created'], report['failed'], report['file_error']), (5, 2, 3, None))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 5])
+        self.assertEqual(report['errors'][1]['errors'], {'name': 'A Product with this name already exists.'})
+        boot = Product.objects.get(name='Boot')
+        self.assertEqual((boot.slug, boot.colors, len(boot.product_id)), ('boot', ['red', 'blue'], 8))
+        self.assertIn(('colors', 'red'), set(boot.facet_values.values_list('facet', 'value')))
+        self.assertEqual(get_stats()['invalidations'], 1)
+
+    def test_batch_with_clashing_slugs_is_imported(self):
+        rows = [self.row('T-Shirt'), self.row('T Shirt'), self.row('T Shirt 2')]
+        report = ProductImporter().run(read_rows(io.BytesIO(import_csv(*rows)), 'csv'))
+        self.assertEqual((report['created'], report['failed']), (3, 0))
+        self.assertEqual(
+            sorted(Product.objects.filter(name__startswith='T').values_list('slug', flat=True)),
+            ['t-shirt', 't-shirt-2', 't-shirt-2-2'],
+        )
+
+    def test_file_error_keeps_committed_batches(self):
+        def rows():
+            yield from csv.DictReader(io.StringIO(import_csv(self.row('Boot'), self.row('Clog'), self.row('Mule')).decode()))
+            raise ImportFileError("'utf-8' codec can't decode byte 0xff")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = ProductImporter(batch_size=2).run(rows())
+        self.assertEqual(report['created'], 3)
+        self.assertEqual(report['file_error'], {'row': 4, 'error': "'utf-8' codec can't decode byte 0xff"})
+        # The committed rows are listed, not a stale cached page.
+        self.assertEqual(get_stats()['invalidations'], 1)
+
+    def test_failed_batch_removes_copied_images(self):
+        importer = ProductImporter(images_dir=self.images_dir)
+        rows = read_rows(io.BytesIO(import_csv(self.row('Boot', images='boot.jpg'))), 'csv')
+        with mock.patch('shop.importers.sync_product_facets', side_effect=RuntimeError('facet sync failed')):
+            with self.assertRaises(RuntimeError):
+                importer.run(rows)
+        self.assertFalse(Product.objects.filter(name='Boot').exists())
+        self.assertEqual(default_storage.listdir('products')[1], [])
+
+        report = ProductImporter(images_dir=self.images_dir).run(
+            read_rows(io.BytesIO(import_csv(self.row('Boot', images='boot.jpg'), self.row('Clog', images='../boot.jpg'))), 'csv'),
+        )
+        self.assertEqual(report['errors'], [{'row': 2, 'errors': {'images': ['../boot.jpg not found.']}}])
+        image = ProductImage.objects.get(product__name='Boot')
+        self.assertTrue(default_storage.exists(image.image.name))
+
+    def post_file(self, name, content, **data):
+        return self.client.post(reverse('product-import'), {'file': SimpleUploadedFile(name, content), **data}, format='multipart')
+
+    def test_import_endpoint(self):
+        response = self.post_file('products.csv', import_csv(self.row('Boot')))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['import_report']['created'], 1)
+
+        ndjson = json.dumps({
+            'name': 'Clog', 'description': 'A product', 'regular_price': '20.00', 'sale_price': '15.00',
+            'category': str(self.product.category_id), 'sub_category': str(self.product.sub_category_id),
+        }).encode() + b'\n{broken\n'
+        report = self.post_file('products.ndjson', ndjson).json()['data']['import_report']
+        self.assertEqual((report['created'], report['errors'][0]['row']), (1, 2))
+
+        response = self.post_file('products.csv', b'\xff\xfe not text')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['errors']['file'].startswith('Could not parse file at row 1'))
+        self.assertEqual(self.post_file('products.xml', b'<products/>', format='xml').status_code, 400)
+
+    def test_import_command(self):
+        path = os.path.join(self.images_dir, 'products.csv')
+        with open(path, 'wb') as file:
+            file.write(import_csv(self.row('Boot', images='boot.jpg'), self.row('Boot')))
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_products', path, '--images-dir', self.images_dir, stdout=stdout, stderr=stderr)
+        self.assertIn('Imported 1 of 2 rows (1 failed)', stdout.getvalue())
+        self.assertIn('row 2:', stderr.getvalue())
+        self.assertEqual(ProductImage.objects.get(product__name='Boot').image.name, 'products/boot.jpg')
+
+        with self.assertRaises(CommandError):
+            call_command('import_products', os.path.join(self.images_dir, 'missing.csv'))
+
+
+class ImageVariantTests(ImageFixtureMixin, APITestCase):
+    @mock.patch('shop.images.IMAGE_PROCESSING_WORKERS', 0)
+    def test_variants_are_resized_encoded_and_listed(self):
+        image = self.create_image('shoe.jpg', (2000, 1000))
+        self.assertEqual(generate_variants([image]), (1, 0))
+
+        image.refresh_from_db()
+        self.assertEqual(set(image.variants), {'original', 'thumbnail', 'medium', 'large'})
+        self.assertEqual((image.variants['thumbnail']['width'], image.variants['thumbnail']['height']), (150, 75))
+        self.assertEqual(image.variants['medium']['webp'], 'products/shoe_medium.webp')
+        with image.image.storage.open(image.variants['large']['jpg']) as variant:
+            self.assertEqual(Image.open(variant).size, (1200, 600))
+
+        data = ProductImageSerializer(image).data
+        # jsonb does not keep key order; the serializer lists smallest first.
+        self.assertEqual(list(data['variants']), ['thumbnail', 'medium', 'large', 'original'])
+        self.assertEqual(data['variants']['thumbnail']['jpg'], '/media/products/shoe_thumbnail.jpg')
+        self.assertEqual(
+            data['srcset'],
+            '/media/products/shoe_thumbnail.jpg 150w, /media/products/shoe_medium.jpg 600w, '
+            '/media/products/shoe_large.jpg 1200w, /media/products/shoe.jpg 2000w',
+        )
+        self.assertTrue(data['webp_srcset'].endswith('/media/products/shoe_original.webp 2000w'))
+
+    @mock.patch('shop.images.IMAGE_PROCESSING_WORKERS', 0)
+    def test_small_and_transparent_images(self):
+        image = self.create_image('icon.png', (400, 200), mode='RGBA', image_format='PNG')
+        generate_variants([image])
+        self.assertEqual(set(image.variants), {'original', 'thumbnail'})
+        self.assertIn('png', image.variants['thumbnail'])
+
+        broken = ProductImage.objects.create(
+            product=self.product, image=SimpleUploadedFile('broken.jpg', b'not an image'),
+        )
+        with self.assertLogs('shop.images', 'ERROR'):
+            self.assertEqual(generate_variants([broken]), (0, 1))
+
+    def test_variants_render_in_the_process_pool(self):
+        image = self.create_image('shoe.jpg', (800, 800))
+        self.assertEqual(generate_variants([image]), (1, 0))
+        self.assertEqual(image.variants['medium']['width'], 600)
+
+    def test_uploads_schedule_variants_after_commit(self):
+        self.client.force_authenticate(self.create_user())
+        with mock.patch('shop.images._dispatcher') as dispatcher:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('product-create'), {
+                    'name': 'Boot',
+                    'description': 'A boot',
+                    'regular_price': '20.00',
+                    'sale_price': '15.00',
+                    'category': self.product.category_id,
+                    'sub_category': self.product.sub_category_id,
+                    'uploaded_images': [image_upload('boot.jpg', (300, 300))],
+                }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        image_ids = list(ProductImage.objects.filter(product__name='Boot').values_list('id', flat=True))
+        dispatcher.submit.assert_called_once_with(mock.ANY, image_ids)
+
+
+class ProductImageUpdateTests(ImageFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.create_user())
+        dispatcher = mock.patch('shop.images._dispatcher')
+        self.dispatcher = dispatcher.start()
+        self.addCleanup(dispatcher.stop)
+
+    def upload(self, name, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 40), color).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def put(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put(reverse('product-update', args=[self.product.slug]), {
+                'category': self.product.category_id,
+                'sub_category': self.product.sub_category_id,
+                **data,
+            }, format='multipart')
+
+    def listed_images(self):
+        return list(ProductImage.objects.filter(product=self.product, deleted=False).values_list('id', 'position'))
+
+    def cleaned_up_files(self):
+        return [
+            name for call in self.dispatcher.submit.call_args_list
+            if call.args[0].__name__ == '_clean_up_in_background' for name in call.args[1]
+        ]
+
+    def test_reupload_replaces_only_what_changed(self):
+        ProductImage.objects.filter(product=self.product).delete()
+        self.assertEqual(self.put(uploaded_images=[self.upload('red.png', 'red'), self.upload('blue.png', 'blue')]).status_code, 200)
+        red, blue = ProductImage.objects.filter(product=self.product, deleted=False)
+
+        response = self.put(uploaded_images=[self.upload('red-again.png', 'red'), self.upload('green.png', 'green')])
+        self.assertEqual(response.status_code, 200)
+        images = list(ProductImage.objects.filter(product=self.product, deleted=False))
+        self.assertEqual(images[0], red)
+        self.assertEqual([image.position for image in images], [0, 1])
+        self.assertFalse(ProductImage.objects.filter(pk=blue.pk).exists())
+        self.assertEqual(self.cleaned_up_files(), [blue.image.name])
+
+        # Orphaned files go, files an order still shows stay.
+        Order.objects.create(user=User.objects.get(), thumbnail=blue.image.name)
+        self.assertEqual(delete_orphaned_files([blue.image.name, red.image.name]), 0)
+        Order.objects.all().delete()
+        self.assertEqual(delete_orphaned_files([blue.image.name]), 1)
+        self.assertFalse(blue.image.storage.exists(blue.image.name))
+
+    def test_identical_upload_is_a_no_op(self):
+        self.put(uploaded_images=[self.upload('red.png', 'red')])
+        images = self.listed_images()
+
+        # Reading the current images is all it costs.
+        with self.assertNumQueries(1):
+            changed = update_product_images(self.product, [self.upload('red.png', 'red')], keep=[])
+        self.assertFalse(changed)
+        self.assertEqual(self.listed_images(), images)
+
+    def test_keep_and_remove_by_id(self):
+        first, second = ProductImage.objects.filter(product=self.product, deleted=False)
+        third = self.create_image('third.jpg', (40, 40))
+
+        self.assertEqual(self.put(keep_images=[third.id, first.id]).status_code, 200)
+        self.assertEqual(self.listed_images(), [(third.id, 0), (first.id, 1)])
+
+        self.assertEqual(self.put(remove_images=[third.id], uploaded_images=[self.upload('new.png', 'blue')]).status_code, 200)
+        images = self.listed_images()
+        self.assertEqual(images[0], (first.id, 0))
+        self.assertEqual(len(images), 2)
+
+        response = self.put(remove_images=[second.id])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors']['images'], f'Unknown image ids: {second.id}.')
+
+
+class OrphanedImageCleanupTests(ImageFixtureMixin, APITestCase):
+    def test_recent_upload_of_known_content_is_kept(self):
+        storage = ProductImage._meta.get_field('image').storage
+        old = storage.save('products/old.jpg', ContentFile(b'photo'))
+        stale = storage.save('products/stale.jpg', ContentFile(b'stale photo'))
+        for name in (old, stale):
+            os.utime(storage.path(name), (0, 0))
+        fresh = storage.save('products/fresh.jpg', ContentFile(b'photo'))
+
+        out = io.StringIO()
+        call_command('clean_orphaned_images', stdout=out)
+        self.assertTrue(storage.exists(fresh))
+        self.assertFalse(storage.exists(stale))
+        self.assertIn('Deleted 1 orphaned files', out.getvalue())
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.storage = ContentAddressedStorage(location=location)
+
+    def test_identical_files_share_one_blob(self):
+        first = self.storage.save('products/a.jpg', ContentFile(b'same photo'))
+        second = self.storage.save('category_images/b.jpg', ContentFile(b'same photo'))
+        third = self.storage.save('products/a.jpg', ContentFile(b'same photo'))
+        other = self.storage.save('products/c.jpg', ContentFile(b'other photo'))
+
+        self.assertEqual(len({first, second, third, other}), 4)
+        with self.storage.open(second) as file:
+            self.assertEqual(file.read(), b'same photo')
+        self.assertEqual(os.stat(self.storage.path(first)).st_ino, os.stat(self.storage.path(third)).st_ino)
+        self.assertEqual(self.storage.usage(), {
+            'blobs': 2, 'files': 4, 'stored_bytes': 21, 'logical_bytes': 41,
+            'orphaned_blobs': 0, 'saved_bytes': 20,
+        })
+        self.assertEqual(get_upload_stats(), {'uploads': 4, 'bytes_received': 41, 'bytes_written': 21})
+
+    def test_blob_goes_with_its_last_file(self):
+        first = self.storage.save('products/a.jpg', ContentFile(b'same photo'))
+        second = self.storage.save('products/b.jpg', ContentFile(b'same photo'))
+
+        self.storage.delete(first)
+        self.assertEqual(self.storage.usage()['blobs'], 1)
+        self.storage.delete(second)
+        self.assertEqual(self.storage.usage(), {
+            'blobs': 0, 'files': 0, 'stored_bytes': 0, 'logical_bytes': 0,
+            'orphaned_blobs': 0, 'saved_bytes': 0,
+        })
+
+        # Saving the content again writes it again.
+        self.storage.save('products/a.jpg', ContentFile(b'same photo'))
+        self.assertEqual(get_upload_stats()['bytes_written'], 20)
+
+    def test_reclaimable_size_counts_each_blob_once_it_loses_its_last_file(self):
+        kept = self.storage.save('products/kept.jpg', ContentFile(b'shared photo'))
+        shared = [self.storage.save(f'products/shared-{i}.jpg', ContentFile(b'shared photo')) for i in range(2)]
+        alone = [self.storage.save(f'products/alone-{i}.jpg', ContentFile(b'lone photo')) for i in range(2)]
+
+        self.assertEqual(self.storage.reclaimable_size(shared), 0)
+        self.assertEqual(self.storage.reclaimable_size(alone[:1]), 0)
+        self.assertEqual(self.storage.reclaimable_size(alone), 10)
+        self.assertEqual(self.storage.reclaimable_size([kept, *shared, *alone]), 22)
+
+    def test_saving_known_content_refreshes_the_modified_time(self):
+        first = self.storage.save('products/a.jpg', ContentFile(b'same photo'))
+        os.utime(self.storage.path(first), (0, 0))
+        second = self.storage.save('products/b.jpg', ContentFile(b'same photo'))
+        self.assertGreater(self.storage.get_modified_time(second).year, 1970)
+
+    def test_deduplicate_existing_files(self):
+        for name in ('a.jpg', 'b.jpg'):
+            os.makedirs(self.storage.path('products'), exist_ok=True)
+            with open(self.storage.path(f'products/{name}'), 'wb') as file:
+                file.write(b'legacy photo')
+
+        self.assertEqual(self.storage.deduplicate('products/a.jpg'), 0)
+        self.assertEqual(self.storage.deduplicate('products/b.jpg'), 12)
+        self.assertEqual(self.storage.usage()['saved_bytes'], 12)
+        with self.storage.open('products/b.jpg') as file:
+            self.assertEqual(file.read(), b'legacy photo')
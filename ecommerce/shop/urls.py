@@ -1,22 +1,39 @@
+from django.conf import settings
 from django.urls import path
 from shop.views import *
 
+# Native async variants of the read-only catalog views, for ASGI deployments.
+ASYNC_VIEWS = settings.ASYNC_VIEWS
+
 urlpatterns = [
     path('categories/', CategoryAPIView.as_view(), name='categories'),
-    path('all-categories/', AllCategoryAPIView.as_view(), name='all-categories'),
+    path('all-categories/', (AsyncAllCategoryAPIView if ASYNC_VIEWS else AllCategoryAPIView).as_view(), name='all-categories'),
     path('category-create/', CategoryAPIView.as_view(), name='category-create'),
     path('category-update/<slug:slug>', CategoryAPIView.as_view(), name='category-update'),
     path('category-delete/<slug:slug>', CategoryAPIView.as_view(), name='category-delete'),
 
     path('sub-categories/', SubCategoryAPIView.as_view(), name='sub-categories'),
-    path('all-sub-categories/', AllSubCategoryAPIView.as_view(), name='all-sub-categories'),
+    path('all-sub-categories/', (AsyncAllSubCategoryAPIView if ASYNC_VIEWS else AllSubCategoryAPIView).as_view(), name='all-sub-categories'),
     path('sub-category-create/', SubCategoryAPIView.as_view(), name='sub-category-create'),
     path('sub-category-update/<slug:slug>', SubCategoryAPIView.as_view(), name='sub-category-update'),
     path('sub-category-delete/<slug:slug>', SubCategoryAPIView.as_view(), name='sub-category-delete'),
 
     path('products/', ProductAPIView.as_view(), name='products'),
-    path('all-products/', AllProductAPIView.as_view(), name='all-products'),
+    path('products/search/', ProductSearchAPIView.as_view(), name='product-search'),
+    path('products/facets/', ProductFacetAPIView.as_view(), name='product-facets'),
+    path('all-products/', (AsyncAllProductAPIView if ASYNC_VIEWS else AllProductAPIView).as_view(), name='all-products'),
     path('product-create/', ProductAPIView.as_view(), name='product-create'),
     path('product-update/<slug:slug>', ProductAPIView.as_view(), name='product-update'),
     path('product-delete/<slug:slug>', ProductAPIView.as_view(), name='product-delete'),
+    path('product-import/', ProductImportAPIView.as_view(), name='product-import'),
+    path('product-stock/<slug:slug>', ProductStockAPIView.as_view(), name='product-stock'),
+
+    path('cart/', CartAPIView.as_view(), name='cart'),
+    path('cart/items/', CartItemAPIView.as_view(), name='cart-items'),
+    path('cart/items/<slug:slug>', CartItemAPIView.as_view(), name='cart-item'),
+    path('cart/reserve/', CartReservationAPIView.as_view(), name='cart-reserve'),
+    path('checkout/', CheckoutAPIView.as_view(), name='checkout'),
+    path('orders/', OrderHistoryAPIView.as_view(), name='orders'),
+
+    path('cache-stats/', CatalogCacheStatsAPIView.as_view(), name='cache-stats'),
 ]
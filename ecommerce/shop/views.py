@@ -1,23 +1,63 @@
 import json
+from decimal import Decimal
+from django.db import transaction
+from django.http import QueryDict
 from django.shortcuts import render
 from shop.serializers import *
 from ecommerce.renderers import CustomRenderer
+from ecommerce.pagination import CatalogPagination, OrderHistoryPagination, get_paginator
+from ecommerce.streaming import get_stream_format, stream_queryset
+from ecommerce.views import AsyncAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils import html
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from accounts.emails import queue_templated_email
+from shop.cache import cache_catalog_response, get_stats
+from shop import carts
+from shop.checkout import CheckoutError, checkout
+from shop.inventory import InsufficientStock, adjust_stock, reserve, seed_inventory
+from shop.conditional import conditional_catalog_response
+from shop.facets import facet_counts, filter_by_facets, parse_facet_filters
+from shop.filters import filter_products
+from shop.importers import IMPORT_FORMATS, ProductImporter, detect_format, read_rows
+from shop.search import search_products
+
+
+def split_list_fields(data):
+    # Form input is decoded by the JSONField itself, so it still needs to be
+    # JSON text; JSON bodies must carry real arrays or they end up stored as
+    # strings. Returns a copy: form request data is an immutable QueryDict.
+    form_input = html.is_html_input(data)
+    if form_input:
+        copied = QueryDict(mutable=True)
+        for key, values in data.lists():
+            copied.setlist(key, values)
+        data = copied
+    else:
+        data = dict(data)
+
+    for field in ('sizes', 'colors', 'tags'):
+        value = data.get(field)
+        if isinstance(value, str) and value:
+            values = [item.strip() for item in value.split(',') if item.strip()]
+            data[field] = json.dumps(values) if form_input else values
+    return data
 
 
 class CategoryAPIView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [CustomRenderer]
 
+    @cache_catalog_response('category')
+    @conditional_catalog_response(Category, 'category')
     def get(self, request):
-        categories = Category.objects.filter(deleted=False)
+        categories = CategorySerializer.setup_eager_loading(
+            Category.objects.filter(deleted=False)
+        )
 
-        paginator = PageNumberPagination()
-        paginator.page_size = 20
+        paginator = get_paginator(request)
 
         paginated_categories = paginator.paginate_queryset(categories, request)
 
@@ -135,8 +175,19 @@ class AllCategoryAPIView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [CustomRenderer]
     
+    @cache_catalog_response('category')
+    @conditional_catalog_response(Category, 'category')
     def get(self, request):
-        categories = Category.objects.filter(deleted=False)
+        categories = CategorySerializer.setup_eager_loading(
+            Category.objects.filter(deleted=False)
+        )
+
+        stream_format = get_stream_format(request)
+        if stream_format:
+            return stream_queryset(
+                stream_format, categories.order_by('id'), CategorySerializer,
+                "categories_data", "Categories retrieved successfully.",
+            )
 
         serializer = CategorySerializer(categories, many=True)
 
@@ -150,15 +201,45 @@ class AllCategoryAPIView(APIView):
         )
     
 
+class AsyncAllCategoryAPIView(AsyncAPIView, AllCategoryAPIView):
+    @cache_catalog_response('category')
+    @conditional_catalog_response(Category, 'category')
+    async def get(self, request):
+        categories = CategorySerializer.setup_eager_loading(
+            Category.objects.filter(deleted=False)
+        )
+
+        stream_format = get_stream_format(request)
+        if stream_format:
+            return stream_queryset(
+                stream_format, categories.order_by('id'), CategorySerializer,
+                "categories_data", "Categories retrieved successfully.", asynchronous=True,
+            )
+
+        serializer = CategorySerializer([category async for category in categories], many=True)
+
+        return Response(
+            {
+                "categories_data": serializer.data,
+                "message": "Categories retrieved successfully.",
+                "status_code": status.HTTP_200_OK,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
 class SubCategoryAPIView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [CustomRenderer]
 
+    @cache_catalog_response('subcategory')
+    @conditional_catalog_response(SubCategory, 'subcategory')
     def get(self, request):
-        sub_categories = SubCategory.objects.filter(deleted=False)
+        sub_categories = GetSubCategorySerializer.setup_eager_loading(
+            SubCategory.objects.filter(deleted=False)
+        )
 
-        paginator = PageNumberPagination()
-        paginator.page_size = 20
+        paginator = get_paginator(request)
 
         paginated_subcategories = paginator.paginate_queryset(sub_categories, request)
 
@@ -300,8 +381,19 @@ class AllSubCategoryAPIView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [CustomRenderer]
 
+    @cache_catalog_response('subcategory')
+    @conditional_catalog_response(SubCategory, 'subcategory')
     def get(self, request):
-        sub_categories = SubCategory.objects.filter(deleted=False)
+        sub_categories = GetSubCategorySerializer.setup_eager_loading(
+            SubCategory.objects.filter(deleted=False)
+        )
+
+        stream_format = get_stream_format(request)
+        if stream_format:
+            return stream_queryset(
+                stream_format, sub_categories.order_by('id'), GetSubCategorySerializer,
+                "subcategories_data", "SubCategories retrieved successfully.",
+            )
 
         serializer = GetSubCategorySerializer(sub_categories, many=True)
 
@@ -316,15 +408,52 @@ class AllSubCategoryAPIView(APIView):
 
 
 
+class AsyncAllSubCategoryAPIView(AsyncAPIView, AllSubCategoryAPIView):
+    @cache_catalog_response('subcategory')
+    @conditional_catalog_response(SubCategory, 'subcategory')
+    async def get(self, request):
+        sub_categories = GetSubCategorySerializer.setup_eager_loading(
+            SubCategory.objects.filter(deleted=False)
+        )
+
+        stream_format = get_stream_format(request)
+        if stream_format:
+            return stream_queryset(
+                stream_format, sub_categories.order_by('id'), GetSubCategorySerializer,
+                "subcategories_data", "SubCategories retrieved successfully.", asynchronous=True,
+            )
+
+        serializer = GetSubCategorySerializer([sub_category async for sub_category in sub_categories], many=True)
+
+        return Response(
+            {
+                "subcategories_data": serializer.data,
+                "message": "SubCategories retrieved successfully.",
+                "status_code": status.HTTP_200_OK,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
 class ProductAPIView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [CustomRenderer]
 
+    @cache_catalog_response('product')
+    @conditional_catalog_response(Product, 'product')
     def get(self, request):
-        products = Product.objects.filter(deleted=False)
-        
-        paginator = PageNumberPagination()
-        paginator.page_size = 20
+        filter_serializer = ProductFilterSerializer(data=request.query_params)
+        if not filter_serializer.is_valid():
+            return Response(
+                {"errors": filter_serializer.errors, "status_code": status.HTTP_400_BAD_REQUEST},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        products = GetProductSerializer.setup_eager_loading(
+            filter_products(Product.objects.filter(deleted=False), filter_serializer.validated_data)
+        )
+
+        paginator = get_paginator(request)
 
         paginated_products = paginator.paginate_queryset(products, request)
 
@@ -339,21 +468,7 @@ class ProductAPIView(APIView):
         )
     
     def post(self, request, *args, **kwargs):
-        data = request.data
-        sizes = data.get('sizes')
-        if sizes:
-            sizes_list = sizes.split(',')
-            data['sizes'] = json.dumps(sizes_list)
-
-        colors = data.get('colors')
-        if colors:
-            colors_list = colors.split(',')
-            data['colors'] = json.dumps(colors_list)
-
-        tags = data.get('tags')
-        if tags:
-            tags_list = tags.split(',')
-            data['tags'] = json.dumps(tags_list)
+        data = split_list_fields(request.data)
 
 
         serializer = ProductSerializer(data=data)
@@ -423,21 +538,7 @@ class ProductAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         
-        data = request.data
-        sizes = data.get('sizes')
-        if sizes:
-            sizes_list = sizes.split(',')
-            data['sizes'] = json.dumps(sizes_list)
-
-        colors = data.get('colors')
-        if colors:
-            colors_list = colors.split(',')
-            data['colors'] = json.dumps(colors_list)
-
-        tags = data.get('tags')
-        if tags:
-            tags_list = tags.split(',')
-            data['tags'] = json.dumps(tags_list)
+        data = split_list_fields(request.data)
 
         serializer = ProductSerializer(product, data=data, partial=True)
         category_id = request.data.get("category")
@@ -523,8 +624,26 @@ class AllProductAPIView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [CustomRenderer]
 
+    @cache_catalog_response('product')
+    @conditional_catalog_response(Product, 'product')
     def get(self, request):
-        products = Product.objects.filter(deleted=False)
+        filter_serializer = ProductFilterSerializer(data=request.query_params)
+        if not filter_serializer.is_valid():
+            return Response(
+                {"errors": filter_serializer.errors, "status_code": status.HTTP_400_BAD_REQUEST},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        products = GetProductSerializer.setup_eager_loading(
+            filter_products(Product.objects.filter(deleted=False), filter_serializer.validated_data)
+        )
+
+        stream_format = get_stream_format(request)
+        if stream_format:
+            return stream_queryset(
+                stream_format, products.order_by('id'), GetProductSerializer,
+                "Products_data", "Products retrieved successfully.",
+            )
 
         serializer = GetProductSerializer(products, many=True)
 
@@ -535,4 +654,413 @@ class AllProductAPIView(APIView):
                 "status_code": status.HTTP_200_OK,
             },
             status=status.HTTP_200_OK
-        )
\ No newline at end of file
+        )
+
+
+class AsyncAllProductAPIView(AsyncAPIView, AllProductAPIView):
+    @cache_catalog_response('product')
+    @conditional_catalog_response(Product, 'product')
+    async def get(self, request):
+        filter_serializer = ProductFilterSerializer(data=request.query_params)
+        if not filter_serializer.is_valid():
+            return Response(
+                {"errors": filter_serializer.errors, "status_code": status.HTTP_400_BAD_REQUEST},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        products = GetProductSerializer.setup_eager_loading(
+            filter_products(Product.objects.filter(deleted=False), filter_serializer.validated_data)
+        )
+
+        stream_format = get_stream_format(request)
+        if stream_format:
+            return stream_queryset(
+                stream_format, products.order_by('id'), GetProductSerializer,
+                "Products_data", "Products retrieved successfully.", asynchronous=True,
+            )
+
+        serializer = GetProductSerializer([product async for product in products], many=True)
+
+        return Response(
+            {
+                "Products_data": serializer.data,
+                "message": "Products retrieved successfully.",
+                "status_code": status.HTTP_200_OK,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class ProductImportAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CustomRenderer]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {
+                    "errors": {
+                        "file": "A CSV or NDJSON file is required.",
+                        "status_code": status.HTTP_400_BAD_REQUEST
+                        }
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        file_format = request.data.get('format') or detect_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            return Response(
+                {
+                    "errors": {
+                        "format": "Format must be csv or ndjson.",
+                        "status_code": status.HTTP_400_BAD_REQUEST
+                        }
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        report = ProductImporter().run(read_rows(upload.file, file_format))
+        file_error = report['file_error']
+        if file_error and not report['created']:
+            return Response(
+                {
+                    "errors": {
+                        "file": f"Could not parse file at row {file_error['row']}: {file_error['error']}",
+                        "status_code": status.HTTP_400_BAD_REQUEST
+                        }
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Rows before a file error are committed, so that is still a 200.
+        return Response(
+            {
+                "import_report": report,
+                "message": "Products imported until a file error." if file_error else "Products imported successfully.",
+                "status_code": status.HTTP_200_OK,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ProductSearchAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CustomRenderer]
+
+    @cache_catalog_response('product')
+    def get(self, request):
+        search_serializer = ProductSearchSerializer(data=request.query_params)
+        if not search_serializer.is_valid():
+            return Response(
+                {"errors": search_serializer.errors, "status_code": status.HTTP_400_BAD_REQUEST},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        params = search_serializer.validated_data
+        products = filter_products(Product.objects.filter(deleted=False), params)
+        products = GetProductSerializer.setup_eager_loading(
+            search_products(products, params['q'])
+        )
+
+        # Results are ordered by rank, which a cursor cannot seek on, so
+        # search always pages by number.
+        paginator = CatalogPagination()
+
+        paginated_products = paginator.paginate_queryset(products, request)
+
+        serializer = GetProductSerializer(paginated_products, many=True)
+
+        return paginator.get_paginated_response(
+            {
+                "Products_data": serializer.data,
+                "message": "Products retrieved successfully.",
+                "status_code": status.HTTP_200_OK,
+            }
+        )
+
+
+class ProductFacetAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CustomRenderer]
+
+    @cache_catalog_response('product')
+    def get(self, request):
+        filters = parse_facet_filters(request.query_params)
+        listed = Product.objects.filter(deleted=False)
+        products = filter_by_facets(listed, filters)
+
+        paginator = get_paginator(request)
+
+        paginated_products = paginator.paginate_queryset(
+            GetProductSerializer.setup_eager_loading(products), request
+        )
+
+        serializer = GetProductSerializer(paginated_products, many=True)
+
+        return paginator.get_paginated_response(
+            {
+                "Products_data": serializer.data,
+                "facets": facet_counts(listed if filters else None, filters),
+                "message": "Products retrieved successfully.",
+                "status_code": status.HTTP_200_OK,
+            }
+        )
+
+
+class CatalogCacheStatsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    renderer_classes = [CustomRenderer]
+
+    def get(self, request):
+        return Response(
+            {
+                "cache_stats": get_stats(),
+                "message": "Catalog cache stats retrieved successfully.",
+                "status_code": status.HTTP_200_OK,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class ProductStockAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    renderer_classes = [CustomRenderer]
+
+    def post(self, request, slug):
+        serializer = StockAdjustmentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"errors": serializer.errors, "status_code": status.HTTP_400_BAD_REQUEST},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        product = Product.objects.filter(slug=slug, deleted=False).only('id', 'quantity').first()
+        if product is None:
+            return Response(
+                {
+                    "errors": {
+                        "product": "Product not found.",
+                        "status_code": status.HTTP_404_NOT_FOUND
+                    }
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        try:
+            quantity = adjust_stock(product, serializer.validated_data['adjustment'])
+        except InsufficientStock:
+            return Response(
+                {
+                    "errors": {
+                        "stock": "Not enough stock to write off.",
+                        "status_code": status.HTTP_400_BAD_REQUEST
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                "product": slug,
+                "quantity": quantity,
+                "message": "Stock adjusted successfully.",
+                "status_code": status.HTTP_200_OK,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+def cart_response(items, message, status_code=status.HTTP_200_OK):
+    lines = carts.hydrate(items)
+    return Response(
+        {
+            "cart_data": {
+                "items": CartLineSerializer(lines, many=True).data,
+                "total_quantity": sum(line.quantity for line in lines),
+                "total_amount": str(sum((line.subtotal for line in lines), Decimal('0.00'))),
+            },
+            "message": message,
+            "status_code": status_code,
+        },
+        status=status_code,
+    )
+
+
+def cart_product_not_found():
+    return Response(
+        {
+            "errors": {
+                "product": "Product not found.",
+                "status_code": status.HTTP_400_BAD_REQUEST
+            }
+        },
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+class CartAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CustomRenderer]
+
+    def get(self, request):
+        return cart_response(carts.get_items(request.user), "Cart retrieved successfully.")
+
+
+class CartItemAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CustomRenderer]
+
+    def post(self, request):
+        serializer = CartItemSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"errors": serializer.errors, "status_code": status.HTTP_400_BAD_REQUEST},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        product = Product.objects.filter(slug=serializer.validated_data['product'], deleted=False).only('id').first()
+        if product is None:
+            return cart_product_not_found()
+
+        items = carts.add_item(request.user, product, serializer.validated_data['quantity'])
+        return cart_response(items, "Product added to cart successfully.", status.HTTP_201_CREATED)
+
+    def put(self, request, slug):
+        serializer = CartQuantitySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"errors": serializer.errors, "status_code": status.HTTP_400_BAD_REQUEST},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        product = Product.objects.filter(slug=slug).only('id').first()
+        items = product and carts.update_item(request.user, product, serializer.validated_data['quantity'])
+        if items is None:
+            return cart_product_not_found()
+        return cart_response(items, "Cart updated successfully.")
+
+    def delete(self, request, slug):
+        product = Product.objects.filter(slug=slug).only('id').first()
+        items = product and carts.remove_item(request.user, product)
+        if items is None:
+            return cart_product_not_found()
+        return cart_response(items, "Product removed from cart successfully.")
+
+
+class CartReservationAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CustomRenderer]
+
+    def post(self, request):
+        items = carts.get_items(request.user)
+        products = list(Product.objects.filter(id__in=list(items), deleted=False, status=True).only('id', 'name', 'quantity'))
+        if not items or len(products) != len(items):
+            return Response(
+                {
+                    "errors": {
+                        "cart": "Cart is empty." if not items else "Some products in the cart are no longer available.",
+                        "status_code": status.HTTP_400_BAD_REQUEST
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            with transaction.atomic():
+                seed_inventory(products)
+                reservations = reserve(request.user, items)
+        except InsufficientStock as exc:
+            short = [product.name for product in products if product.id in exc.product_ids]
+            return Response(
+                {
+                    "errors": {
+                        "stock": f'Not enough stock for {", ".join(short)}.',
+                        "status_code": status.HTTP_400_BAD_REQUEST
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                "reservation_data": {
+                    "expires_at": reservations[0].expires_at,
+                    "items": len(reservations),
+                },
+                "message": "Cart reserved successfully.",
+                "status_code": status.HTTP_200_OK,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class CheckoutAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CustomRenderer]
+
+    def post(self, request):
+        serializer = CheckoutSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"errors": serializer.errors, "status_code": status.HTTP_400_BAD_REQUEST},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        shipping = dict(serializer.validated_data)
+        payment_method = shipping.pop('payment_method')
+        try:
+            order, order_items, payment, shipping = checkout(request.user, payment_method, shipping)
+        except CheckoutError as exc:
+            return Response(
+                {
+                    "errors": {
+                        exc.field: exc.message,
+                        "status_code": status.HTTP_400_BAD_REQUEST
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queue_templated_email('order_confirmation', [request.user.email], {
+            'first_name': request.user.first_name,
+            'order_id': order.order_id,
+            'item_count': order.item_count,
+            'total_amount': str(order.total_amount),
+        })
+
+        return Response(
+            {
+                "order_data": {
+                    **OrderSerializer(order).data,
+                    "items": OrderItemSerializer(order_items, many=True).data,
+                    "payment": PaymentSerializer(payment).data,
+                    "shipping": ShippingSerializer(shipping).data,
+                },
+                "message": "Order placed successfully.",
+                "status_code": status.HTTP_201_CREATED,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class OrderHistoryAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CustomRenderer]
+
+    def get(self, request):
+        orders = Order.objects.filter(user=request.user).only(*OrderSummarySerializer.Meta.fields, 'id')
+
+        paginator = OrderHistoryPagination()
+
+        paginated_orders = paginator.paginate_queryset(orders, request)
+
+        serializer = OrderSummarySerializer(paginated_orders, many=True, context={'request': request})
+
+        return paginator.get_paginated_response(
+            {
+                "orders_data": serializer.data,
+                "message": "Orders retrieved successfully.",
+                "status_code": status.HTTP_200_OK,
+            }
+        )